@@ -1,18 +1,16 @@
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from app.services.llm_service import llm_gateway
+from app.core.config import settings
 
 class FusionAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        self.llm = llm_gateway.model(settings.LLM_MODEL)
 
-    def fuse_information(self, state):
-        """
-        Combines visual and textual insights.
-        """
+    def _build_prompt(self, state):
         vision_data = state.get("vision_insights", "")
         text_data = state.get("text_insights", "")
         
-        prompt = f"""
+        return f"""
         You are a Fusion Agent. specific task is to merge the information from the Visual analysis and Text analysis of a document.
         
         Visual Insights:
@@ -24,9 +22,27 @@ class FusionAgent:
         Provide a consolidated summary of the document, resolving any conflicts if present. 
         Structure your response clearly.
         """
+
+    def fuse_information(self, state):
+        """
+        Combines visual and textual insights.
+        """
+        prompt = self._build_prompt(state)
         
         try:
             response = self.llm.invoke([HumanMessage(content=prompt)])
             return {"fusion_result": response.content}
         except Exception as e:
             return {"fusion_result": f"Error in Fusion Agent: {e}"}
+
+    async def afuse_information(self, state):
+        """
+        Async variant of fuse_information (used by graph.ainvoke).
+        """
+        prompt = self._build_prompt(state)
+        
+        try:
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+            return {"fusion_result": response.content}
+        except Exception as e:
+            return {"fusion_result": f"Error in Fusion Agent: {e}"}
@@ -1,9 +1,25 @@
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+from langchain_core.runnables import RunnableLambda
 from app.agents.state import AgentState
 from app.agents.vision_agent import VisionAgent
 from app.agents.text_agent import TextAgent
 from app.agents.fusion_agent import FusionAgent
 from app.agents.validation_agent import ValidationAgent
+from app.core.telemetry import telemetry
+
+def _traced(name: str, func, afunc) -> RunnableLambda:
+    """
+    Graph node whose sync and async implementations each run inside a timing span.
+    """
+    def run(state: AgentState) -> dict:
+        with telemetry.span(name, pages=len(state.get("images") or [])):
+            return func(state)
+
+    async def arun(state: AgentState) -> dict:
+        with telemetry.span(name, pages=len(state.get("images") or [])):
+            return await afunc(state)
+
+    return RunnableLambda(run, afunc=arun)
 
 def build_graph():
     # Initialize Agents
@@ -16,21 +32,20 @@ def build_graph():
     workflow = StateGraph(AgentState)
     
     # Add Nodes
-    workflow.add_node("vision_node", vision_agent.process_visuals)
-    workflow.add_node("text_node", text_agent.process_text)
-    workflow.add_node("fusion_node", fusion_agent.fuse_information)
-    workflow.add_node("validation_node", validation_agent.validate_result)
+    # Each node has a sync and an async implementation, so both graph.invoke and graph.ainvoke work
+    # (and each is timed as its own span)
+    workflow.add_node("vision_node", _traced("vision_node", vision_agent.process_visuals, vision_agent.aprocess_visuals))
+    workflow.add_node("text_node", _traced("text_node", text_agent.process_text, text_agent.aprocess_text))
+    workflow.add_node("fusion_node", _traced("fusion_node", fusion_agent.fuse_information, fusion_agent.afuse_information))
+    workflow.add_node("validation_node", _traced("validation_node", validation_agent.validate_result, validation_agent.avalidate_result))
     
     # Define Edges
-    # We run Vision and Text in parallel (conceptually in graph, but here sequentially or branched)
-    # LangGraph allows branching.
-    
-    workflow.set_entry_point("vision_node")
-    workflow.add_edge("vision_node", "text_node") # For simplicity of linear execution in this prototype
-    workflow.add_edge("text_node", "fusion_node")
+    # Vision and Text are independent: both branch from the entry point and run concurrently,
+    # then join at Fusion, which only starts once both have written their insights.
+    workflow.add_edge(START, "vision_node")
+    workflow.add_edge(START, "text_node")
+    workflow.add_edge(["vision_node", "text_node"], "fusion_node")
     workflow.add_edge("fusion_node", "validation_node")
     workflow.add_edge("validation_node", END)
     
     return workflow.compile()
-    
-graph = build_graph()
@@ -5,11 +5,13 @@ from PIL import Image
 class AgentState(TypedDict):
     # Inputs
     file_path: str
-    images: List[Any] # PIL Images
+    doc_hash: str # SHA-256 of the uploaded PDF (cache key)
+    images: List[Any] # Lazy page handles (PDFPage, rendered on demand through the document's RasterCache) or PIL Images
     
     # Intermediate Processing
-    detected_layout: List[dict] # From CV Service
+    detected_layout: List[List[dict]] # From CV Service, one list of detections per page
     ocr_text: str # From OCR Service
+    page_texts: List[str] # Per-page text (text layer or OCR); the Text Agent maps over page sections
     
     # Agent Outputs
     vision_insights: str # From Vision Agent
@@ -1,24 +1,168 @@
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from app.services.llm_service import llm_gateway
+from app.services.cache_service import analysis_cache
 from app.core.config import settings
+from app.core.telemetry import telemetry
+from app.rag.chunking import group_pages
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import asyncio
+import hashlib
+
+SYSTEM_PROMPT = "You are an expert document analyst. Summarize the following text and extract key entities."
+MAP_PROMPT = (
+    "You are an expert document analyst. The following text is one section of a longer document. "
+    "Summarize it and list its key entities, figures and numbers. Do not add an introduction."
+)
+REDUCE_PROMPT = (
+    "You are an expert document analyst. The following are summaries of consecutive sections of one document. "
+    "Combine them into a single summary of the whole document and extract its key entities."
+)
+
 
 class TextAgent:
+    """
+    Short documents are summarized in one call. Longer ones are map-reduced: sections of whole pages
+    are summarized concurrently (TEXT_MAP_CONCURRENCY), then combined into text_insights.
+    Section summaries are cached by content hash, so re-analyzing a revised document only
+    re-summarizes the sections that changed.
+    """
     def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        self.llm = llm_gateway.model(settings.LLM_MODEL)
+
+    def _build_messages(self, state):
+        text = state.get("ocr_text", "")
+        if not text:
+            return None
+
+        system_prompt = SYSTEM_PROMPT
+        user_message = HumanMessage(content=text[:100000]) # Increased context limit for full papers
+        return [SystemMessage(content=system_prompt), user_message]
+
+    def _sections(self, state) -> list[tuple[str, int, int]] | None:
+        """
+        Sections to map over, or None when the document fits a single call.
+        """
+        text = state.get("ocr_text", "")
+        if not settings.TEXT_MAP_REDUCE or len(text) <= settings.TEXT_SINGLE_PASS_CHARS:
+            return None
+        page_texts = state.get("page_texts") or [text]
+        sections = group_pages(page_texts, settings.TEXT_SECTION_CHARS)
+        return sections if len(sections) > 1 else None
+
+    def _cache_key(self, prompt: str, text: str) -> str:
+        # Content address of one summarization call (same model, prompt and text -> same summary)
+        digest = hashlib.sha256(f"{settings.LLM_MODEL}\n{prompt}\n{text}".encode("utf-8")).hexdigest()
+        return analysis_cache.document_key(digest, "text_summary")
+
+    def _reduce_groups(self, summaries: list[str]) -> list[list[str]]:
+        # Summaries packed into reduce inputs of at most TEXT_REDUCE_MAX_CHARS; at least two per group,
+        # so every level at least halves the count and the reduce terminates
+        groups, size = [[]], 0
+        for summary in summaries:
+            if len(groups[-1]) >= 2 and size + len(summary) > settings.TEXT_REDUCE_MAX_CHARS:
+                groups.append([])
+                size = 0
+            groups[-1].append(summary)
+            size += len(summary)
+        return groups
+
+    @staticmethod
+    def _merge_level(groups: list[list[str]], reduced: list[str]) -> list[str]:
+        # Summaries for the next level, in order: a group left with one summary moves up unchanged
+        # instead of costing a reduce call of its own
+        reduced = iter(reduced)
+        return [group[0] if len(group) == 1 else next(reduced) for group in groups]
+
+    @staticmethod
+    def _label(summary: str, first: int, last: int) -> str:
+        pages = f"Page {first}" if first == last else f"Pages {first}-{last}"
+        return f"[{pages}]\n{summary}"
+
+    def _summarize(self, prompt: str, text: str, span: str) -> str:
+        key = self._cache_key(prompt, text)
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            return cached
+        with telemetry.span(span, bytes=len(text), items=1):
+            content = self.llm.invoke([SystemMessage(content=prompt), HumanMessage(content=text)]).content
+        analysis_cache.set(key, content)
+        return content
+
+    async def _asummarize(self, prompt: str, text: str, span: str, semaphore: asyncio.Semaphore) -> str:
+        key = self._cache_key(prompt, text)
+        cached = await asyncio.to_thread(analysis_cache.get, key)
+        if cached is not None:
+            return cached
+        async with semaphore:
+            with telemetry.span(span, bytes=len(text), items=1):
+                response = await self.llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content=text)])
+        await asyncio.to_thread(analysis_cache.set, key, response.content)
+        return response.content
+
+    def _map_reduce(self, sections: list[tuple[str, int, int]]) -> str:
+        def run_all(prompt: str, texts: list[str], span: str) -> list[str]:
+            # Each call runs in a copy of the caller's context so its span keeps the trace attributes
+            contexts = [copy_context() for _ in texts]
+            with ThreadPoolExecutor(max_workers=max(1, min(settings.TEXT_MAP_CONCURRENCY, len(texts)))) as executor:
+                return list(executor.map(
+                    lambda context, text: context.run(self._summarize, prompt, text, span), contexts, texts
+                ))
+
+        summaries = run_all(MAP_PROMPT, [text for text, _, _ in sections], "text_map")
+        summaries = [self._label(s, first, last) for s, (_, first, last) in zip(summaries, sections)]
+        # Reduce level by level until one summary is left
+        while len(summaries) > 1:
+            groups = self._reduce_groups(summaries)
+            reduced = run_all(REDUCE_PROMPT, ["\n\n".join(group) for group in groups if len(group) > 1], "text_reduce")
+            summaries = self._merge_level(groups, reduced)
+        return summaries[0]
+
+    async def _amap_reduce(self, sections: list[tuple[str, int, int]]) -> str:
+        semaphore = asyncio.Semaphore(max(1, settings.TEXT_MAP_CONCURRENCY))
+        summaries = await asyncio.gather(*(
+            self._asummarize(MAP_PROMPT, text, "text_map", semaphore) for text, _, _ in sections
+        ))
+        summaries = [self._label(s, first, last) for s, (_, first, last) in zip(summaries, sections)]
+        while len(summaries) > 1:
+            groups = self._reduce_groups(summaries)
+            reduced = await asyncio.gather(*(
+                self._asummarize(REDUCE_PROMPT, "\n\n".join(group), "text_reduce", semaphore)
+                for group in groups if len(group) > 1
+            ))
+            summaries = self._merge_level(groups, reduced)
+        return summaries[0]
 
     def process_text(self, state):
         """
         Analyzes the OCR text to extract key information and summary.
         """
-        text = state.get("ocr_text", "")
-        if not text:
+        messages = self._build_messages(state)
+        if messages is None:
             return {"text_insights": "No text extracted."}
 
-        system_prompt = "You are an expert document analyst. Summarize the following text and extract key entities."
-        user_message = HumanMessage(content=text[:100000]) # Increased context limit for full papers
+        try:
+            sections = self._sections(state)
+            if sections is not None:
+                return {"text_insights": self._map_reduce(sections)}
+            response = self.llm.invoke(messages)
+            return {"text_insights": response.content}
+        except Exception as e:
+            return {"text_insights": f"Error in Text Agent: {e}"}
+
+    async def aprocess_text(self, state):
+        """
+        Async variant of process_text (used by graph.ainvoke).
+        """
+        messages = self._build_messages(state)
+        if messages is None:
+            return {"text_insights": "No text extracted."}
 
         try:
-            response = self.llm.invoke([SystemMessage(content=system_prompt), user_message])
+            sections = self._sections(state)
+            if sections is not None:
+                return {"text_insights": await self._amap_reduce(sections)}
+            response = await self.llm.ainvoke(messages)
             return {"text_insights": response.content}
         except Exception as e:
             return {"text_insights": f"Error in Text Agent: {e}"}
@@ -1,20 +1,21 @@
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from app.services.llm_service import llm_gateway
+from app.core.config import settings
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class ValidationAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        self.llm = llm_gateway.model(settings.LLM_MODEL)
 
-    def validate_result(self, state):
-        """
-        Validates the fusion result and assigns a confidence score.
-        """
+    def _build_prompt(self, state):
         fusion_result = state.get("fusion_result", "")
         vision_data = state.get("vision_insights", "")
         text_data = state.get("text_insights", "")
         
-        prompt = f"""
+        return f"""
         You are a Validation Agent. Your job is to assess the quality and coherence of the document analysis.
         
         Fusion Result: {fusion_result[:1000]}...
@@ -26,30 +27,55 @@ class ValidationAgent:
         2. Provide a brief explanation for the score.
         3. Return ONLY a JSON object with keys: "confidence_score" (float) and "validation_notes" (string).
         """
+
+    def _parse_response(self, state, content):
+        fusion_result = state.get("fusion_result", "")
+        content = content.strip()
+        # Basic cleanup if markdown backticks are used
+        if content.startswith("```json"):
+            content = content[7:-3]
+        elif content.startswith("```"):
+            content = content[3:-3]
+            
+        data = json.loads(content)
+        return {
+            "jit_confidence_score": data.get("confidence_score", 0.5),
+            "validation_notes": data.get("validation_notes", "No notes provided."),
+            "final_output": {
+                "summary": fusion_result,
+                "confidence": data.get("confidence_score", 0.5),
+                "notes": data.get("validation_notes", "")
+            }
+        }
+
+    def _error_result(self, e):
+        logger.error("Validation Agent Error: %s", e)
+        return {
+            "jit_confidence_score": 0.0, 
+            "validation_notes": f"Validation Error: {e}",
+             "final_output": {"error": str(e)}
+        }
+
+    def validate_result(self, state):
+        """
+        Validates the fusion result and assigns a confidence score.
+        """
+        prompt = self._build_prompt(state)
         
         try:
             response = self.llm.invoke([HumanMessage(content=prompt)])
-            content = response.content.strip()
-            # Basic cleanup if markdown backticks are used
-            if content.startswith("```json"):
-                content = content[7:-3]
-            elif content.startswith("```"):
-                content = content[3:-3]
-                
-            data = json.loads(content)
-            return {
-                "jit_confidence_score": data.get("confidence_score", 0.5),
-                "validation_notes": data.get("validation_notes", "No notes provided."),
-                "final_output": {
-                    "summary": fusion_result,
-                    "confidence": data.get("confidence_score", 0.5),
-                    "notes": data.get("validation_notes", "")
-                }
-            }
+            return self._parse_response(state, response.content)
         except Exception as e:
-            print(f"Validation Agent Error: {e}")
-            return {
-                "jit_confidence_score": 0.0, 
-                "validation_notes": f"Validation Error: {e}",
-                 "final_output": {"error": str(e)}
-            }
+            return self._error_result(e)
+
+    async def avalidate_result(self, state):
+        """
+        Async variant of validate_result (used by graph.ainvoke).
+        """
+        prompt = self._build_prompt(state)
+        
+        try:
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+            return self._parse_response(state, response.content)
+        except Exception as e:
+            return self._error_result(e)
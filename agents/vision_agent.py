@@ -1,42 +1,182 @@
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from app.services.llm_service import llm_gateway
 from app.core.config import settings
+from app.services.cache_service import analysis_cache
+from collections import OrderedDict
+from PIL import Image
+import asyncio
 import base64
+import hashlib
 import io
+import math
+import threading
+import numpy as np
+
+VISION_PROMPT = "Analyze these document images. Describe any tables, charts, or diagrams you see in detail. Ignore standard text if possible, focus on visual elements and layout structure."
+
 
 class VisionAgent:
     def __init__(self):
         # We prefer a model with vision capabilities.
         # Ensure OPENAI_API_KEY is set in environment.
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        self.llm = llm_gateway.model(settings.LLM_MODEL)
+        # Encoded crops keyed by (page hash, region, encoding params); small LRU shared by all requests
+        self._encoded = OrderedDict()
+        self._encoded_lock = threading.Lock()
 
-    def image_to_base64(self, image):
+    def image_to_base64(self, image, quality: int = 95):
         buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
+        image.save(buffered, format="JPEG", quality=quality)
         return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
+    def _page_array(self, page, dpi: int) -> np.ndarray:
+        # Lazy PDF pages render on demand (cached, since several regions may share a page); plain images are used as-is
+        if hasattr(page, "render"):
+            return page.render(dpi=dpi, cache=True)
+        return np.asarray(page.convert("RGB"))
+
+    def _page_hash(self, state, index: int, page) -> str:
+        doc_hash = state.get("doc_hash")
+        if doc_hash:
+            return f"{doc_hash}:{index}"
+        return hashlib.sha256(self._page_array(page, settings.RENDER_DPI).tobytes()).hexdigest()
+
+    def select_regions(self, state) -> list[tuple[int, list[float] | None, str]]:
+        """
+        Picks what is worth sending: the table/figure regions found by the CV Service, page by page.
+        Returns (page index, bbox in RENDER_DPI pixels or None for the whole page, label) tuples.
+        Falls back to the first page when no page has a visual element.
+        """
+        layout = state.get("detected_layout") or []
+        wanted = set(settings.VISION_REGION_TYPES)
+        regions = []
+        for index, page_layout in enumerate(layout):
+            for element in page_layout or []:
+                if element["type"] in wanted and element["confidence"] >= settings.VISION_MIN_CONFIDENCE:
+                    regions.append((index, element["bbox"], element["type"]))
+        if not regions:
+            return [(0, None, "page")]
+        # Largest regions first, so the budget keeps the most informative crops
+        regions.sort(key=lambda r: -(r[1][2] - r[1][0]) * (r[1][3] - r[1][1]))
+        regions = regions[:settings.VISION_MAX_IMAGES]
+        return sorted(regions, key=lambda r: (r[0], r[1][1]))
+
+    def _encode_region(self, state, index: int, page, bbox) -> str:
+        """
+        Crop a page to a detected region, downscale it under VISION_MAX_PIXELS and JPEG/base64 encode it.
+        """
+        key = (self._page_hash(state, index, page), tuple(round(v, 1) for v in bbox) if bbox else None,
+               settings.VISION_DPI, settings.VISION_MAX_PIXELS, settings.VISION_JPEG_QUALITY)
+        with self._encoded_lock:
+            if key in self._encoded:
+                self._encoded.move_to_end(key)
+                return self._encoded[key]
+
+        image = Image.fromarray(self._page_array(page, settings.VISION_DPI))
+        if bbox is not None:
+            # Layout boxes are in RENDER_DPI pixels; pad a little so captions/axes are kept
+            scale = settings.VISION_DPI / settings.RENDER_DPI
+            x1, y1, x2, y2 = bbox
+            pad = 0.03 * max(x2 - x1, y2 - y1)
+            image = image.crop((
+                max(0, int((x1 - pad) * scale)),
+                max(0, int((y1 - pad) * scale)),
+                min(image.width, int(math.ceil((x2 + pad) * scale))),
+                min(image.height, int(math.ceil((y2 + pad) * scale)))
+            ))
+
+        pixels = image.width * image.height
+        if pixels > settings.VISION_MAX_PIXELS:
+            factor = math.sqrt(settings.VISION_MAX_PIXELS / pixels)
+            image = image.resize((max(1, int(image.width * factor)), max(1, int(image.height * factor))), Image.LANCZOS)
+
+        encoded = self.image_to_base64(image, quality=settings.VISION_JPEG_QUALITY)
+        with self._encoded_lock:
+            self._encoded[key] = encoded
+            while len(self._encoded) > settings.VISION_ENCODE_CACHE_SIZE:
+                self._encoded.popitem(last=False)
+        return encoded
+
+    def _selection_key(self, regions) -> str:
+        # Identifies exactly what is sent (regions and encoding budget), for the analysis cache
+        signature = repr((regions, settings.VISION_DPI, settings.VISION_MAX_PIXELS, settings.VISION_JPEG_QUALITY))
+        return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:16]
+
+    def _build_requests(self, state, regions):
+        """
+        Encodes the selected regions and packs them into as few multimodal messages as
+        VISION_MAX_IMAGES_PER_REQUEST and VISION_MAX_PAYLOAD_BYTES allow.
+        """
+        images = state.get("images", [])
+        requests = []
+        parts, captions, size = [], [], 0
+
+        def flush():
+            if parts:
+                caption = "; ".join(f"Image {i + 1}: {c}" for i, c in enumerate(captions))
+                content = [{"type": "text", "text": f"{VISION_PROMPT}\n{caption}"}] + parts
+                requests.append(HumanMessage(content=content))
+            parts.clear()
+            captions.clear()
+
+        for index, bbox, label in regions:
+            if index >= len(images):
+                continue
+            encoded = self._encode_region(state, index, images[index], bbox)
+            if parts and (len(parts) >= settings.VISION_MAX_IMAGES_PER_REQUEST
+                          or size + len(encoded) > settings.VISION_MAX_PAYLOAD_BYTES):
+                flush()
+                size = 0
+            parts.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded}"}})
+            region = "" if bbox is None else f" at [{', '.join(str(int(v)) for v in bbox)}]"
+            captions.append(f"page {index + 1} {label}{region}")
+            size += len(encoded)
+        flush()
+        return requests
+
     def process_visuals(self, state):
         """
         Analyzes the images to extract insights about tables, charts, and layout.
         """
-        images = state.get("images", [])
-        if not images:
+        if not state.get("images"):
             return {"vision_insights": "No images provided."}
 
-        # For efficiency, we might only process the first page or specific crops in a real system.
-        # Here we process the first page as a sample.
-        first_page = images[0]
-        img_b64 = self.image_to_base64(first_page)
+        # Insights for a given document and region selection are reused across re-uploads
+        doc_hash = state.get("doc_hash")
+        regions = self.select_regions(state)
+        selection = self._selection_key(regions)
+        cached = analysis_cache.get_page(doc_hash, selection, "vision")
+        if cached is not None:
+            return {"vision_insights": cached}
+
+        try:
+            requests = self._build_requests(state, regions)
+            insights = "\n\n".join(self.llm.invoke([message]).content for message in requests)
+            analysis_cache.set_page(doc_hash, selection, "vision", insights)
+            return {"vision_insights": insights}
+        except Exception as e:
+            return {"vision_insights": f"Error in Vision Agent: {e}"}
+
+    async def aprocess_visuals(self, state):
+        """
+        Async variant of process_visuals (used by graph.ainvoke). Packed requests are sent concurrently.
+        """
+        if not state.get("images"):
+            return {"vision_insights": "No images provided."}
 
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": "Analyze this document image. Describe any tables, charts, or diagrams you see in detail. Ignore standard text if possible, focus on visual elements and layout structure."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}}
-            ]
-        )
+        doc_hash = state.get("doc_hash")
+        regions = self.select_regions(state)
+        selection = self._selection_key(regions)
+        cached = await asyncio.to_thread(analysis_cache.get_page, doc_hash, selection, "vision")
+        if cached is not None:
+            return {"vision_insights": cached}
 
         try:
-            response = self.llm.invoke([message])
-            return {"vision_insights": response.content}
+            # Rendering and JPEG encoding are CPU work; keep them off the event loop
+            requests = await asyncio.to_thread(self._build_requests, state, regions)
+            responses = await asyncio.gather(*(self.llm.ainvoke([message]) for message in requests))
+            insights = "\n\n".join(response.content for response in responses)
+            await asyncio.to_thread(analysis_cache.set_page, doc_hash, selection, "vision", insights)
+            return {"vision_insights": insights}
         except Exception as e:
             return {"vision_insights": f"Error in Vision Agent: {e}"}
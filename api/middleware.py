@@ -0,0 +1,25 @@
+from fastapi.responses import JSONResponse
+from app.services.upload_service import MULTIPART_OVERHEAD
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Answers 413 to POSTs whose Content-Length is over the limit of their route, before the body is received.
+    `limits` maps a path to its byte limit for the files; the multipart framing is allowed on top.
+    Bodies without a Content-Length (chunked) are cut off by the upload receivers as they stream in.
+    """
+    def __init__(self, app, limits: dict[str, tuple[str, int]]):
+        self.app = app
+        self.limits = limits # path -> (setting name for the error, bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.limits:
+            name, max_bytes = self.limits[scope["path"]]
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+                response = JSONResponse(
+                    status_code=413, content={"detail": f"Upload exceeds {name} ({max_bytes} bytes)"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,163 +1,318 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.ingestion_service import IngestionService
-from app.services.cv_service import CVService
-from app.services.ocr_service import OCRService
-from app.rag.embedding import EmbeddingService
-from app.rag.vector_store import VectorStore
-from app.agents.graph import graph
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from langchain_core.messages import HumanMessage, SystemMessage
+from app.services.batch_service import BatchUpload, run_batch
+from app.services.job_service import JobManager, JobQueueFull
+from app.services.ocr_service import OCR_BACKENDS
+from app.services.llm_service import llm_gateway
+from app.services.registry import registry
+from app.services.upload_service import UploadTooLarge, receive_pdf
+from app.rag.context import ContextBuilder
+from app.rag.filters import SearchFilter
+from app.core.config import settings
+from app.core.telemetry import profile, telemetry
+from typing import Optional
+import asyncio
+import json
+import logging
 import shutil
 import os
+import uuid
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize services GLOBALLY so they persist in memory
-# This is crucial for QdrantClient(":memory:") to work across requests
-ingestion_service = IngestionService()
-cv_service = CVService() 
-ocr_service = OCRService()
-embed_service = EmbeddingService()
-vector_store = VectorStore()
+# Services live in the process-wide registry so they persist across requests
+# (crucial for QdrantClient(":memory:")). They are built on first use or by the startup warm-up,
+# so a worker that only serves /query never loads the layout or OCR models.
+
+async def _run_analysis(job, payload) -> dict:
+    pipeline = await registry.aget("pipeline")
+    if job.kind == "batch":
+        return await run_batch(pipeline, job, payload)
+    try:
+        return await pipeline.run(job, path=payload.path, doc_hash=payload.doc_hash)
+    finally:
+        payload.cleanup()
+
+# Bounded background queue: /analyze returns a job ID right away and workers run the pipeline
+job_manager = JobManager(
+    _run_analysis,
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_QUEUE_SIZE,
+    history=settings.JOB_HISTORY
+)
+telemetry.register_gauge("jobs_queued", "Analysis jobs waiting for a worker.", lambda: {(): job_manager.pending()})
+telemetry.register_gauge(
+    "jobs", "Tracked analysis jobs by status.",
+    lambda: {(("status", status),): count for status, count in job_manager.status_counts().items()}
+)
 
-@router.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)):
+def _analysis_options(ocr_backend: Optional[str]) -> dict:
+    if ocr_backend is None:
+        return {}
+    if ocr_backend not in OCR_BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown OCR backend. Expected one of: {', '.join(OCR_BACKENDS)}")
+    return {"ocr_backend": ocr_backend}
+
+def _file_form(field: str, multiple: bool) -> dict:
+    # The upload routes read the body themselves (streamed to disk), so describe it for the OpenAPI docs
+    schema = {"type": "string", "format": "binary"}
+    if multiple:
+        schema = {"type": "array", "items": schema}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [field], "properties": {field: schema}
+    }}}}}
+
+@router.post("/analyze", status_code=202, openapi_extra=_file_form("file", multiple=False))
+async def analyze_document(
+    request: Request,
+    profile: bool = False,
+    ocr_backend: Optional[str] = None
+):
     """
-    Upload a PDF document and get a multi-modal analysis.
+    Upload a PDF document (multipart field `file`) for multi-modal analysis.
+    The analysis runs in the background; poll the returned status URL for progress and the result.
+    `profile=true` samples stacks while the job runs (requires PROFILING_ENABLED).
+    `ocr_backend` (easyocr or tesseract) overrides OCR_BACKEND for scanned pages of this upload.
+    Uploads over UPLOAD_MAX_BYTES are rejected with 413.
     """
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+    options = _analysis_options(ocr_backend)
+
+    # The body is streamed to disk as it arrives (hashed on the way), never buffered or copied twice
+    try:
+        upload = await receive_pdf(request.headers.get("content-type", ""), request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit(upload, upload.filename, profile=profile, options=options)
+    except JobQueueFull as e:
+        upload.cleanup()
+        # Explicit backpressure instead of a request timeout
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
     
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": str(request.url_for("get_job", job_id=job.id)),
+        "result_url": str(request.url_for("get_job_result", job_id=job.id))
+    }
+
+@router.post("/analyze/batch", status_code=202, openapi_extra=_file_form("files", multiple=True))
+async def analyze_batch(
+    request: Request,
+    profile: bool = False,
+    ocr_backend: Optional[str] = None
+):
+    """
+    Upload many PDFs (and/or zip archives of PDFs) for analysis as one background job.
+    Documents flow through parse -> layout/OCR -> agents -> embed -> upsert stages connected by
+    bounded queues, so different documents occupy different stages at once. A failing document is
+    reported in the result and does not abort the batch.
+    """
+    options = _analysis_options(ocr_backend)
     try:
-        # Read file
-        contents = await file.read()
-        
-        # 1. Ingestion
-        images = ingestion_service.convert_pdf_to_images(contents)
-        if not images:
-             raise HTTPException(status_code=400, detail="Could not process PDF.")
-             
-        # Limit to first page for prototype speed
-        focus_image = images[0]
-        
-        # 2. CV Analysis
-        layout = cv_service.analyze_layout(focus_image)
-        
-        # 3. OCR Analysis
-        # Try direct PDF extraction first (Digital PDF)
-        pdf_text = ingestion_service.extract_text_from_pdf(contents)
-        
-        if len(pdf_text) > 100:
-            ocr_text = pdf_text
-            print("DEBUG: Using digital PDF text extraction (Hybrid Mode).")
-        else:
-            # Fallback to OCR (Scanned PDF) - Process ALL pages
-            print("DEBUG: Digital extraction failed. Running OCR on ALL pages...")
-            ocr_chunks = []
-            for i, img in enumerate(images):
-                print(f"DEBUG: OCR Processing page {i+1}/{len(images)}")
-                page_text = ocr_service.extract_text(img)
-                ocr_chunks.append(page_text)
-            ocr_text = "\n\n".join(ocr_chunks)
-        
-        # 4. Agentic Workflow
-        initial_state = {
-            "file_path": file.filename,
-            "images": images, # Agents can now access all images
-            "detected_layout": layout, # Layout still from first page for quick visual summary
-            "ocr_text": ocr_text,
-            "vision_insights": "",
-            "text_insights": "",
-            "fusion_result": "",
-            "jit_confidence_score": 0.0,
-            "validation_notes": "",
-            "final_output": {}
-        }
-        
-        # Fix: Ensure images are passed as list even if one
-        if not isinstance(images, list): images = [images]
-        result = graph.invoke(initial_state)
-        
-        # 5. RAG Indexing
-        # Index the SUMMARY
-        final_summary = result.get("final_output", {}).get("summary", "")
-        if final_summary:
-            print(f"DEBUG: Indexing summary of length {len(final_summary)}")
-            embedding = embed_service.get_embedding(final_summary)
-            vector_store.add_document(
-                text=final_summary,
-                metadata={"filename": file.filename, "type": "summary"},
-                embedding=embedding
-            )
-
-        # Index the RAW OCR TEXT (Chunking would be better for production, but this solves the immediate missing detail issue)
-        raw_text = initial_state.get("ocr_text", "")
-        if raw_text:
-            print(f"DEBUG: Indexing raw text of length {len(raw_text)}")
-            # Split roughly if too large (naive chunking for prototype)
-            chunk_size = 4000
-            for i in range(0, len(raw_text), chunk_size):
-                chunk = raw_text[i:i+chunk_size]
-                embedding = embed_service.get_embedding(chunk)
-                vector_store.add_document(
-                    text=chunk,
-                    metadata={"filename": file.filename, "type": "raw_text", "chunk_index": i},
-                    embedding=embedding
-                )
-            print("DEBUG: Raw text indexed successfully.")
-            
-        return result["final_output"]
+        # Streamed to disk as it arrives; documents are read one at a time by the parse stage
+        upload = await BatchUpload.receive(request.headers.get("content-type", ""), request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not any(entry.error is None for entry in upload.entries):
+        upload.cleanup()
+        detail = "; ".join(f"{entry.filename}: {entry.error}" for entry in upload.entries) or "No PDF files found in the upload."
+        raise HTTPException(status_code=400, detail=detail)
+
+    try:
+        job = job_manager.submit(
+            upload, f"{len(upload.entries)} document(s)", kind="batch", profile=profile, options=options
+        )
+    except JobQueueFull as e:
+        upload.cleanup()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(settings.JOB_RETRY_AFTER_SECONDS)})
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "documents": len(upload.entries),
+        "status_url": str(request.url_for("get_job", job_id=job.id)),
+        "result_url": str(request.url_for("get_job_result", job_id=job.id))
+    }
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Status of an analysis job, with per-stage and per-page progress (and the result once completed).
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict(include_result=job.status == "completed")
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """
+    The analysis result (same shape the synchronous /analyze used to return).
+    Returns 202 with the job status while it is still queued or running.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "completed":
+        return JSONResponse(status_code=202, content=job.to_dict())
+    return job.result
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the document."
+
+def _search_filter(query_request: dict):
+    try:
+        return SearchFilter.from_dict(query_request.get("filters"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _retrieve(query_text: str, search_filter: SearchFilter = None):
+    logger.debug("Querying for %r%s", query_text, " (filtered)" if search_filter is not None else "")
+    # Blocking calls run off the event loop, which is shared with the analysis job workers
+    # 1. Embed query
+    embed_service = await registry.aget("embedding")
+    retriever = await registry.aget("retriever")
+    with telemetry.span("retrieval", bytes=len(query_text), filtered=search_filter is not None) as span:
+        query_vec = await asyncio.to_thread(embed_service.get_embedding, query_text)
         
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        # 2. Search (hybrid: BM25 + vector, merged with reciprocal rank fusion)
+        # Filters apply to both retrievers, so only in-scope chunks reach the answer prompt
+        results = await asyncio.to_thread(
+            retriever.search, query_text, query_vec, limit=settings.QUERY_TOP_K, search_filter=search_filter
+        )
+        span.set(items=len(results))
+    logger.debug("Found %d results", len(results))
+    return results
+
+context_builder = ContextBuilder()
+
+async def _context(query_text: str, results):
+    # Deduplicated, reranked sentence windows under CONTEXT_MAX_TOKENS, labelled [n] for citations
+    with telemetry.span("context", items=len(results)) as span:
+        context = await asyncio.to_thread(context_builder.build, query_text, results)
+        span.set(passages=len(context.citations), tokens=context.tokens)
+    return context
+
+def _answer_messages(query_text: str, context) -> list:
+    # Create prompt
+    system_prompt = (
+        "You are a helpful assistant. Answer the user's question based ONLY on the provided context. "
+        "Be concise and direct. Cite the passages you use by their [n] labels."
+    )
+    user_message = f"Context:\n{context.text}\n\nQuestion: {query_text}"
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_message)]
+
+def _profile_query(enabled: bool):
+    return profile(f"query-{uuid.uuid4().hex}", enabled=enabled)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @router.post("/query")
-async def query_document(query_request: dict):
+async def query_document(query_request: dict, profile: bool = False):
     """
     Query the indexed documents.
-    Payload: {"query": "string"}
+    Payload: {"query": "string", "filters": {...}} (filters optional: filename, type,
+    page_from/page_to, ingested_after/ingested_before as epoch seconds or ISO 8601)
+    `profile=true` samples stacks while the query runs (requires PROFILING_ENABLED).
+    The answer cites passages as [n]; "citations" maps each n to its filename, chunk_index and page.
     """
     query_text = query_request.get("query")
     if not query_text:
         raise HTTPException(status_code=400, detail="Query text required")
+    search_filter = _search_filter(query_request)
         
     try:
-        print(f"DEBUG: Querying for '{query_text}'")
-        # 1. Embed query
-        query_vec = embed_service.get_embedding(query_text)
-        
-        # 2. Search
-        # Increase limit to capture more context (e.g. author lists spanning multiple lines)
-        results = vector_store.search(query_vec, limit=10)
-        print(f"DEBUG: Found {len(results)} results")
-        
-        # 3. Generate Answer using LLM
-        from langchain_openai import ChatOpenAI
-        from langchain_core.messages import HumanMessage, SystemMessage
-
-        if not results:
-             return {"results": [{"text": "I couldn't find any relevant information in the document.", "score": 0.0}]}
+        with _profile_query(profile) as profile_path:
+            results = await _retrieve(query_text, search_filter)
+            context = await _context(query_text, results)
+            
+            # 3. Generate Answer using LLM
+            if not context:
+                 return {"results": [{"text": NO_RESULTS_ANSWER, "score": 0.0}], "citations": []}
 
-        # Combine context from top results
-        context_text = "\n\n".join([res.payload.get("text", "") for res in results])
-        
-        # Initialize LLM (lightweight instantiation)
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-        
-        # Create prompt
-        system_prompt = "You are a helpful assistant. Answer the user's question based ONLY on the provided context. Be concise and direct."
-        user_message = f"Context:\n{context_text}\n\nQuestion: {query_text}"
-        
-        response = llm.invoke([SystemMessage(content=system_prompt), HumanMessage(content=user_message)])
+            # Shared gateway: pooled client, concurrency caps and rate-limit-aware retries
+            with telemetry.span("answer", items=len(context.citations), tokens=context.tokens):
+                response = await llm_gateway.ainvoke(_answer_messages(query_text, context))
         
-        # Return generated answer
-        return {"results": [{"text": response.content, "score": 1.0}]}
+        # Return generated answer with the passages it was given
+        answer = {"results": [{"text": response.content, "score": 1.0}], "citations": context.citations}
+        if profile_path:
+            answer["profile"] = profile_path
+        return answer
         
     except Exception as e:
-        import traceback
-        traceback.print_exc() # <--- This will print the error to the terminal
+        logger.exception("Query failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/stream")
+async def query_document_stream(query_request: dict):
+    """
+    Streaming variant of /query over server-sent events.
+    Emits one `sources` event with the citations of the context passages ([n] labels), then
+    `token` events as the answer is generated, then `done` (or `error`).
+    Payload: same as /query, including optional "filters"
+    """
+    query_text = query_request.get("query")
+    if not query_text:
+        raise HTTPException(status_code=400, detail="Query text required")
+    search_filter = _search_filter(query_request)
+
+    async def events():
+        try:
+            results = await _retrieve(query_text, search_filter)
+            context = await _context(query_text, results)
+            yield _sse("sources", context.citations)
+            if not context:
+                yield _sse("token", {"text": NO_RESULTS_ANSWER})
+            else:
+                with telemetry.span("answer", items=len(context.citations), tokens=context.tokens):
+                    async for token in llm_gateway.astream(_answer_messages(query_text, context)):
+                        yield _sse("token", {"text": token})
+            yield _sse("done", {})
+        except Exception as e:
+            logger.exception("Streaming query failed")
+            yield _sse("error", {"detail": str(e)})
+
+    # No proxy buffering, so the first bytes reach the client immediately
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Stage latency histograms and counters in the Prometheus text format.
+    """
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
 @router.get("/health")
 def health_check():
+    """
+    Liveness: the process is up and serving requests (models may still be loading).
+    """
     return {"status": "ok"}
+
+@router.get("/ready")
+def readiness_check():
+    """
+    Readiness: 200 once every service in WARMUP_SERVICES has loaded, 503 while loading or after a failure.
+    Reports the load state of every service, including those that load lazily on first use.
+    """
+    ready = registry.ready(settings.WARMUP_SERVICES)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "services": registry.status()}
+    )
@@ -0,0 +1,341 @@
+"""
+Offline end-to-end benchmark of the analysis pipeline.
+
+Generates synthetic digital and scanned PDFs, runs them through every stage with local stand-ins
+for the LLM (LLM_BACKEND=stub) and embedding provider (EMBEDDING_BACKEND=local), and writes
+per-stage latency percentiles, pages/sec and peak memory to a JSON file for comparison across commits.
+
+Run from the directory that contains the `app` package:
+    python -m app.benchmarks.pipeline_benchmark --pages 10 50 --runs 3
+    python -m app.benchmarks.pipeline_benchmark --skip cv ocr   # without YOLO/easyocr weights
+    python -m app.benchmarks.pipeline_benchmark --kinds scanned --ocr-backend tesseract
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+# Local providers and a throwaway index; must be set before app settings are imported
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("QDRANT_MODE", "memory")
+os.environ.setdefault("CACHE_ENABLED", "false")
+
+import fitz  # PyMuPDF
+
+from app.core.config import settings
+
+STAGES = ["open", "render", "text_layer", "layout", "ocr", "agents", "embed", "upsert", "search", "end_to_end"]
+
+_WORDS = (
+    "revenue growth quarter margin forecast operating segment customer retention analysis table figure "
+    "increase decrease annual report market share cost capital investment region product strategy risk"
+).split()
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_digital_pdf(pages: int, seed: int = 0) -> bytes:
+    """
+    Text-layer PDF: a title, body paragraphs and a simple ruled table on every page.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=595, height=842) # A4 in points
+        page.insert_text((56, 64), f"Section {number + 1}: Quarterly Results", fontsize=16)
+        body = "\n\n".join(_paragraph(rng, 60) for _ in range(4))
+        page.insert_textbox(fitz.Rect(56, 90, 539, 520), body, fontsize=10)
+        # 4x5 table
+        top, left, cell_w, cell_h = 540, 56, 96, 24
+        for row in range(5):
+            for col in range(4):
+                rect = fitz.Rect(left + col * cell_w, top + row * cell_h, left + (col + 1) * cell_w, top + (row + 1) * cell_h)
+                page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+                page.insert_text((rect.x0 + 4, rect.y0 + 16), f"{rng.randint(10, 999)}.{rng.randint(0, 99):02d}", fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_scanned_pdf(pages: int, seed: int = 0, dpi: int = 150) -> bytes:
+    """
+    Image-only PDF (no text layer): each digital page is rasterized and embedded as a picture.
+    """
+    source = fitz.open(stream=make_digital_pdf(pages, seed), filetype="pdf")
+    doc = fitz.open()
+    for src_page in source:
+        pix = src_page.get_pixmap(dpi=dpi)
+        page = doc.new_page(width=src_page.rect.width, height=src_page.rect.height)
+        page.insert_image(page.rect, stream=pix.tobytes("png"))
+    source.close()
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class _BenchJob:
+    """
+    Minimal stand-in for services.job_service.Job (the pipeline only reports progress on it).
+    """
+    def __init__(self, filename: str):
+        self.id = filename
+        self.filename = filename
+        self.options = {}
+        self.stages = {}
+
+    def start_stage(self, name, total=None):
+        self.stages[name] = {"status": "running", "done": 0, "total": total}
+
+    def advance(self, name, count=1):
+        if name in self.stages:
+            self.stages[name]["done"] += count
+
+    def finish_stage(self, name, status="completed"):
+        if name in self.stages:
+            self.stages[name]["status"] = status
+
+
+class Recorder:
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.samples = defaultdict(list)
+        self.pages = defaultdict(int)
+        self.peak_bytes = defaultdict(int)
+
+    def measure(self, stage: str, func, *args, pages: int = 0, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self._record(stage, time.perf_counter() - start, pages)
+        return result
+
+    async def ameasure(self, stage: str, coro, pages: int = 0):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = await coro
+        self._record(stage, time.perf_counter() - start, pages)
+        return result
+
+    def _record(self, stage: str, elapsed: float, pages: int):
+        self.samples[stage].append(elapsed)
+        self.pages[stage] += pages
+        if self.trace_memory:
+            self.peak_bytes[stage] = max(self.peak_bytes[stage], tracemalloc.get_traced_memory()[1])
+
+    def summary(self) -> dict:
+        report = {}
+        for stage in STAGES:
+            samples = sorted(self.samples.get(stage, []))
+            if not samples:
+                continue
+            total = sum(samples)
+            entry = {
+                "count": len(samples),
+                "total_s": round(total, 6),
+                "mean_s": round(total / len(samples), 6),
+                "p50_s": round(_percentile(samples, 50), 6),
+                "p90_s": round(_percentile(samples, 90), 6),
+                "p99_s": round(_percentile(samples, 99), 6),
+                "max_s": round(samples[-1], 6),
+            }
+            if self.pages.get(stage):
+                entry["pages"] = self.pages[stage]
+                entry["pages_per_s"] = round(self.pages[stage] / total, 3) if total else None
+            if self.trace_memory:
+                entry["peak_traced_mb"] = round(self.peak_bytes[stage] / 2**20, 2)
+            report[stage] = entry
+        return report
+
+
+def _percentile(sorted_samples: list[float], q: float) -> float:
+    if len(sorted_samples) == 1:
+        return sorted_samples[0]
+    return statistics.quantiles(sorted_samples, n=100, method="inclusive")[min(98, max(0, int(q) - 1))]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 2)
+
+
+async def run_document(services: dict, recorder: Recorder, kind: str, pdf_bytes: bytes, pages: int, skip: set):
+    ingestion = services["ingestion"]
+    document = recorder.measure("open", ingestion.open_document, pdf_bytes)
+    try:
+        rendered = [recorder.measure("render", page.render, settings.RENDER_DPI, pages=1) for page in document]
+        page_texts = [recorder.measure("text_layer", page.get_text, pages=1) for page in document]
+
+        layout = [[] for _ in range(pages)]
+        if "cv" not in skip:
+            layout = recorder.measure(
+                "layout", services["cv"].analyze_layout_batch, rendered,
+                batch_size=settings.CV_BATCH_SIZE, pages=pages
+            )
+
+        scanned = [i for i, text in enumerate(page_texts) if len(text.strip()) < settings.OCR_MIN_PAGE_CHARS]
+        if scanned and "ocr" not in skip:
+            # Fast pass on the rasters rendered above; low-confidence pages re-render at a higher DPI
+            renderers = [
+                lambda dpi, i=i, rendered=rendered: rendered[i] if dpi == settings.RENDER_DPI else document[i].render(dpi)
+                for i in scanned
+            ]
+            results = recorder.measure(
+                "ocr", services["ocr"].read_pages, renderers, settings.RENDER_DPI, pages=len(scanned)
+            )
+            for i, result in zip(scanned, results):
+                page_texts[i] = result.text
+            del renderers # They hold the rasters too
+        del rendered
+        ocr_text = "\n\n".join(text.strip() for text in page_texts if text.strip())
+
+        state = {
+            "file_path": f"bench-{kind}-{pages}.pdf",
+            "doc_hash": None,
+            "images": list(document),
+            "detected_layout": layout,
+            "ocr_text": ocr_text,
+            "page_texts": page_texts,
+            "vision_insights": "",
+            "text_insights": "",
+            "fusion_result": "",
+            "jit_confidence_score": 0.0,
+            "validation_notes": "",
+            "final_output": {}
+        }
+        result = await recorder.ameasure("agents", services["graph"].ainvoke(state), pages=pages)
+    finally:
+        document.close()
+
+    chunks = [ocr_text[i:i + 4000] for i in range(0, len(ocr_text), 4000)]
+    summary = result.get("final_output", {}).get("summary", "")
+    texts = ([summary] if summary else []) + chunks
+    metadatas = [{"filename": state["file_path"], "type": "raw_text", "chunk_index": i} for i in range(len(texts))]
+    embeddings = recorder.measure("embed", services["embed"].get_embeddings, texts)
+    recorder.measure("upsert", services["retriever"].add_documents, texts, metadatas, embeddings)
+    query = "quarterly revenue growth table"
+    recorder.measure("search", services["retriever"].search, query, services["embed"].get_embedding(query), limit=10)
+
+
+async def run_end_to_end(services: dict, recorder: Recorder, kind: str, pdf_bytes: bytes, pages: int):
+    job = _BenchJob(f"bench-e2e-{kind}-{pages}.pdf")
+    await recorder.ameasure("end_to_end", services["pipeline"].run(job, pdf_bytes), pages=pages)
+
+
+def build_services(skip: set, ocr_backend: str = None) -> dict:
+    from app.services.ingestion_service import IngestionService
+    from app.rag.embedding import EmbeddingService
+    from app.rag.vector_store import VectorStore
+    from app.rag.retriever import HybridRetriever
+    from app.agents.graph import build_graph
+    from app.services.pipeline_service import AnalysisPipeline
+
+    graph = build_graph()
+    services = {"ingestion": IngestionService(), "graph": graph}
+    services["cv"] = None
+    services["ocr"] = None
+    if "cv" not in skip:
+        from app.services.cv_service import CVService
+        services["cv"] = CVService(imgsz=settings.CV_IMGSZ)
+    if "ocr" not in skip:
+        from app.services.ocr_service import OCRService
+        services["ocr"] = OCRService(workers=settings.OCR_WORKERS, backend=ocr_backend)
+        services["ocr"].warm_up()
+    services["embed"] = EmbeddingService()
+    vector_store = VectorStore()
+    services["retriever"] = HybridRetriever(vector_store)
+    if "cv" not in skip and "ocr" not in skip:
+        services["pipeline"] = AnalysisPipeline(
+            services["ingestion"], services["cv"], services["ocr"], services["embed"],
+            vector_store, services["retriever"], graph
+        )
+    return services
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20], help="Page counts to generate")
+    parser.add_argument("--kinds", nargs="+", default=["digital", "scanned"], choices=["digital", "scanned"])
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions per (kind, page count)")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["cv", "ocr"], help="Stages to skip (no model weights needed)")
+    parser.add_argument("--ocr-backend", choices=["easyocr", "tesseract"], help="OCR backend (default: OCR_BACKEND)")
+    parser.add_argument("--trace-memory", action="store_true", help="Per-stage peak Python heap via tracemalloc (slower)")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args(argv)
+    skip = set(args.skip)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    recorder = Recorder(args.trace_memory)
+    services = build_services(skip, args.ocr_backend)
+
+    async def run_all():
+        for kind in args.kinds:
+            for pages in args.pages:
+                pdf_bytes = (make_digital_pdf if kind == "digital" else make_scanned_pdf)(pages, seed=pages)
+                for run in range(args.runs):
+                    print(f"[bench] {kind} {pages} page(s), run {run + 1}/{args.runs}", file=sys.stderr)
+                    await run_document(services, recorder, kind, pdf_bytes, pages, skip)
+                    if "pipeline" in services:
+                        await run_end_to_end(services, recorder, kind, pdf_bytes, pages)
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    wall = time.perf_counter() - started
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {
+            "pages": args.pages, "kinds": args.kinds, "runs": args.runs, "skip": sorted(skip),
+            "render_dpi": settings.RENDER_DPI, "cv_batch_size": settings.CV_BATCH_SIZE,
+            "ocr_workers": settings.OCR_WORKERS, "llm_backend": settings.LLM_BACKEND,
+            "ocr_backend": args.ocr_backend or settings.OCR_BACKEND, "ocr_adaptive_dpi": settings.OCR_ADAPTIVE_DPI,
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+        },
+        "wall_time_s": round(wall, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": recorder.summary(),
+    }
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for stage, entry in report["stages"].items():
+        rate = f"{entry['pages_per_s']:>8} pages/s" if entry.get("pages_per_s") else ""
+        print(f"{stage:<12} p50 {entry['p50_s'] * 1000:9.2f} ms  p90 {entry['p90_s'] * 1000:9.2f} ms  {rate}")
+    print(f"peak RSS {report['peak_rss_mb']} MB -> {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
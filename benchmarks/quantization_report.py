@@ -0,0 +1,219 @@
+"""
+Recall-vs-memory report for vector storage options (EMBEDDING_DIMENSIONS x VECTOR_QUANTIZATION).
+
+Embeds a local corpus once, then compares every (dimension, quantization, rescoring) combination
+against exact float32 search at the full dimension: recall@k, RAM per vector and projected index RAM.
+Quantization is simulated in NumPy the way Qdrant does it (int8 scalar over the 0.99 quantile range,
+binary = sign bits), so the numbers hold for any QDRANT_MODE, including embedded ones that don't quantize.
+
+Run from the directory that contains the `app` package:
+    python -m app.benchmarks.quantization_report --pdf-dir ./docs
+    python -m app.benchmarks.quantization_report --dims 1536 512 256 --project-vectors 50000000
+Without --pdf-dir a synthetic corpus is generated. Use EMBEDDING_BACKEND=openai for numbers that
+mean anything: it measures real text-embedding-3 vectors (shortened dimensions are truncated and
+re-normalized, as the API does). The default local hashing embedder is sparse and only exercises the tool.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# Same defaults as the pipeline benchmark: no network unless EMBEDDING_BACKEND is set explicitly
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("CACHE_ENABLED", "false")
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from app.core.config import settings
+from app.benchmarks.pipeline_benchmark import _git_commit, _paragraph
+from app.rag.chunking import chunk_pages
+from app.rag.embedding import EmbeddingService, LocalEmbeddings, embedding_dimensions
+
+QUANTIZATIONS = ["none", "int8", "binary"]
+
+
+def load_corpus(pdf_dir: str, max_chars: int) -> list[str]:
+    chunks = []
+    for root, _, files in os.walk(pdf_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            with fitz.open(os.path.join(root, name)) as doc:
+                chunks.extend(text for text, _ in chunk_pages([page.get_text() for page in doc], max_chars))
+    return chunks
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return ["\n\n".join(_paragraph(rng, rng.randint(30, 90)) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def sample_queries(corpus: list[str], count: int, seed: int = 1) -> list[str]:
+    # Short windows of corpus text, like a user quoting what they remember
+    rng = random.Random(seed)
+    queries = []
+    for text in rng.sample(corpus, min(count, len(corpus))):
+        words = text.split()
+        length = min(len(words), rng.randint(6, 16))
+        start = rng.randint(0, len(words) - length)
+        queries.append(" ".join(words[start:start + length]))
+    return queries
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Embedder:
+    """
+    Vectors at any dimension <= the configured one.
+    """
+    def __init__(self):
+        self.service = EmbeddingService()
+        self.full_dim = embedding_dimensions()
+
+    def full(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.service.get_embeddings(texts), dtype=np.float32)
+
+    def at_dim(self, texts: list[str], full: np.ndarray, dim: int) -> np.ndarray:
+        if dim == self.full_dim:
+            return full
+        if self.service.backend == "local":
+            # Feature hashing has no prefix structure: hash straight into `dim` buckets
+            return np.asarray(LocalEmbeddings(dim).embed_documents(texts), dtype=np.float32)
+        return _normalize(full[:, :dim])
+
+
+def quantize(docs: np.ndarray, queries: np.ndarray, mode: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (stored vectors, query vectors) as the quantized search compares them, scored with a dot product.
+    int8 keeps the query in float (the per-vector correction term makes scoring asymmetric);
+    binary compares sign bits of both.
+    """
+    if mode == "none":
+        return docs, queries
+    if mode == "binary":
+        return np.where(docs > 0, 1.0, -1.0).astype(np.float32), np.where(queries > 0, 1.0, -1.0).astype(np.float32)
+    low, high = np.quantile(docs, [0.005, 0.995]) # quantile=0.99
+    codes = np.clip(np.round((docs - low) / (high - low) * 255), 0, 255)
+    return (codes * (high - low) / 255 + low).astype(np.float32), queries
+
+
+def ram_bytes_per_vector(dim: int, mode: str) -> int:
+    if mode == "int8":
+        return dim + 4 # + per-vector float correction
+    if mode == "binary":
+        return math.ceil(dim / 8)
+    return dim * 4
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, part, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(part, order, axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def evaluate(embedder: Embedder, corpus: list[str], queries: list[str], dims: list[int], k: int, oversampling: list[float], project: int) -> list[dict]:
+    full = embedder.full_dim
+    doc_full, query_full = embedder.full(corpus), embedder.full(queries)
+    truth = top_k(query_full @ doc_full.T, k)
+    baseline = ram_bytes_per_vector(full, "none")
+
+    rows = []
+    for dim in dims:
+        docs, qs = embedder.at_dim(corpus, doc_full, dim), embedder.at_dim(queries, query_full, dim)
+        exact = qs @ docs.T
+        for mode in QUANTIZATIONS:
+            doc_codes, query_codes = quantize(docs, qs, mode)
+            start = time.perf_counter()
+            approx = query_codes @ doc_codes.T
+            found = top_k(approx, k)
+            search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            ram = ram_bytes_per_vector(dim, mode)
+            base = {
+                "dim": dim,
+                "quantization": mode,
+                "ram_bytes_per_vector": ram,
+                "disk_bytes_per_vector": dim * 4 if mode != "none" else 0, # Originals kept on disk for rescoring
+                "projected_ram_mb": round(ram * project / 2**20, 1),
+                "reduction": round(baseline / ram, 1),
+            }
+            rows.append({**base, "rescore": None, f"recall@{k}": round(recall(found, truth), 4), "search_ms_per_query": round(search_ms, 3)})
+            if mode == "none":
+                continue
+            for factor in oversampling:
+                # Oversampled quantized candidates, re-ranked with the full-precision vectors at this dim
+                candidates = top_k(approx, max(k, int(math.ceil(k * factor))))
+                rescored = np.take_along_axis(exact, candidates, axis=1)
+                reranked = np.take_along_axis(candidates, top_k(rescored, k), axis=1)
+                rows.append({**base, "rescore": factor, f"recall@{k}": round(recall(reranked, truth), 4)})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", help="Directory of PDFs (text layer) to build the corpus from")
+    parser.add_argument("--synthetic", type=int, default=5000, help="Synthetic chunks when no --pdf-dir is given")
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="Max chunk size for PDF corpora")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dims", type=int, nargs="+", help="Dimensions to compare (default: full, 1024, 512, 256)")
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[settings.QUANTIZATION_OVERSAMPLING])
+    parser.add_argument("--project-vectors", type=int, default=10_000_000, help="Corpus size for the projected RAM column")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/quantization-<timestamp>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.pdf_dir, args.chunk_chars) if args.pdf_dir else synthetic_corpus(args.synthetic)
+    if len(corpus) <= args.k:
+        parser.error(f"Corpus has {len(corpus)} chunk(s); need more than k={args.k}")
+    queries = sample_queries(corpus, args.queries)
+    embedder = Embedder()
+    dims = sorted({d for d in (args.dims or [embedder.full_dim, 1024, 512, 256]) if d <= embedder.full_dim}, reverse=True)
+    print(f"[quant] {len(corpus)} chunks, {len(queries)} queries, backend {embedder.service.backend}", file=sys.stderr)
+
+    started = time.perf_counter()
+    rows = evaluate(embedder, corpus, queries, dims, args.k, args.oversampling, args.project_vectors)
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "corpus": args.pdf_dir or f"synthetic:{args.synthetic}", "chunks": len(corpus), "queries": len(queries),
+            "k": args.k, "embedding_backend": embedder.service.backend, "embedding_model": settings.EMBEDDING_MODEL,
+            "full_dim": embedder.full_dim, "project_vectors": args.project_vectors,
+        },
+        "wall_time_s": round(time.perf_counter() - started, 3),
+        "results": rows,
+    }
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"quantization-{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'dim':>5} {'quant':<7} {'rescore':>7} {'recall@' + str(args.k):>10} {'B/vec':>7} {'RAM@' + str(args.project_vectors):>16} {'x':>6}")
+    for row in rows:
+        rescore = f"x{row['rescore']:g}" if row["rescore"] else "-"
+        print(
+            f"{row['dim']:>5} {row['quantization']:<7} {rescore:>7} {row[f'recall@{args.k}']:>10.4f} "
+            f"{row['ram_bytes_per_vector']:>7} {row['projected_ram_mb']:>13} MB {row['reduction']:>6}"
+        )
+    print(f"-> {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
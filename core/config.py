@@ -9,12 +9,137 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
     ANTHROPIC_API_KEY: Optional[str] = None
     
+    # LLM gateway (shared by all agents and /query)
+    LLM_BACKEND: str = "openai" # "openai" or "stub" (deterministic, no network)
+    LLM_MODEL: str = "gpt-4o-mini"
+    LLM_MAX_CONCURRENCY: int = 16 # In-flight calls across all models
+    LLM_MODEL_CONCURRENCY: int = 8 # In-flight calls per model
+    LLM_MAX_RETRIES: int = 5 # On 429/5xx/connection errors
+    LLM_BACKOFF_BASE: float = 0.5 # Seconds; doubled per attempt, full jitter
+    LLM_BACKOFF_MAX: float = 30.0
+    LLM_TIMEOUT: float = 120.0
+    
+    # Service loading (everything loads lazily; these are also loaded in the background at startup)
+    WARMUP_SERVICES: list[str] = ["retriever", "ocr", "pipeline"] # /ready waits for these; e.g. ["retriever"] for query-only workers
+    
+    # Ingestion
+    RENDER_DPI: int = 72 # DPI used when rasterizing pages for CV/OCR
+    RASTER_MEMORY_BUDGET: int = 256 * 1024 * 1024 # Rendered pages kept in memory per document; the rest spill to disk
+    RASTER_SPILL_DIR: Optional[str] = None # Memory-mapped spill files (None = system temp dir)
+    
+    # Layout detection
+    CV_IMGSZ: int = 640 # Letterboxed model input size
+    CV_BATCH_SIZE: int = 8 # Pages per YOLO forward pass
+    
+    # Text Agent map-reduce for long documents
+    TEXT_MAP_REDUCE: bool = True
+    TEXT_SINGLE_PASS_CHARS: int = 24000 # Up to this much text is summarized in one call
+    TEXT_SECTION_CHARS: int = 12000 # Max section size for the map step (sections are whole pages where possible)
+    TEXT_MAP_CONCURRENCY: int = 4 # Section summaries in flight per document
+    TEXT_REDUCE_MAX_CHARS: int = 24000 # Summaries per reduce call; more are reduced hierarchically
+
+    # Vision Agent payloads
+    VISION_DPI: int = 144 # Render DPI for crops sent to the vision model
+    VISION_REGION_TYPES: list[str] = ["table", "figure"] # Layout types worth sending
+    VISION_MIN_CONFIDENCE: float = 0.25
+    VISION_MAX_IMAGES: int = 12 # Crops per document (largest regions win)
+    VISION_MAX_PIXELS: int = 1024 * 1024 # Per-crop pixel budget; larger crops are downscaled
+    VISION_JPEG_QUALITY: int = 80
+    VISION_MAX_IMAGES_PER_REQUEST: int = 6
+    VISION_MAX_PAYLOAD_BYTES: int = 4 * 1024 * 1024 # Base64 bytes per multimodal request
+    VISION_ENCODE_CACHE_SIZE: int = 256 # Encoded crops kept in memory
+    
+    # OCR
+    OCR_WORKERS: Optional[int] = None # OCR worker processes (None = cores / OCR_WORKER_THREADS, 0 = in-process)
+    OCR_WORKER_THREADS: int = 1 # Torch/OpenMP threads per OCR worker process
+    OCR_MIN_PAGE_CHARS: int = 25 # Pages with less digital text than this are OCR'd
+    OCR_BACKEND: str = "easyocr" # "easyocr" or "tesseract" (overridable per request)
+    OCR_TESSERACT_LANG: str = "eng"
+    OCR_TESSERACT_CONFIG: str = "--oem 1 --psm 3" # LSTM engine, automatic page segmentation
+    OCR_ADAPTIVE_DPI: bool = True # Fast pass at RENDER_DPI, re-read low-confidence pages at a higher DPI
+    OCR_MIN_CONFIDENCE: float = 0.8 # Pages read below this mean word confidence are retried
+    OCR_TARGET_TEXT_HEIGHT: int = 32 # Text line height (px) the retry DPI aims for
+    OCR_MAX_DPI: int = 300
+    
+    # Background jobs (/analyze)
+    JOB_WORKERS: int = 2 # Documents analyzed concurrently
+    JOB_QUEUE_SIZE: int = 16 # Pending jobs before /analyze answers 503
+    JOB_HISTORY: int = 1000 # Finished jobs kept for status lookups
+    JOB_RETRY_AFTER_SECONDS: int = 10
+    UPLOAD_MAX_BYTES: int = 100 * 1024 * 1024 # Per /analyze upload (413 beyond)
+    UPLOAD_DIR: Optional[str] = None # Uploads are spooled here until their job finishes (None = system temp dir)
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024 # Copy/hash chunk size
+    
+    # Batch ingestion (/analyze/batch): stages connected by bounded queues, each with its own workers
+    BATCH_MAX_FILES: int = 10000 # Documents per batch (PDFs, including zip members)
+    BATCH_MAX_FILE_BYTES: int = 100 * 1024 * 1024 # Per document
+    BATCH_MAX_BYTES: int = 1024 * 1024 * 1024 # Per batch request (all files and archives; 413 beyond)
+    BATCH_QUEUE_SIZE: int = 4 # Documents buffered between two stages
+    BATCH_WORKERS_PARSE: int = 2
+    BATCH_WORKERS_EXTRACT: int = 2 # Layout + OCR
+    BATCH_WORKERS_AGENTS: int = 8
+    BATCH_WORKERS_EMBED: int = 2
+    BATCH_WORKERS_UPSERT: int = 1
+    
+    # Per-stage concurrency limits (documents in a stage at once, across jobs)
+    STAGE_CONCURRENCY_PARSE: int = 2
+    STAGE_CONCURRENCY_LAYOUT: int = 1
+    STAGE_CONCURRENCY_OCR: int = 1
+    STAGE_CONCURRENCY_AGENTS: int = 4
+    STAGE_CONCURRENCY_INDEX: int = 2
+    
+    # Analysis cache (content-addressed by PDF hash)
+    CACHE_ENABLED: bool = True
+    CACHE_DIR: str = ".cache"
+    CACHE_MAX_BYTES: int = 512 * 1024 * 1024 # LRU eviction beyond this size
+    
     # Embedding Configuration
     EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSIONS: Optional[int] = None # Truncated output size (e.g. 512); None = full 1536. Re-index after changing
+    EMBEDDING_BACKEND: str = "openai" # "openai" or "local" (deterministic, no network)
+    EMBEDDING_BATCH_SIZE: int = 64 # Texts per embed_documents call
+    EMBEDDING_CONCURRENCY: int = 4 # Batches in flight at once
+    EMBEDDING_CACHE_SIZE: int = 10000 # In-memory LRU entries (disk store lives in CACHE_DIR)
+    EMBEDDING_CACHE_MAX_BYTES: int = 256 * 1024 * 1024 # Disk store size; least recently used vectors are evicted beyond it
+    
+    # Chunking (page-aware, split on paragraph boundaries)
+    CHUNK_MAX_CHARS: int = 4000
     
     # Vector DB
+    QDRANT_MODE: str = "memory" # "memory", "local" (on-disk at QDRANT_PATH) or "remote" (QDRANT_HOST:QDRANT_PORT)
+    QDRANT_PATH: str = ".qdrant"
     QDRANT_HOST: str = "localhost"
     QDRANT_PORT: int = 6333
+    QDRANT_UPSERT_BATCH_SIZE: int = 256 # Points per upsert request
+    QDRANT_COLLECTION: str = "documents"
+    # Compact vector storage (server mode): "none", "int8" (scalar, ~4x smaller) or "binary" (~32x smaller).
+    # Quantized vectors stay in RAM, originals move to disk and rescore the top candidates.
+    VECTOR_QUANTIZATION: str = "none"
+    QUANTIZATION_RESCORE: bool = True
+    QUANTIZATION_OVERSAMPLING: float = 3.0 # Candidates fetched per result before rescoring
+    
+    # Retrieval (/query)
+    QUERY_TOP_K: int = 10 # Retrieved chunks handed to the context builder
+    BM25_ENABLED: bool = True # Hybrid lexical + vector retrieval
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    RRF_K: int = 60 # Reciprocal rank fusion constant
+    RETRIEVAL_CANDIDATES: int = 30 # Hits taken from each retriever before fusion
+    RETRIEVAL_FILTER_MAX_IDS: int = 20000 # Filtered BM25 scores only matching chunks up to this many
+    RETRIEVAL_FILTER_OVERFETCH: int = 4 # Broader filters: BM25 candidate multiplier before post-filtering
+    # Answer context assembly (dedupe, rerank, pack)
+    CONTEXT_MAX_TOKENS: int = 1500 # Budget for retrieved passages in the answer prompt
+    CONTEXT_SENTENCE_WINDOW: int = 1 # Neighbouring sentences kept on each side of a matching sentence
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8 # Share of word 3-grams already in the context that makes a passage a duplicate
+    CONTEXT_RETRIEVAL_WEIGHT: float = 0.5 # Weight of the chunk's retrieval score next to the sentence-level BM25 score
+    CONTEXT_MAX_SENTENCE_CHARS: int = 600 # Longer sentences (tables, OCR runs) are cut down
+    
+    # Observability (/metrics, spans, per-request profiling)
+    LOG_LEVEL: str = "INFO" # Level of the app's loggers (DEBUG shows per-stage details)
+    TRACE_LOG_SPANS: bool = False # Log every span (with doc_id/pages/bytes attributes) at DEBUG on app.core.telemetry
+    PROFILING_ENABLED: bool = False # Allow ?profile=true on /analyze and /query
+    PROFILE_INTERVAL: float = 0.005 # Seconds between stack samples
+    PROFILE_DIR: str = ".profiles" # Folded stacks (flamegraph.pl / speedscope input)
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,280 @@
+"""
+Timing spans, Prometheus-style metrics and an opt-in sampling profiler.
+
+    with telemetry.span("ocr", pages=len(scanned)) as span:
+        ...
+        span.set(chars=len(text))
+
+Every span feeds docintel_stage_duration_seconds{stage=...} (plus error/page/byte/item counters)
+and inherits attributes such as doc_id from the enclosing trace_context(). Context variables are
+copied into asyncio tasks and asyncio.to_thread calls, so worker-thread stages keep the document ID.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "docintel"
+
+# Seconds; spans range from sub-millisecond page renders to multi-minute LLM-bound documents
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Numeric span attributes that are also accumulated as docintel_stage_<attr>_total counters
+COUNTED_ATTRIBUTES = ("pages", "bytes", "items")
+
+_trace_attributes: ContextVar[dict] = ContextVar("trace_attributes", default={})
+
+
+@contextmanager
+def trace_context(**attributes):
+    """
+    Attach attributes (doc_id, filename, ...) to every span opened inside this block.
+    """
+    token = _trace_attributes.set({**_trace_attributes.get(), **attributes})
+    try:
+        yield
+    finally:
+        _trace_attributes.reset(token)
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "span": self.name,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Telemetry:
+    """
+    Process-local metrics registry. Label sets are kept small (stage name only);
+    per-document attributes go to the span log, not to metric labels.
+    """
+    def __init__(self, prefix: str = METRIC_PREFIX, buckets: tuple = DEFAULT_BUCKETS, log_spans: bool = False):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.log_spans = log_spans
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: Histogram(self.buckets)) # (name, labels) -> Histogram
+        self._counters = defaultdict(float) # (name, labels) -> value
+        self._help = {}
+        self._gauges = {} # name -> (help, callback returning {labels tuple: value})
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, {**_trace_attributes.get(), **attributes})
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, **attributes):
+        """
+        Record a span measured elsewhere (e.g. inside a worker process).
+        """
+        span = Span(name, {**_trace_attributes.get(), **attributes})
+        span.duration = seconds
+        self._finish(span)
+
+    def _finish(self, span: Span):
+        labels = (("stage", span.name),)
+        with self._lock:
+            self._histograms[("stage_duration_seconds", labels)].observe(span.duration)
+            if span.error is not None:
+                self._counters[("stage_errors_total", labels)] += 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    self._counters[(f"stage_{attribute}_total", labels)] += value
+        if self.log_spans and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s", json.dumps(span.to_dict(), default=str))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def register_gauge(self, name: str, help_text: str, callback: Callable[[], dict]):
+        """
+        `callback` returns {labels tuple: value}, read at scrape time (e.g. job queue depth).
+        """
+        self._gauges[name] = (help_text, callback)
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        for (name, labels), hist in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {hist.count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {hist.sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {hist.count}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+
+        for name, (help_text, callback) in sorted(self._gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            try:
+                values = callback()
+            except Exception as e:
+                logger.warning("gauge %s failed: %s", name, e)
+                continue
+            for labels, value in values.items():
+                lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: a daemon thread snapshots every thread's stack
+    (sys._current_frames) each `interval` seconds and counts collapsed stacks.
+    Output is the folded format read by flamegraph.pl / speedscope.
+    Samples are process-wide, so requests that overlap the profiled one show up too.
+    """
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                # Idle pool threads only add noise
+                if stack and stack[0].startswith(("wait (threading.py", "select (selectors.py", "_worker (thread.py")):
+                    continue
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+@contextmanager
+def profile(name: str, enabled: bool = True):
+    """
+    Sample stacks while the block runs and write them to PROFILE_DIR/<name>.folded.
+    Yields the output path (None when profiling is off). Requires PROFILING_ENABLED.
+    """
+    if not (enabled and settings.PROFILING_ENABLED):
+        yield None
+        return
+    path = os.path.join(settings.PROFILE_DIR, f"{name}.folded")
+    profiler = SamplingProfiler(interval=settings.PROFILE_INTERVAL)
+    profiler.start()
+    try:
+        yield path
+    finally:
+        profiler.stop()
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(profiler.collapsed())
+        logger.info("Profile of %s (%d samples) written to %s", name, profiler.samples, path)
+
+
+telemetry = Telemetry(log_spans=settings.TRACE_LOG_SPANS)
+telemetry.describe("stage_duration_seconds", "Wall time of each pipeline stage span.")
+telemetry.describe("stage_errors_total", "Spans that ended with an exception.")
+telemetry.describe("stage_pages_total", "Pages processed per stage.")
+telemetry.describe("stage_bytes_total", "Bytes processed per stage.")
+telemetry.describe("stage_items_total", "Items (chunks, texts, points) processed per stage.")
+telemetry.describe("raster_cache_requests_total", "Cached page raster lookups by result.")
+telemetry.describe("raster_spilled_bytes_total", "Page raster bytes spilled from memory to disk.")
@@ -1,14 +1,43 @@
+from contextlib import asynccontextmanager
+import logging
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
+from app.api.middleware import UploadSizeLimitMiddleware
+from app.api.routes import router, job_manager
 from app.core.config import settings
+from app.services.registry import registry
+
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+if settings.TRACE_LOG_SPANS:
+    # Span lines are DEBUG records; enable them without turning on DEBUG everywhere
+    logging.getLogger("app.core.telemetry").setLevel(logging.DEBUG)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load models in the background: the server accepts requests (and /health answers) right away,
+    # /ready reports when the warm-up has finished
+    if settings.WARMUP_SERVICES:
+        threading.Thread(
+            target=registry.warm_up, args=(settings.WARMUP_SERVICES,), name="service-warm-up", daemon=True
+        ).start()
+    yield
+    await job_manager.shutdown()
+    registry.shutdown()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
-    description="Multi-Modal AI Agent System for Document Intelligence"
+    description="Multi-Modal AI Agent System for Document Intelligence",
+    lifespan=lifespan
 )
 
+# Oversized uploads are refused from the headers, before the body is received
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    "/api/analyze": ("UPLOAD_MAX_BYTES", settings.UPLOAD_MAX_BYTES),
+    "/api/analyze/batch": ("BATCH_MAX_BYTES", settings.BATCH_MAX_BYTES),
+})
+
 # CORS
 origins = ["*"]
 app.add_middleware(
@@ -0,0 +1,200 @@
+from array import array
+import math
+import re
+import threading
+import numpy as np
+
+_token_re = re.compile(r"\w+", re.UNICODE)
+
+# Term frequencies are stored as uint16; longer runs of one term in a chunk are clipped
+_MAX_TF = 65535
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens. Identifiers, numbers and names survive intact (e.g. "x-42" -> ["x", "42"]).
+    """
+    return _token_re.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring, updated incrementally as chunks are indexed.
+    Postings are array-backed (uint32 doc numbers + uint16 term frequencies per term, plus each
+    document's uint32 term IDs) and scored with vectorized NumPy ops, so memory stays ~10 bytes per
+    posting at millions of chunks.
+    Re-adding an existing ID replaces it; replaced/removed chunks are tombstoned, and postings are
+    compacted once tombstones make up `compact_ratio` of the documents (and at least `compact_min`).
+    Document frequencies count live documents only, so scores don't drift as chunks are re-indexed.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.25, compact_min: int = 1000):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._lock = threading.RLock()
+        self._term_ids = {}
+        self._postings = [] # term id -> array('I') of doc numbers (ascending)
+        self._freqs = []    # term id -> array('H') of term frequencies, parallel to _postings
+        self._df = array("I") # term id -> number of live docs containing the term
+        self._doc_terms = [] # doc number -> array('I') of its distinct term ids (None once deleted)
+        self._doc_keys = [] # doc number -> external ID (None once deleted)
+        self._doc_numbers = {} # external ID -> live doc number
+        self._doc_lengths = array("I")
+        self._live_docs = 0
+        self._live_length = 0
+
+    def __len__(self) -> int:
+        return self._live_docs
+
+    def add(self, doc_id: str, text: str):
+        self.add_many([doc_id], [text])
+
+    def add_many(self, doc_ids: list[str], texts: list[str]):
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                self._remove(doc_id)
+                tokens = tokenize(text)
+                number = len(self._doc_keys)
+                self._doc_keys.append(doc_id)
+                self._doc_numbers[doc_id] = number
+                self._doc_lengths.append(len(tokens))
+                self._live_docs += 1
+                self._live_length += len(tokens)
+
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                terms = array("I")
+                for token, tf in counts.items():
+                    term_id = self._term_ids.get(token)
+                    if term_id is None:
+                        term_id = self._term_ids[token] = len(self._postings)
+                        self._postings.append(array("I"))
+                        self._freqs.append(array("H"))
+                        self._df.append(0)
+                    self._postings[term_id].append(number)
+                    self._freqs[term_id].append(min(tf, _MAX_TF))
+                    self._df[term_id] += 1
+                    terms.append(term_id)
+                self._doc_terms.append(terms)
+            self._maybe_compact()
+
+    def remove(self, doc_id: str):
+        self.remove_many([doc_id])
+
+    def remove_many(self, doc_ids: list[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+            self._maybe_compact()
+
+    def _remove(self, doc_id: str):
+        number = self._doc_numbers.pop(doc_id, None)
+        if number is None:
+            return
+        # Tombstone: postings keep the number until the next compaction, scoring skips it
+        for term_id in self._doc_terms[number]:
+            self._df[term_id] -= 1
+        self._doc_terms[number] = None
+        self._doc_keys[number] = None
+        self._live_docs -= 1
+        self._live_length -= self._doc_lengths[number]
+
+    def _maybe_compact(self):
+        dead = len(self._doc_keys) - self._live_docs
+        if dead >= self.compact_min and dead >= self.compact_ratio * len(self._doc_keys):
+            self._compact()
+
+    def _compact(self):
+        """
+        Drop tombstoned documents from the postings and renumber the rest (order is kept, so postings
+        stay ascending); terms no live document uses are dropped. Caller holds the lock.
+        """
+        live = np.fromiter((key is not None for key in self._doc_keys), dtype=bool, count=len(self._doc_keys))
+        doc_map = np.cumsum(live, dtype=np.int64) - 1 # old doc number -> new (valid where live)
+        term_map = np.full(len(self._postings), -1, dtype=np.int64)
+        term_ids, postings, freqs, df = {}, [], [], array("I")
+        for token, term_id in self._term_ids.items():
+            if self._df[term_id] == 0:
+                continue
+            numbers = np.frombuffer(self._postings[term_id], dtype=np.uint32)
+            keep = live[numbers]
+            term_map[term_id] = len(postings)
+            term_ids[token] = len(postings)
+            postings.append(array("I", doc_map[numbers[keep]].astype(np.uint32).tobytes()))
+            freqs.append(array("H", np.frombuffer(self._freqs[term_id], dtype=np.uint16)[keep].tobytes()))
+            df.append(self._df[term_id])
+
+        lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)[live]
+        self._doc_keys = [key for key in self._doc_keys if key is not None]
+        self._doc_numbers = {key: number for number, key in enumerate(self._doc_keys)}
+        self._doc_terms = [
+            array("I", term_map[np.frombuffer(terms, dtype=np.uint32)].astype(np.uint32).tobytes())
+            for terms in self._doc_terms if terms is not None
+        ]
+        self._doc_lengths = array("I", lengths.tobytes())
+        self._term_ids, self._postings, self._freqs, self._df = term_ids, postings, freqs, df
+
+    def search(self, query: str, limit: int = 10, allowed: set[str] = None) -> list[tuple[str, float]]:
+        """
+        Top `limit` (doc ID, BM25 score) pairs for the query, best first.
+        `allowed` restricts scoring to those IDs (a filtered, document-scoped search).
+        """
+        with self._lock:
+            if self._live_docs == 0:
+                return []
+            terms = [
+                self._term_ids[t] for t in set(tokenize(query))
+                if t in self._term_ids and self._df[self._term_ids[t]] > 0
+            ]
+            if not terms:
+                return []
+
+            n_docs = self._live_docs
+            avg_length = self._live_length / n_docs
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+            scores = {}
+            touched = []
+            for term_id in terms:
+                numbers = np.frombuffer(self._postings[term_id], dtype=np.uint32)
+                tf = np.frombuffer(self._freqs[term_id], dtype=np.uint16).astype(np.float32)
+                df = self._df[term_id] # Live documents only; tombstoned postings are skipped below
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[numbers] / avg_length)
+                scores[term_id] = (numbers, idf * tf * (self.k1 + 1) / (tf + norm))
+                touched.append(numbers)
+
+            # Accumulate per-term contributions over the union of matching docs
+            candidates = np.unique(np.concatenate(touched))
+            total = np.zeros(len(candidates), dtype=np.float32)
+            for numbers, contribution in scores.values():
+                np.add.at(total, np.searchsorted(candidates, numbers), contribution)
+            if allowed is not None:
+                allowed_numbers = np.fromiter(
+                    (self._doc_numbers[d] for d in allowed if d in self._doc_numbers), dtype=np.uint32
+                )
+                keep = np.isin(candidates, allowed_numbers)
+                candidates, total = candidates[keep], total[keep]
+
+            results = []
+            order = np.argsort(-total)
+            for position in order:
+                doc_id = self._doc_keys[candidates[position]]
+                if doc_id is None:
+                    continue
+                results.append((doc_id, float(total[position])))
+                if len(results) >= limit:
+                    break
+            return results
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """
+    Merge several ranked ID lists: score(d) = sum over lists of 1 / (k + rank).
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,92 @@
+import hashlib
+import re
+
+_paragraph_re = re.compile(r"\n\s*\n")
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """
+    Split text into pieces of at most `max_chars`, preferring paragraph, then line, then word boundaries.
+    Boundaries come from the content, so an edit only changes the pieces around it.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces, current = [], ""
+    for unit in _units(text, max_chars):
+        if current and len(current) + 2 + len(unit) > max_chars:
+            pieces.append(current)
+            current = unit
+        else:
+            current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _units(text: str, max_chars: int) -> list[str]:
+    # Paragraphs, with oversized ones broken down to lines, words and finally fixed cuts
+    units = []
+    for paragraph in _paragraph_re.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for separator in ("\n", " "):
+            parts = paragraph.split(separator)
+            if all(len(part) <= max_chars for part in parts):
+                line = ""
+                for part in parts:
+                    if line and len(line) + 1 + len(part) > max_chars:
+                        units.append(line)
+                        line = part
+                    else:
+                        line = f"{line}{separator}{part}" if line else part
+                if line:
+                    units.append(line)
+                break
+        else:
+            units.extend(paragraph[i:i + max_chars] for i in range(0, len(paragraph), max_chars))
+    return units
+
+
+def chunk_pages(page_texts: list[str], max_chars: int = 4000) -> list[tuple[str, int]]:
+    """
+    Page-aware chunks: (text, 1-based page number). Chunks never span pages,
+    so a revised page re-embeds only its own chunks.
+    """
+    chunks = []
+    for index, text in enumerate(page_texts):
+        chunks.extend((piece, index + 1) for piece in split_text(text or "", max_chars))
+    return chunks
+
+
+def group_pages(page_texts: list[str], max_chars: int) -> list[tuple[str, int, int]]:
+    """
+    Consecutive pages packed into sections of at most `max_chars`: (text, first page, last page), 1-based.
+    A section also ends after a page whose content hash says so (about one page in four, once the section
+    is a quarter full), so boundaries depend on the pages themselves rather than on everything before them:
+    editing one page changes its own section and rarely the next one.
+    """
+    sections, current, first, last = [], [], None, None
+    size = 0
+    for text, page in chunk_pages(page_texts, max_chars):
+        if current and size + 2 + len(text) > max_chars:
+            sections.append(("\n\n".join(current), first, last))
+            current, size = [], 0
+        if not current:
+            first = page
+        current.append(text)
+        size += len(text) + (2 if len(current) > 1 else 0)
+        last = page
+        if size >= max_chars // 4 and hashlib.blake2b(text.encode("utf-8"), digest_size=1).digest()[0] % 4 == 0:
+            sections.append(("\n\n".join(current), first, last))
+            current, size = [], 0
+    if current:
+        sections.append(("\n\n".join(current), first, last))
+    return sections
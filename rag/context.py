@@ -0,0 +1,177 @@
+import re
+from typing import Optional
+from app.core.config import settings
+from app.rag.bm25 import BM25Index, tokenize
+from app.rag.chunking import split_text
+
+# Sentence ends (., !, ? followed by whitespace) and paragraph breaks
+_sentence_re = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_space_re = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for budgeting (~4 characters per token for English with the OpenAI tokenizers).
+    """
+    return len(text) // 4 + 1
+
+
+def split_sentences(text: str, max_chars: int) -> list[str]:
+    """
+    Sentences with whitespace collapsed; sentences longer than `max_chars` (tables, OCR runs) are cut down.
+    """
+    sentences = []
+    for part in _sentence_re.split(text or ""):
+        part = _space_re.sub(" ", part).strip()
+        if part:
+            sentences.extend(split_text(part, max_chars))
+    return sentences
+
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    # Word n-grams; texts shorter than `size` words are a single shingle
+    tokens = tokenize(text)
+    if len(tokens) < size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _covered(shingles: set, seen: set) -> float:
+    # Share of `shingles` already present in `seen`
+    if not shingles:
+        return 1.0
+    return len(shingles & seen) / len(shingles)
+
+
+class RetrievalContext:
+    """
+    The prompt context for one question: labelled passages and their citations.
+    """
+    def __init__(self, text: str, citations: list[dict], tokens: int):
+        self.text = text
+        self.citations = citations
+        self.tokens = tokens
+
+    def __bool__(self) -> bool:
+        return bool(self.citations)
+
+
+class ContextBuilder:
+    """
+    Turns retrieved chunks into a compact answer context:
+    1. drops chunks whose text is already covered by a better-ranked chunk (e.g. overlapping re-uploads),
+    2. scores sentence windows (a sentence plus `window` neighbours) with BM25 over the windows,
+       blended with the chunk's retrieval score,
+    3. packs the best windows under `max_tokens`, skipping sentences another passage already says
+       (a summary repeating its raw text), and merges them back into per-chunk passages.
+    Passages are labelled [n]; citations carry filename, type, chunk_index and page for each label.
+    """
+    def __init__(
+        self,
+        max_tokens: int = settings.CONTEXT_MAX_TOKENS,
+        window: int = settings.CONTEXT_SENTENCE_WINDOW,
+        duplicate_threshold: float = settings.CONTEXT_DUPLICATE_THRESHOLD,
+        retrieval_weight: float = settings.CONTEXT_RETRIEVAL_WEIGHT,
+        max_sentence_chars: int = settings.CONTEXT_MAX_SENTENCE_CHARS
+    ):
+        self.max_tokens = max_tokens
+        self.window = window
+        self.duplicate_threshold = duplicate_threshold
+        self.retrieval_weight = retrieval_weight
+        self.max_sentence_chars = max_sentence_chars
+
+    def _dedupe(self, hits: list) -> list:
+        kept, seen = [], set()
+        for hit in hits:
+            shingles = _shingles((hit.payload or {}).get("text", ""))
+            if not shingles or _covered(shingles, seen) >= self.duplicate_threshold:
+                continue
+            kept.append(hit)
+            seen |= shingles
+        return kept
+
+    def _windows(self, chunks: list[list[str]]) -> list[tuple[int, int, int]]:
+        # (chunk, first sentence, last sentence) around every sentence
+        windows = []
+        for c, sentences in enumerate(chunks):
+            for i in range(len(sentences)):
+                windows.append((c, max(0, i - self.window), min(len(sentences) - 1, i + self.window)))
+        return list(dict.fromkeys(windows))
+
+    def _scores(self, query_text: str, hits: list, chunks: list[list[str]], windows: list) -> list[Optional[float]]:
+        """
+        Score per window, or None for windows without query terms in chunks that have some
+        (chunks with no lexical match at all are pure semantic hits and keep all their windows).
+        """
+        index = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        index.add_many(
+            [str(w) for w in range(len(windows))],
+            [" ".join(chunks[c][first:last + 1]) for c, first, last in windows]
+        )
+        lexical = {int(w): score for w, score in index.search(query_text, limit=len(windows))}
+        top_lexical = max(lexical.values(), default=0.0) or 1.0
+        top_retrieval = max((hit.score for hit in hits), default=0.0) or 1.0
+        matched = {windows[w][0] for w in lexical}
+        return [
+            None if c in matched and w not in lexical
+            else lexical.get(w, 0.0) / top_lexical + self.retrieval_weight * hits[c].score / top_retrieval
+            for w, (c, _, _) in enumerate(windows)
+        ]
+
+    def build(self, query_text: str, hits: list) -> RetrievalContext:
+        """
+        Context for `hits` (ScoredPoints, best first) under the token budget.
+        """
+        hits = self._dedupe(hits)
+        chunks = [split_sentences(hit.payload.get("text", ""), self.max_sentence_chars) for hit in hits]
+        windows = self._windows(chunks)
+        if not windows:
+            return RetrievalContext("", [], 0)
+        scores = self._scores(query_text, hits, chunks, windows)
+
+        selected = {} # chunk -> sentence indices
+        best = {}     # chunk -> best window score (orders the passages)
+        seen, budget = set(), self.max_tokens
+        for w in sorted((w for w in range(len(windows)) if scores[w] is not None), key=lambda w: -scores[w]):
+            c, first, last = windows[w]
+            # Sentences not yet in the context, minus those another passage already says
+            new = {
+                i: _shingles(chunks[c][i]) for i in range(first, last + 1) if i not in selected.get(c, ())
+            }
+            new = {i: shingles for i, shingles in new.items() if _covered(shingles, seen) < self.duplicate_threshold}
+            if not new:
+                continue
+            cost = sum(estimate_tokens(chunks[c][i]) for i in new)
+            if cost > budget:
+                continue
+            selected.setdefault(c, set()).update(new)
+            best.setdefault(c, scores[w])
+            for shingles in new.values():
+                seen |= shingles
+            budget -= cost
+            if budget <= 0:
+                break
+
+        passages, citations = [], []
+        for n, c in enumerate(sorted(selected, key=lambda c: -best[c]), start=1):
+            payload = hits[c].payload or {}
+            # Sentences in document order; gaps between selected windows are marked
+            indices = sorted(selected[c])
+            text = chunks[c][indices[0]]
+            for previous, i in zip(indices, indices[1:]):
+                text += (" " if i == previous + 1 else " ... ") + chunks[c][i]
+            label = payload.get("filename") or "document"
+            if payload.get("page") is not None:
+                label += f", page {payload['page']}"
+            elif payload.get("type") == "summary":
+                label += ", summary"
+            passages.append(f"[{n}] {label}\n{text}")
+            citations.append({
+                "id": n,
+                "filename": payload.get("filename"),
+                "type": payload.get("type"),
+                "chunk_index": payload.get("chunk_index"),
+                "page": payload.get("page"),
+                "score": hits[c].score
+            })
+        return RetrievalContext("\n\n".join(passages), citations, self.max_tokens - budget)
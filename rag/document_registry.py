@@ -0,0 +1,131 @@
+import logging
+import time
+from typing import Optional
+from app.rag.vector_store import VectorStore, point_id
+
+logger = logging.getLogger(__name__)
+
+# Payload fields stamped per version by DocumentRegistry.commit
+VERSION_FIELDS = ("doc_hash", "version", "ingested_at")
+
+
+class DocumentRecord:
+    """
+    The indexed state of one document: its current version, content hash and chunk point IDs.
+    """
+    def __init__(self, filename: str, version: int, doc_hash: Optional[str], point_ids: set[str]):
+        self.filename = filename
+        self.version = version
+        self.doc_hash = doc_hash
+        self.point_ids = point_ids
+
+
+class IndexPlan:
+    """
+    What re-indexing a document needs: the chunks not yet stored (to embed and upsert)
+    and the IDs of every chunk of the new version (the rest of the old version is stale).
+    """
+    def __init__(self, filename: str, doc_hash: str, texts: list[str], metadatas: list[dict], ids: list[str], existing: set[str]):
+        self.filename = filename
+        self.doc_hash = doc_hash
+        self.ids = ids
+        new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        kept = [i for i, chunk_id in enumerate(ids) if chunk_id in existing]
+        self.new_texts = [texts[i] for i in new]
+        self.new_metadatas = [metadatas[i] for i in new]
+        self.kept_ids = [ids[i] for i in kept]
+        self.kept_metadatas = [metadatas[i] for i in kept] # Page/position may have moved
+
+
+class DocumentRegistry:
+    """
+    Indexed documents keyed by filename, with a version that increases whenever a file's content changes.
+    The vector store is the source of truth (each point carries filename, doc_hash and version),
+    so the registry stays consistent with the index in every QDRANT_MODE.
+    """
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+
+    def get(self, filename: str) -> Optional[DocumentRecord]:
+        points = self.vector_store.document_points(filename, ["doc_hash", "version"])
+        if not points:
+            return None
+        # Points of an interrupted re-index may briefly mix versions; the newest one wins
+        latest = max(points, key=lambda p: p.payload.get("version") or 0)
+        return DocumentRecord(
+            filename,
+            latest.payload.get("version") or 1,
+            latest.payload.get("doc_hash"),
+            {str(p.id) for p in points}
+        )
+
+    def plan(self, filename: str, doc_hash: str, texts: list[str], metadatas: list[dict]) -> IndexPlan:
+        """
+        Deduplicate the chunks (by content-hash ID) and find the ones that are already indexed.
+        """
+        unique_texts, unique_metadatas, ids, seen = [], [], [], set()
+        for text, metadata in zip(texts, metadatas):
+            chunk_id = point_id(text, metadata)
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            unique_texts.append(text)
+            unique_metadatas.append(metadata)
+            ids.append(chunk_id)
+        existing = self.vector_store.existing_ids(ids)
+        return IndexPlan(filename, doc_hash, unique_texts, unique_metadatas, ids, existing)
+
+    def copy(self, doc_hash: str, filename: str, retriever) -> Optional[int]:
+        """
+        Index a document that is already indexed (by content hash) under `filename` as well, reusing
+        its chunks and vectors, so filename filters find byte-identical re-uploads under a new name.
+        Returns the version under `filename`, or None if it already holds this content.
+        """
+        record = self.get(filename)
+        if record is not None and record.doc_hash == doc_hash:
+            return None
+        points = self.vector_store.hash_points(doc_hash)
+        if not points:
+            return None
+        # The same content may be indexed under several names already; one copy is enough
+        source = points[0].payload.get("filename")
+        texts, metadatas, vectors = [], [], {}
+        for point in points:
+            if point.payload.get("filename") != source:
+                continue
+            metadata = {k: v for k, v in point.payload.items() if k != "text" and k not in VERSION_FIELDS}
+            metadata["filename"] = filename
+            texts.append(point.payload.get("text", ""))
+            metadatas.append(metadata)
+            vectors[point_id(texts[-1], metadata)] = point.vector
+        plan = self.plan(filename, doc_hash, texts, metadatas)
+        embeddings = [vectors[point_id(text, metadata)] for text, metadata in zip(plan.new_texts, plan.new_metadatas)]
+        return self.commit(plan, embeddings, retriever)
+
+    def commit(self, plan: IndexPlan, embeddings: list[list[float]], retriever) -> int:
+        """
+        Apply a plan: upsert the new chunks, move unchanged chunks to the new version,
+        and delete chunks of the previous version that no longer exist. Returns the new version.
+        """
+        record = self.get(plan.filename)
+        if record is None:
+            version = 1
+        elif record.doc_hash == plan.doc_hash:
+            version = record.version
+        else:
+            version = record.version + 1
+
+        # ingested_at is when this version was indexed (it backs the ingestion-time search filter)
+        stamp = {"doc_hash": plan.doc_hash, "version": version, "ingested_at": time.time()}
+        if plan.new_texts:
+            retriever.add_documents(plan.new_texts, [{**m, **stamp} for m in plan.new_metadatas], embeddings)
+        if plan.kept_ids:
+            self.vector_store.update_payloads(plan.kept_ids, [{**m, **stamp} for m in plan.kept_metadatas])
+        stale = sorted(record.point_ids - set(plan.ids)) if record is not None else []
+        if stale:
+            retriever.delete_documents(stale)
+        logger.info(
+            "Indexed %s v%d: %d new, %d unchanged, %d stale chunk(s) removed",
+            plan.filename, version, len(plan.new_texts), len(plan.kept_ids), len(stale)
+        )
+        return version
@@ -1,15 +1,285 @@
 from langchain_openai import OpenAIEmbeddings
 from app.core.config import settings
+from app.core.telemetry import telemetry
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Optional
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+EMBEDDING_DIM = 1536 # Output size of text-embedding-3-small
+
+
+def embedding_dimensions() -> int:
+    """
+    Vector size the service produces and the collection stores (EMBEDDING_DIMENSIONS, else the model's full size).
+    """
+    return settings.EMBEDDING_DIMENSIONS or EMBEDDING_DIM
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when the embedding provider fails. Callers must not index anything in that case.
+    """
+
+
+class LocalEmbeddings:
+    """
+    Deterministic, network-free embedder (feature hashing of words and word bigrams).
+    Not semantically comparable to OpenAI vectors; meant for offline runs, tests and benchmarks.
+    Exposes the same embed_documents/embed_query interface as LangChain embeddings.
+    """
+    _token_re = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        tokens = self._token_re.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _embed(self, text: str) -> list[float]:
+        vec = [0.0] * self.dim
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vec[index] += sign
+        norm = math.sqrt(sum(v * v for v in vec))
+        if norm == 0:
+            # Keep empty texts away from the zero vector (undefined cosine)
+            vec[0], norm = 1.0, 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class EmbeddingCache:
+    """
+    content-hash -> vector cache: an in-memory LRU in front of an optional SQLite store.
+    Vectors are stored on disk as packed float32, with least-recently-used eviction beyond `max_bytes`.
+    Disk writes (new vectors and access times) are buffered and committed together, every
+    `flush_items` changes or `flush_seconds`, so lookups don't write to disk each time.
+    """
+    def __init__(
+        self,
+        max_items: int = 10000,
+        path: Optional[str] = None,
+        max_bytes: int = settings.EMBEDDING_CACHE_MAX_BYTES,
+        flush_items: int = 256,
+        flush_seconds: float = 5.0
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.flush_items = flush_items
+        self.flush_seconds = flush_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = {} # key -> packed vector, not yet on disk
+        self._touched = {} # key -> access time of disk entries read since the last flush
+        self._flushed_at = time.monotonic()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+            if "accessed" not in columns: # Stores written before eviction existed
+                self._conn.execute("ALTER TABLE embeddings ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                elif key in self._pending:
+                    found[key] = array("f", self._pending[key]).tolist()
+                    self._remember(key, found[key])
+                else:
+                    missing.append(key)
+            if self._conn is not None and missing:
+                # SQLite caps bound parameters, so look up in slices
+                now = time.time()
+                for start in range(0, len(missing), 500):
+                    part = missing[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self._touched[key] = now
+                self._maybe_flush()
+        return found
+
+    def set_many(self, items: dict[str, list[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+                if self._conn is not None:
+                    self._pending[key] = array("f", vector).tobytes()
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        # Caller holds the lock
+        if self._conn is None or not (self._pending or self._touched):
+            return
+        if (
+            len(self._pending) + len(self._touched) >= self.flush_items
+            or time.monotonic() - self._flushed_at >= self.flush_seconds
+        ):
+            self._flush()
+
+    def _flush(self):
+        """
+        Write buffered vectors and access times in one transaction, then evict. Caller holds the lock.
+        """
+        now = time.time()
+        for key, blob in self._pending.items():
+            # A key is a content hash of (model, text): an existing row already holds this vector
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)", (key, blob, now)
+            )
+            if cursor.rowcount > 0:
+                self._total_bytes += len(blob)
+        self._conn.executemany(
+            "UPDATE embeddings SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._touched.items()]
+        )
+        self._pending, self._touched = {}, {}
+        self._evict()
+        self._conn.commit()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self):
+        # Drop least-recently-used vectors until the store fits in max_bytes. Caller holds the lock.
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, length(vector) FROM embeddings ORDER BY accessed ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def flush(self):
+        with self._lock:
+            if self._conn is not None and (self._pending or self._touched):
+                self._flush()
+
 
 class EmbeddingService:
-    def __init__(self):
-        # We use OpenAI Embeddings as the production standard
-        # Ensure OPENAI_API_KEY is in env
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    def __init__(
+        self,
+        backend: str = settings.EMBEDDING_BACKEND,
+        batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        concurrency: int = settings.EMBEDDING_CONCURRENCY,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        self.dimensions = embedding_dimensions()
+        if backend == "local":
+            self.embeddings = LocalEmbeddings(self.dimensions)
+        elif backend == "openai":
+            # We use OpenAI Embeddings as the production standard
+            # Ensure OPENAI_API_KEY is in env
+            # text-embedding-3 models shorten vectors server-side (truncated and re-normalized)
+            self.embeddings = OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS)
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        if cache is None:
+            cache = EmbeddingCache(
+                max_items=settings.EMBEDDING_CACHE_SIZE,
+                path=os.path.join(settings.CACHE_DIR, "embeddings.sqlite3") if settings.CACHE_ENABLED else None,
+                max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES
+            )
+        self.cache = cache
+
+    def _cache_key(self, text: str) -> str:
+        # Vectors from different backends/models/sizes are not interchangeable
+        namespace = f"{self.backend}:{settings.EMBEDDING_MODEL}:"
+        if settings.EMBEDDING_DIMENSIONS:
+            namespace += f"{settings.EMBEDDING_DIMENSIONS}:"
+        return hashlib.sha256((namespace + text).encode("utf-8")).hexdigest()
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        with telemetry.span("embed_batch", items=len(texts), bytes=sum(len(t) for t in texts), backend=self.backend):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                raise EmbeddingError(f"Embedding failed for a batch of {len(texts)} text(s): {e}") from e
+
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed many texts. Identical texts and previously seen texts are served from the cache;
+        the rest are sent in batches of `batch_size`, up to `concurrency` batches at a time.
+        Raises EmbeddingError if the provider fails.
+        """
+        keys = [self._cache_key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in pending:
+                pending[key] = text
+
+        if pending:
+            pending_keys = list(pending)
+            batches = [pending_keys[i:i + self.batch_size] for i in range(0, len(pending_keys), self.batch_size)]
+            if len(batches) == 1 or self.concurrency == 1:
+                results = [self._embed_batch([pending[k] for k in batch]) for batch in batches]
+            else:
+                # Each batch runs in a copy of the caller's context so its span keeps the trace attributes
+                contexts = [copy_context() for _ in batches]
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                    results = list(executor.map(
+                        lambda context, batch: context.run(self._embed_batch, [pending[k] for k in batch]),
+                        contexts, batches
+                    ))
+
+            fresh = {}
+            for batch, batch_vectors in zip(batches, results):
+                fresh.update(zip(batch, batch_vectors))
+            self.cache.set_many(fresh)
+            vectors.update(fresh)
+
+        return [vectors[key] for key in keys]
 
     def get_embedding(self, text: str) -> list[float]:
-        try:
-            return self.embeddings.embed_query(text)
-        except Exception as e:
-            print(f"Embedding Error: {e}")
-            return [0.0] * 1536 # Return zero vector on failure to prevent crash
+        return self.get_embeddings([text])[0]
+
+    def shutdown(self):
+        # Commit buffered cache writes (called by the service registry)
+        self.cache.flush()
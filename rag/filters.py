@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from typing import Optional
+from qdrant_client.http import models
+
+CHUNK_TYPES = ("summary", "raw_text")
+
+
+def _timestamp(value) -> Optional[float]:
+    # Epoch seconds or ISO 8601 (naive times are UTC)
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"Invalid timestamp: {value!r}")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    raise ValueError(f"Invalid timestamp: {value!r}")
+
+
+def _page(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"Invalid page number: {value!r}")
+    return value
+
+
+def _strings(value, field: str) -> list[str]:
+    if value is None:
+        return []
+    values = [value] if isinstance(value, str) else value
+    if not isinstance(values, list) or not all(isinstance(v, str) and v for v in values):
+        raise ValueError(f"'{field}' must be a string or a list of strings")
+    return values
+
+
+class SearchFilter:
+    """
+    Restricts retrieval to a subset of the indexed chunks by their payload:
+    filename(s), chunk type(s), an inclusive page range and an ingestion time window.
+    Page filters only match page-level chunks (summaries have no page).
+    """
+    FIELDS = ("filename", "type", "page_from", "page_to", "ingested_after", "ingested_before")
+
+    def __init__(
+        self,
+        filenames: list[str] = None,
+        types: list[str] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+        ingested_after: Optional[float] = None,
+        ingested_before: Optional[float] = None
+    ):
+        self.filenames = filenames or []
+        self.types = types or []
+        self.page_from = page_from
+        self.page_to = page_to
+        self.ingested_after = ingested_after
+        self.ingested_before = ingested_before
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> Optional["SearchFilter"]:
+        """
+        Parse the `filters` object of a query request. Returns None when nothing is filtered.
+        Raises ValueError on unknown fields or invalid values.
+        """
+        if not data:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError("'filters' must be an object")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter field(s): {', '.join(sorted(unknown))}")
+
+        types = _strings(data.get("type"), "type")
+        invalid = [t for t in types if t not in CHUNK_TYPES]
+        if invalid:
+            raise ValueError(f"Unknown chunk type(s): {', '.join(invalid)} (expected one of {', '.join(CHUNK_TYPES)})")
+        search_filter = cls(
+            filenames=_strings(data.get("filename"), "filename"),
+            types=types,
+            page_from=_page(data.get("page_from")),
+            page_to=_page(data.get("page_to")),
+            ingested_after=_timestamp(data.get("ingested_after")),
+            ingested_before=_timestamp(data.get("ingested_before"))
+        )
+        if search_filter.page_from and search_filter.page_to and search_filter.page_from > search_filter.page_to:
+            raise ValueError("'page_from' must not be greater than 'page_to'")
+        return None if search_filter.is_empty() else search_filter
+
+    def is_empty(self) -> bool:
+        return not (
+            self.filenames or self.types or self.page_from or self.page_to
+            or self.ingested_after is not None or self.ingested_before is not None
+        )
+
+    def to_qdrant(self) -> models.Filter:
+        must = []
+        if self.filenames:
+            must.append(models.FieldCondition(key="filename", match=models.MatchAny(any=self.filenames)))
+        if self.types:
+            must.append(models.FieldCondition(key="type", match=models.MatchAny(any=self.types)))
+        if self.page_from or self.page_to:
+            must.append(models.FieldCondition(key="page", range=models.Range(gte=self.page_from, lte=self.page_to)))
+        if self.ingested_after is not None or self.ingested_before is not None:
+            must.append(models.FieldCondition(
+                key="ingested_at",
+                range=models.Range(gte=self.ingested_after, lte=self.ingested_before)
+            ))
+        return models.Filter(must=must)
+
+    def matches(self, payload: dict) -> bool:
+        """
+        Same semantics as to_qdrant(), for hits that did not come from Qdrant (BM25).
+        """
+        if self.filenames and payload.get("filename") not in self.filenames:
+            return False
+        if self.types and payload.get("type") not in self.types:
+            return False
+        if self.page_from or self.page_to:
+            page = payload.get("page")
+            if not isinstance(page, int):
+                return False
+            if (self.page_from and page < self.page_from) or (self.page_to and page > self.page_to):
+                return False
+        if self.ingested_after is not None or self.ingested_before is not None:
+            ingested_at = payload.get("ingested_at")
+            if not isinstance(ingested_at, (int, float)):
+                return False
+            if self.ingested_after is not None and ingested_at < self.ingested_after:
+                return False
+            if self.ingested_before is not None and ingested_at > self.ingested_before:
+                return False
+        return True
+
@@ -0,0 +1,123 @@
+import threading
+from qdrant_client.http import models
+from app.core.config import settings
+from app.core.telemetry import telemetry
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion
+from app.rag.filters import SearchFilter
+from app.rag.vector_store import VectorStore
+
+
+class HybridRetriever:
+    """
+    Lexical (BM25) + vector (Qdrant) retrieval merged with reciprocal rank fusion.
+    Exact identifiers, names and table values are caught by BM25 even when the embedding misses them.
+    Chunks must be indexed through add_documents so both indexes stay in sync.
+    """
+    def __init__(self, vector_store: VectorStore, bm25: BM25Index = None):
+        self.vector_store = vector_store
+        self.bm25 = bm25 if bm25 is not None else BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        self.enabled = settings.BM25_ENABLED
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        """
+        Rebuild the in-memory BM25 index from the points already in Qdrant (persistent backends).
+        """
+        if self._loaded or not self.enabled:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            offset = None
+            while True:
+                points, offset = self.vector_store.client.scroll(
+                    collection_name=self.vector_store.collection_name,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=["text"],
+                    with_vectors=False
+                )
+                self.bm25.add_many([str(p.id) for p in points], [p.payload.get("text", "") for p in points])
+                if offset is None:
+                    break
+            self._loaded = True
+
+    def warm_up(self):
+        self._ensure_loaded()
+
+    def add_documents(self, texts: list[str], metadatas: list[dict], embeddings: list[list[float]]) -> list[str]:
+        self._ensure_loaded()
+        ids = self.vector_store.add_documents(texts, metadatas, embeddings)
+        if self.enabled:
+            self.bm25.add_many(ids, texts)
+        return ids
+
+    def delete_documents(self, ids: list[str]):
+        """
+        Remove chunks from both indexes.
+        """
+        self._ensure_loaded()
+        self.vector_store.delete(ids)
+        if self.enabled:
+            self.bm25.remove_many(ids)
+
+    def _payloads(self, ids: list[str]) -> dict[str, dict]:
+        records = self.vector_store.client.retrieve(
+            collection_name=self.vector_store.collection_name, ids=ids, with_payload=True
+        )
+        return {str(record.id): record.payload for record in records}
+
+    def _lexical_search(self, query_text: str, candidates: int, search_filter: SearchFilter = None) -> list[tuple[str, float]]:
+        """
+        BM25 hits, restricted to the filter. Scoped searches (e.g. one file) score only the matching
+        chunk IDs; filters matching more than RETRIEVAL_FILTER_MAX_IDS chunks over-fetch and drop
+        out-of-scope hits by payload instead.
+        """
+        if search_filter is None:
+            return self.bm25.search(query_text, limit=candidates)
+        allowed = self.vector_store.matching_ids(search_filter, settings.RETRIEVAL_FILTER_MAX_IDS)
+        if allowed is not None:
+            return self.bm25.search(query_text, limit=candidates, allowed=allowed)
+        hits = self.bm25.search(query_text, limit=candidates * settings.RETRIEVAL_FILTER_OVERFETCH)
+        payloads = self._payloads([doc_id for doc_id, _ in hits]) if hits else {}
+        return [
+            (doc_id, score) for doc_id, score in hits
+            if doc_id in payloads and search_filter.matches(payloads[doc_id])
+        ][:candidates]
+
+    def search(
+        self,
+        query_text: str,
+        query_embedding: list[float],
+        limit: int = 10,
+        search_filter: SearchFilter = None
+    ) -> list[models.ScoredPoint]:
+        """
+        Top `limit` chunks by RRF over the vector and BM25 rankings, both restricted by `search_filter`.
+        Returned points carry the fused score; payloads come from Qdrant.
+        """
+        candidates = max(limit, settings.RETRIEVAL_CANDIDATES)
+        with telemetry.span("vector_search", items=candidates):
+            vector_hits = self.vector_store.search(query_embedding, limit=candidates, search_filter=search_filter)
+        if not self.enabled:
+            return vector_hits[:limit]
+
+        self._ensure_loaded()
+        with telemetry.span("bm25_search", items=candidates):
+            lexical_hits = self._lexical_search(query_text, candidates, search_filter)
+        fused = reciprocal_rank_fusion(
+            [[str(p.id) for p in vector_hits], [doc_id for doc_id, _ in lexical_hits]],
+            k=settings.RRF_K
+        )[:limit]
+
+        payloads = {str(p.id): p.payload for p in vector_hits}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in payloads]
+        if missing:
+            payloads.update(self._payloads(missing))
+
+        return [
+            models.ScoredPoint(id=doc_id, version=0, score=score, payload=payloads[doc_id])
+            for doc_id, score in fused
+            if doc_id in payloads
+        ]
@@ -1,49 +1,266 @@
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from app.core.config import settings
+from app.core.telemetry import telemetry
+from app.rag.embedding import embedding_dimensions
+from app.rag.filters import SearchFilter
+from typing import Optional
+import hashlib
 import uuid
 
+# Namespace for deterministic point IDs (uuid5), so re-indexing a chunk overwrites it
+POINT_NAMESPACE = uuid.UUID("6f1c2a3e-9b1d-4c3f-8a52-0d7e4b9c1f10")
+
+# Payload fields with an index (server mode; embedded Qdrant ignores payload indexes).
+# Every field a SearchFilter can match on is indexed, so scoped searches don't scan the collection.
+PAYLOAD_INDEXES = {
+    "filename": models.PayloadSchemaType.KEYWORD,
+    "doc_hash": models.PayloadSchemaType.KEYWORD,
+    "type": models.PayloadSchemaType.KEYWORD,
+    "page": models.PayloadSchemaType.INTEGER,
+    "ingested_at": models.PayloadSchemaType.FLOAT,
+}
+
+
+def create_client(mode: str = settings.QDRANT_MODE) -> QdrantClient:
+    """
+    Build the Qdrant client for the configured backend.
+    """
+    if mode == "memory":
+        # Lost on restart; fine for the prototype and for tests
+        return QdrantClient(":memory:")
+    if mode == "local":
+        # Embedded mode persisted to disk, no server needed
+        return QdrantClient(path=settings.QDRANT_PATH)
+    if mode == "remote":
+        return QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+    raise ValueError(f"Unknown QDRANT_MODE: {mode}")
+
+
+def quantization_config(mode: str = settings.VECTOR_QUANTIZATION):
+    """
+    Qdrant quantization for VECTOR_QUANTIZATION: int8 scalar (4x smaller, ~lossless with rescoring)
+    or binary (32x smaller; suited to high-dimensional OpenAI embeddings, needs rescoring).
+    """
+    if mode == "none":
+        return None
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown VECTOR_QUANTIZATION: {mode}")
+
+
+def point_id(text: str, metadata: dict) -> str:
+    """
+    Deterministic ID of a chunk from its content: the same text of the same file (and chunk type)
+    maps to the same point across versions, so unchanged chunks are never re-embedded or duplicated.
+    """
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    key = f"{metadata.get('filename', '')}:{metadata.get('type', '')}:{content_hash}"
+    return str(uuid.uuid5(POINT_NAMESPACE, key))
+
+
 class VectorStore:
-    def __init__(self):
-        # Initialize Qdrant Client
-        # For production, utilize settings.QDRANT_HOST. 
-        # For this setup, we use memory mode or local disk if not specified to avoid connection errors if docker isn't up.
-        self.client = QdrantClient(":memory:") # Using memory for immediate "runnable" prototype without external dependency failure
-        self.collection_name = "documents"
+    def __init__(self, client: QdrantClient = None):
+        # QDRANT_MODE selects in-memory, on-disk local path or a remote server.
+        self.client = client if client is not None else create_client()
+        self.collection_name = settings.QDRANT_COLLECTION
+        self.batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        self.vector_size = embedding_dimensions()
+        self.quantization = quantization_config()
+        # Quantization, rescoring and payload indexes only exist on a Qdrant server;
+        # embedded mode does exact float search (and warns about search params)
+        self.server = settings.QDRANT_MODE == "remote"
         self._ensure_collection()
 
     def _ensure_collection(self):
         try:
-            self.client.get_collection(self.collection_name)
+            info = self.client.get_collection(self.collection_name)
         except Exception:
             self.client.create_collection(
                 collection_name=self.collection_name,
-                vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE),
+                vectors_config=models.VectorParams(
+                    size=self.vector_size,
+                    distance=models.Distance.COSINE,
+                    # With quantization the full-precision originals are only read to rescore, so keep them on disk
+                    on_disk=self.quantization is not None
+                ),
+                quantization_config=self.quantization,
             )
+        else:
+            size = info.config.params.vectors.size
+            if size != self.vector_size:
+                raise ValueError(
+                    f"Collection '{self.collection_name}' stores {size}-dim vectors but EMBEDDING_DIMENSIONS "
+                    f"gives {self.vector_size}; use another QDRANT_COLLECTION or re-index."
+                )
+            if self.server and type(info.config.quantization_config) is not type(self.quantization):
+                # Qdrant re-quantizes the stored vectors in the background
+                self.client.update_collection(
+                    self.collection_name,
+                    quantization_config=self.quantization if self.quantization is not None else models.Disabled.DISABLED
+                )
+        if self.server:
+            for field, schema in PAYLOAD_INDEXES.items():
+                # Idempotent on the server
+                self.client.create_payload_index(self.collection_name, field_name=field, field_schema=schema)
 
     def add_document(self, text: str, metadata: dict, embedding: list[float]):
         """
         Add a document chunk with its embedding to the store.
         """
-        point_id = str(uuid.uuid4())
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[
-                models.PointStruct(
-                    id=point_id,
-                    vector=embedding,
-                    payload={"text": text, **metadata}
+        self.add_documents([text], [metadata], [embedding])
+
+    def add_documents(self, texts: list[str], metadatas: list[dict], embeddings: list[list[float]]) -> list[str]:
+        """
+        Bulk-upsert chunks in batches of QDRANT_UPSERT_BATCH_SIZE points.
+        Returns the (deterministic) point IDs in input order.
+        """
+        points = [
+            models.PointStruct(
+                id=point_id(text, metadata),
+                vector=embedding,
+                payload={"text": text, **metadata}
+            )
+            for text, metadata, embedding in zip(texts, metadatas, embeddings)
+        ]
+        for start in range(0, len(points), self.batch_size):
+            batch = points[start:start + self.batch_size]
+            with telemetry.span("vector_upsert", items=len(batch)):
+                self.client.upsert(collection_name=self.collection_name, points=batch)
+        return [point.id for point in points]
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        """
+        The subset of `ids` that are already stored.
+        """
+        existing = set()
+        for start in range(0, len(ids), self.batch_size):
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids[start:start + self.batch_size],
+                with_payload=False,
+                with_vectors=False
+            )
+            existing.update(str(record.id) for record in records)
+        return existing
+
+    def document_points(self, filename: str, fields: list[str]) -> list[models.Record]:
+        """
+        Every point of the document indexed under `filename`, with the requested payload fields.
+        """
+        records, offset = [], None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=models.Filter(
+                    must=[models.FieldCondition(key="filename", match=models.MatchValue(value=filename))]
+                ),
+                limit=1000,
+                offset=offset,
+                with_payload=fields,
+                with_vectors=False
+            )
+            records.extend(points)
+            if offset is None:
+                return records
+
+    def update_payloads(self, ids: list[str], payloads: list[dict]):
+        """
+        Merge new payload fields into existing points (vectors untouched), in batched requests.
+        """
+        operations = [
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point]))
+            for point, payload in zip(ids, payloads)
+        ]
+        for start in range(0, len(operations), self.batch_size):
+            self.client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=operations[start:start + self.batch_size]
+            )
+
+    def delete(self, ids: list[str]):
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            with telemetry.span("vector_delete", items=len(batch)):
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=models.PointIdsList(points=batch)
                 )
-            ]
-        )
 
-    def search(self, query_embedding: list[float], limit: int = 3):
+    def hash_points(self, doc_hash: str) -> list[models.Record]:
+        """
+        Every point with this document content hash (under any filename), with payloads and vectors.
         """
-        Search for similar documents.
+        records, offset = [], None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=models.Filter(
+                    must=[models.FieldCondition(key="doc_hash", match=models.MatchValue(value=doc_hash))]
+                ),
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            records.extend(points)
+            if offset is None:
+                return records
+
+    def has_document(self, doc_hash: str) -> bool:
         """
+        True if chunks of the document with this content hash are already indexed.
+        """
+        count = self.client.count(
+            collection_name=self.collection_name,
+            count_filter=models.Filter(
+                must=[models.FieldCondition(key="doc_hash", match=models.MatchValue(value=doc_hash))]
+            ),
+            exact=False
+        ).count
+        return count > 0
+
+    def matching_ids(self, search_filter: SearchFilter, max_ids: int) -> Optional[set[str]]:
+        """
+        IDs of the points matching the filter, or None if there are more than `max_ids`.
+        """
+        ids, offset = set(), None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=search_filter.to_qdrant(),
+                limit=min(1000, max_ids + 1),
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            ids.update(str(p.id) for p in points)
+            if len(ids) > max_ids:
+                return None
+            if offset is None:
+                return ids
+
+    def search(self, query_embedding: list[float], limit: int = 3, search_filter: SearchFilter = None):
+        """
+        Search for similar documents, optionally restricted by a payload filter.
+        """
+        search_params = None
+        if self.server and self.quantization is not None:
+            # Search the in-RAM quantized vectors, then rescore oversampled candidates with the originals
+            search_params = models.SearchParams(
+                quantization=models.QuantizationSearchParams(
+                    rescore=settings.QUANTIZATION_RESCORE, oversampling=settings.QUANTIZATION_OVERSAMPLING
+                )
+            )
         results = self.client.query_points(
             collection_name=self.collection_name,
             query=query_embedding,
+            query_filter=search_filter.to_qdrant() if search_filter is not None else None,
+            search_params=search_params,
             limit=limit
         ).points
         return results
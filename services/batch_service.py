@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import AsyncIterator, BinaryIO, Optional
+from app.core.config import settings
+from app.services.job_service import Job
+from app.services.pipeline_service import AnalysisPipeline, DocumentRun
+from app.services.upload_service import MULTIPART_OVERHEAD, MultipartReceiver, SpooledUpload, UploadTooLarge
+
+logger = logging.getLogger(__name__)
+
+
+def batch_part_limit(filename: str) -> Optional[int]:
+    """
+    Upload limit for one file of a batch, or None if the file type is not accepted.
+    Zips are bounded by the batch total; their members are checked one by one when read.
+    """
+    lowered = filename.lower()
+    if lowered.endswith(".pdf"):
+        return settings.BATCH_MAX_FILE_BYTES
+    if lowered.endswith(".zip"):
+        return settings.BATCH_MAX_BYTES
+    return None
+
+
+class BatchEntry:
+    """
+    One document of a batch: a PDF saved to disk, or a member of an uploaded zip.
+    Every document is opened from disk by the pipeline: zip members are extracted to their own temp file
+    when the parse stage picks them up, and removed again once the document is done.
+    """
+    def __init__(
+        self,
+        filename: str,
+        path: Optional[str],
+        archive: Optional[zipfile.ZipFile] = None,
+        member: Optional[str] = None,
+        error: Optional[str] = None
+    ):
+        self.filename = filename
+        self.path = path
+        self.archive = archive # Shared, open ZipFile (re-reading the central directory per member is O(n^2))
+        self.member = member
+        self.error = error # Rejected at upload time (reported as a failed document)
+        self.extracted = None # SpooledUpload of a zip member, while its document is in the pipeline
+
+    def checked_path(self) -> str:
+        """
+        Path of a plain PDF entry, opened from disk by the pipeline. Raises ValueError if it is too large.
+        """
+        limit = settings.BATCH_MAX_FILE_BYTES
+        if os.path.getsize(self.path) > limit:
+            raise ValueError(f"File exceeds BATCH_MAX_FILE_BYTES ({limit} bytes)")
+        return self.path
+
+    def extract(self) -> SpooledUpload:
+        """
+        Copy a zip member to a temp file next to its archive (hashed on the way), so it is opened by path
+        instead of being held in memory. Raises ValueError if it is too large: the copy is bounded,
+        as the declared size in a zip header is not trusted.
+        """
+        limit = settings.BATCH_MAX_FILE_BYTES
+        upload = SpooledUpload.create(os.path.basename(self.member), limit, os.path.dirname(self.path))
+        try:
+            with self.archive.open(self.member) as f:
+                upload.copy_from(f)
+        except BaseException:
+            upload.cleanup()
+            raise
+        if upload.too_large:
+            raise ValueError(f"File exceeds BATCH_MAX_FILE_BYTES ({limit} bytes)")
+        self.extracted = upload
+        return upload
+
+    def release(self):
+        # Remove an extracted zip member once its document is done
+        if self.extracted is not None:
+            self.extracted.cleanup()
+            self.extracted = None
+
+
+class BatchUpload:
+    """
+    Uploaded files spooled to a private temp dir; zips are expanded lazily, member by member.
+    """
+    def __init__(self, directory: str, entries: list[BatchEntry], archives: list[zipfile.ZipFile]):
+        self.directory = directory
+        self.entries = entries
+        self.archives = archives
+
+    @classmethod
+    async def receive(cls, content_type: str, stream: AsyncIterator[bytes]) -> "BatchUpload":
+        """
+        Stream the `files` parts of an /analyze/batch request body into a private temp dir.
+        A PDF over BATCH_MAX_FILE_BYTES is dropped as soon as it crosses the limit (reported as a failed document);
+        raises UploadTooLarge once the body passes BATCH_MAX_BYTES, and ValueError for a bad batch.
+        """
+        directory = tempfile.mkdtemp(prefix="batch-")
+        receiver = MultipartReceiver(
+            "files",
+            settings.BATCH_MAX_BYTES + MULTIPART_OVERHEAD,
+            batch_part_limit,
+            max_files=settings.BATCH_MAX_FILES,
+            directory=directory
+        )
+        try:
+            uploads = await receiver.receive(content_type, stream)
+            if not uploads:
+                raise ValueError("No files uploaded (expected PDFs or zips in the 'files' field).")
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return await asyncio.to_thread(cls.from_uploads, directory, uploads)
+
+    @classmethod
+    def from_files(cls, files: list[tuple[str, BinaryIO]]) -> "BatchUpload":
+        """
+        Batch from (filename, file object) pairs, for callers that already hold the files.
+        Same limits as receive(): UploadTooLarge once the files add up to more than BATCH_MAX_BYTES.
+        """
+        directory = tempfile.mkdtemp(prefix="batch-")
+        uploads, total = [], 0
+        try:
+            for index, (filename, fileobj) in enumerate(files):
+                name = filename or f"upload-{index}"
+                limit = batch_part_limit(name)
+                if limit is None:
+                    uploads.append(SpooledUpload(name))
+                    continue
+                remaining = settings.BATCH_MAX_BYTES - total
+                upload = SpooledUpload.create(name, min(limit, remaining), directory).copy_from(fileobj)
+                uploads.append(upload)
+                if upload.too_large and remaining <= limit:
+                    raise UploadTooLarge(f"Batch exceeds BATCH_MAX_BYTES ({settings.BATCH_MAX_BYTES} bytes)")
+                total += upload.size
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return cls.from_uploads(directory, uploads)
+
+    @classmethod
+    def from_uploads(cls, directory: str, uploads: list[SpooledUpload]) -> "BatchUpload":
+        """
+        List the PDFs in files already saved to `directory` (zips are opened, not extracted).
+        Raises ValueError if there are more than BATCH_MAX_FILES documents.
+        """
+        entries, archives = [], []
+        try:
+            for upload in uploads:
+                name = upload.filename
+                if upload.too_large:
+                    if name.lower().endswith(".zip"):
+                        raise UploadTooLarge(f"Batch exceeds BATCH_MAX_BYTES ({settings.BATCH_MAX_BYTES} bytes)")
+                    entries.append(BatchEntry(name, None, error="File exceeds BATCH_MAX_FILE_BYTES."))
+                    continue
+                if upload.path is None:
+                    entries.append(BatchEntry(name, None, error="Only PDF and zip files are supported."))
+                    continue
+                if name.lower().endswith(".pdf"):
+                    entries.append(BatchEntry(name, upload.path))
+                    continue
+                try:
+                    archive = zipfile.ZipFile(upload.path)
+                except zipfile.BadZipFile:
+                    entries.append(BatchEntry(name, None, error="Not a valid zip archive."))
+                    continue
+                archives.append(archive)
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                        continue
+                    member_name = f"{name}/{info.filename}"
+                    if info.file_size > settings.BATCH_MAX_FILE_BYTES:
+                        entries.append(BatchEntry(member_name, None, error="File exceeds BATCH_MAX_FILE_BYTES."))
+                    else:
+                        entries.append(BatchEntry(member_name, upload.path, archive=archive, member=info.filename))
+                if len(entries) > settings.BATCH_MAX_FILES:
+                    break
+            if len(entries) > settings.BATCH_MAX_FILES:
+                raise ValueError(f"Batch has more than {settings.BATCH_MAX_FILES} documents.")
+        except Exception:
+            cls(directory, entries, archives).cleanup()
+            raise
+        return cls(directory, entries, archives)
+
+    def cleanup(self):
+        for archive in self.archives:
+            archive.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def batch_workers() -> dict[str, int]:
+    """
+    Workers per batch stage. Stages are connected by bounded queues, so CPU-bound stages
+    (parse, layout/OCR) and network-bound stages (agents, embedding) work on different documents at once.
+    """
+    return {
+        "parse": settings.BATCH_WORKERS_PARSE,
+        "extract": settings.BATCH_WORKERS_EXTRACT,
+        "agents": settings.BATCH_WORKERS_AGENTS,
+        "embed": settings.BATCH_WORKERS_EMBED,
+        "upsert": settings.BATCH_WORKERS_UPSERT,
+    }
+
+
+async def run_batch(pipeline: AnalysisPipeline, job: Job, upload: BatchUpload) -> dict:
+    """
+    Analyze every document of `upload` through the staged pipeline and return per-document results.
+    A failing document is recorded and dropped; the rest of the batch continues.
+    """
+    workers = batch_workers()
+    stage_names = list(workers)
+    results = [None] * len(upload.entries) # In upload order
+    positions = {} # document job ID -> index in results
+
+    # Each stage returns False when the document is done early (cache hit)
+    async def parse(run: DocumentRun, entry: BatchEntry) -> bool:
+        if entry.archive is None:
+            run.path = await asyncio.to_thread(entry.checked_path)
+        else:
+            extracted = await asyncio.to_thread(entry.extract)
+            run.path, run.doc_hash = extracted.path, extracted.doc_hash
+        if await pipeline.check_cache(run):
+            return False
+        await pipeline.parse(run)
+        return True
+
+    def stage(method):
+        async def call(run: DocumentRun, entry: BatchEntry) -> bool:
+            await method(run)
+            return True
+        return call
+
+    stage_funcs = {
+        "parse": parse,
+        "extract": stage(pipeline.extract),
+        "agents": stage(pipeline.analyze),
+        "embed": stage(pipeline.embed),
+        "upsert": stage(pipeline.upsert),
+    }
+
+    # Progress counts documents; only parse sees all of them (cache hits and failures leave early)
+    for name in stage_names:
+        job.start_stage(name, total=len(upload.entries) if name == "parse" else None)
+
+    def finish(run: DocumentRun, status: str, error: Optional[str] = None, cached: bool = False):
+        run.close()
+        upload.entries[positions[run.job.id]].release()
+        run.job.status = status
+        run.job.error = error
+        results[positions[run.job.id]] = {
+            "filename": run.filename,
+            "status": status,
+            "doc_hash": run.doc_hash,
+            "cached": cached,
+            "error": error,
+            "result": run.final_output if status == "completed" else None,
+        }
+
+    queues = [asyncio.Queue(maxsize=max(1, settings.BATCH_QUEUE_SIZE)) for _ in stage_names]
+
+    async def stage_worker(position: int):
+        name = stage_names[position]
+        inbox = queues[position]
+        outbox = queues[position + 1] if position + 1 < len(queues) else None
+        while True:
+            item = await inbox.get()
+            if item is None:
+                return
+            run, entry = item
+            run.job.status = "running"
+            try:
+                proceed = await stage_funcs[name](run, entry)
+            except Exception as e:
+                logger.exception("Batch document %s failed in %s", run.filename, name)
+                for stage_name, progress in run.job.stages.items():
+                    if progress["status"] == "running":
+                        run.job.finish_stage(stage_name, "failed")
+                job.advance(name)
+                finish(run, "failed", str(e))
+                continue
+            job.advance(name)
+            if not proceed:
+                finish(run, "completed", cached=True)
+            elif outbox is None:
+                finish(run, "completed")
+            else:
+                await outbox.put((run, entry))
+
+    async def produce():
+        for position, entry in enumerate(upload.entries):
+            run = DocumentRun(Job("document", entry.filename, options=job.options), entry.filename, None)
+            positions[run.job.id] = position
+            job.children.append(run.job)
+            if entry.error is not None:
+                job.advance("parse")
+                finish(run, "failed", entry.error)
+                continue
+            await queues[0].put((run, entry))
+
+    tasks = []
+    try:
+        producer = asyncio.create_task(produce())
+        tasks.append(producer)
+        stages = []
+        for position, name in enumerate(stage_names):
+            stages.append([asyncio.create_task(stage_worker(position)) for _ in range(max(1, workers[name]))])
+            tasks.extend(stages[-1])
+        await producer
+        # Drain stage by stage: once every worker of a stage has exited, nothing more reaches the next one
+        for position, stage_tasks in enumerate(stages):
+            for _ in stage_tasks:
+                await queues[position].put(None)
+            await asyncio.gather(*stage_tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Only non-empty if the batch itself was cancelled: close documents still waiting in a queue
+        for queue in queues:
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None:
+                    item[0].close()
+        upload.cleanup()
+
+    for name in stage_names:
+        job.finish_stage(name)
+    results = [r for r in results if r is not None]
+    failed = sum(1 for r in results if r["status"] == "failed")
+    return {
+        "documents": results,
+        "total": len(results),
+        "completed": len(results) - failed,
+        "failed": failed,
+    }
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+from app.core.config import settings
+
+# Bump a stage's version whenever its model, prompt or output format changes:
+# entries written under the old version are simply never read again and age out of the LRU.
+STAGE_VERSIONS = {
+    "analysis": 1, # final_output of the whole pipeline
+    "layout": 1,   # CVService detections per page
+    "ocr": 2,      # OCR text per page and backend (adaptive DPI)
+    "vision": 2,   # VisionAgent insights per region selection
+    "text_summary": 1, # TextAgent section/reduce summaries by content hash
+}
+
+# Settings a stage's per-page output depends on. Their values are hashed into its page keys, so changing one
+# starts a fresh set of entries (layout boxes are in RENDER_DPI pixels; OCR text depends on the retry policy).
+STAGE_SETTINGS = {
+    "layout": ("RENDER_DPI", "CV_IMGSZ"),
+    "ocr": (
+        "RENDER_DPI", "OCR_ADAPTIVE_DPI", "OCR_MIN_CONFIDENCE", "OCR_TARGET_TEXT_HEIGHT", "OCR_MAX_DPI",
+        "OCR_TESSERACT_LANG", "OCR_TESSERACT_CONFIG"
+    ),
+}
+
+
+def settings_digest(stage: str) -> str:
+    """
+    Short hash of the STAGE_SETTINGS values of `stage` ("" if it has none).
+    """
+    names = STAGE_SETTINGS.get(stage)
+    if not names:
+        return ""
+    values = json.dumps([getattr(settings, name) for name in names], default=str)
+    return hashlib.blake2b(values.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Content address of an uploaded document.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    """
+    hash_bytes of a file on disk, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheService:
+    """
+    Disk-backed key/value cache (SQLite) with size-bounded LRU eviction.
+    Values must be JSON-serializable.
+    """
+    def __init__(self, path: str, max_bytes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not enabled:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def document_key(doc_hash: str, stage: str = "analysis") -> str:
+        return f"{stage}:v{STAGE_VERSIONS[stage]}:{doc_hash}"
+
+    @staticmethod
+    def page_key(doc_hash: str, page, stage: str) -> str:
+        digest = settings_digest(stage)
+        version = f"v{STAGE_VERSIONS[stage]}" + (f"-{digest}" if digest else "")
+        return f"{stage}:{version}:{doc_hash}:{page}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        data = json.dumps(value)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time())
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drop least-recently-used entries until the cache fits in max_bytes. Caller holds the lock.
+        """
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def get_page(self, doc_hash: Optional[str], page, stage: str, default: Any = None) -> Any:
+        if not doc_hash:
+            return default
+        return self.get(self.page_key(doc_hash, page, stage), default)
+
+    def set_page(self, doc_hash: Optional[str], page, stage: str, value: Any):
+        if doc_hash:
+            self.set(self.page_key(doc_hash, page, stage), value)
+
+
+# Shared across requests (and agents) like the services in api/routes.py
+analysis_cache = CacheService(
+    path=os.path.join(settings.CACHE_DIR, "analysis.sqlite3"),
+    max_bytes=settings.CACHE_MAX_BYTES,
+    enabled=settings.CACHE_ENABLED
+)
@@ -1,48 +1,105 @@
 from ultralytics import YOLO
 from PIL import Image
+from itertools import islice
+from typing import Callable, Iterable, Optional
+import cv2
 import numpy as np
+from app.core.telemetry import telemetry
 
 class CVService:
-    def __init__(self, model_path: str = 'yolov8n.pt'):
+    def __init__(self, model_path: str = 'yolov8n.pt', imgsz: int = 640):
         # In a real scenario, we would use a fine-tuned doc layout model like 'yolov8-doc-layout'
-        # For this prototype, we'll initialize the standard model. 
+        # For this prototype, we'll initialize the standard model.
         # Ideally, we should load a specifically trained model for document objects (tables, figures).
-        self.model = YOLO(model_path) 
-        
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+
         # Mapping class IDs to names (standard COCO doesn't have 'table', but we simulate the interface)
         # We will assume a custom model interface for the implementation plan.
         self.class_names = {0: 'text_region', 1: 'title', 2: 'table', 3: 'figure', 4: 'list'}
 
+    def letterbox(self, image) -> tuple[np.ndarray, float, tuple[float, float]]:
+        """
+        Resize (keeping aspect ratio) and pad to a square imgsz x imgsz canvas.
+        Every page of a batch goes through here so the model sees one fixed input shape.
+        Returns (canvas, scale, (pad_x, pad_y)) for mapping boxes back to page coordinates.
+        """
+        img_array = np.asarray(image)
+        h, w = img_array.shape[:2]
+        scale = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * scale)), int(round(h * scale))
+        if (new_w, new_h) != (w, h):
+            img_array = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+        pad_x = (self.imgsz - new_w) / 2
+        pad_y = (self.imgsz - new_h) / 2
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        canvas = cv2.copyMakeBorder(img_array, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return canvas, scale, (left, top)
+
+    def _to_elements(self, result, scale: float, pad: tuple[float, float]) -> list[dict]:
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return []
+
+        # Convert whole tensors at once instead of per-box .tolist()/.item() calls
+        xyxy = boxes.xyxy.cpu().numpy()
+        conf = boxes.conf.cpu().numpy().tolist()
+        cls = boxes.cls.cpu().numpy().astype(int).tolist()
+
+        # Undo the letterbox: remove padding, then scale back to page pixels
+        xyxy = (xyxy - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=xyxy.dtype)) / scale
+
+        # For standard YOLOv8n (COCO), classes are things like 'person', 'car'.
+        # To make this "Production Ready" for the challenge without training a custom model
+        # right this second, we will simulate the behavior or mapping.
+        # In a real deployment, we would swap 'yolov8n.pt' with 'path/to/doc-layout-yolo.pt'
+        return [
+            {
+                "type": self.class_names.get(c, 'unknown'),
+                "bbox": bbox,
+                "confidence": score
+            }
+            for bbox, score, c in zip(xyxy.tolist(), conf, cls)
+        ]
+
+    def analyze_layout_batch(
+        self,
+        pages: Iterable,
+        batch_size: int = 8,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> list[list[dict]]:
+        """
+        Detects layout elements on many pages, running the model on fixed-size batches.
+        `pages` may be a lazy iterable of PIL images or RGB arrays; only one batch is held at a time.
+        `progress`, if given, is called with the number of pages finished after each batch.
+        Returns one list of {'type', 'bbox', 'confidence'} dicts per page, in page order.
+        """
+        pages = iter(pages)
+        layouts = []
+        while True:
+            batch = list(islice(pages, batch_size))
+            if not batch:
+                break
+
+            with telemetry.span("layout_batch", pages=len(batch)):
+                letterboxed = [self.letterbox(page) for page in batch]
+                del batch
+                results = self.model(
+                    [canvas for canvas, _, _ in letterboxed],
+                    imgsz=self.imgsz,
+                    verbose=False
+                )
+                for result, (_, scale, pad) in zip(results, letterboxed):
+                    layouts.append(self._to_elements(result, scale, pad))
+            if progress is not None:
+                progress(len(letterboxed))
+        return layouts
+
     def analyze_layout(self, image: Image.Image) -> list[dict]:
         """
         Detects layout elements in the image.
         Returns a list of dicts: {'type': str, 'bbox': [x1, y1, x2, y2], 'confidence': float}
         """
-        # Convert PIL to numpy for YOLO
-        img_array = np.array(image)
-        
-        # Run inference
-        results = self.model(img_array, verbose=False)
-        
-        detected_elements = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                conf = box.conf[0].item()
-                cls = int(box.cls[0].item())
-                
-                # For standard YOLOv8n (COCO), classes are things like 'person', 'car'.
-                # To make this "Production Ready" for the challenge without training a custom model 
-                # right this second, we will simulate the behavior or mapping.
-                # In a real deployment, we would swap 'yolov8n.pt' with 'path/to/doc-layout-yolo.pt'
-                
-                label = self.class_names.get(cls, 'unknown')
-                
-                detected_elements.append({
-                    "type": label,
-                    "bbox": [x1, y1, x2, y2],
-                    "confidence": conf
-                })
-                
-        return detected_elements
+        return self.analyze_layout_batch([image], batch_size=1)[0]
@@ -1,28 +1,251 @@
 import fitz  # PyMuPDF
 import numpy as np
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Union
 from PIL import Image
 import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from app.core.config import settings
+from app.core.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# PyMuPDF renders at 72 DPI unless told otherwise
+DEFAULT_DPI = 72
+
+# MuPDF is not thread-safe; pipeline stages run in worker threads, so every call into fitz goes through this lock
+_fitz_lock = threading.RLock()
+
+
+class RasterCache:
+    """
+    Rendered pages of one document, keyed by (page index, dpi), shared by the stages that rasterize
+    the same page (layout + OCR on scanned pages, several vision crops of one page).
+    At most `budget_bytes` of pixels stay in memory; beyond that the least recently used rasters are
+    spilled to memory-mapped files in a private temp dir, which the OS can page out under pressure.
+    """
+    def __init__(self, budget_bytes: int, spill_dir: Optional[str] = None):
+        self.budget_bytes = max(0, budget_bytes)
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict() # key -> np.ndarray (resident) or np.memmap (spilled)
+        self._resident_bytes = 0
+        self._tmpdir = None
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _lookup(self, key: tuple) -> Optional[np.ndarray]:
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+            return array
+
+    def get_or_render(self, key: tuple, render: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Cached raster for `key`, rendering it at most once even when two stages ask concurrently.
+        """
+        array = self._lookup(key)
+        if array is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                array = self._lookup(key)
+                if array is None:
+                    telemetry.inc("raster_cache_requests_total", result="miss")
+                    return self.put(key, render())
+        telemetry.inc("raster_cache_requests_total", result="hit")
+        return array
+
+    def put(self, key: tuple, array: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            self._entries[key] = array
+            self._resident_bytes += array.nbytes
+            self._spill()
+            return self._entries[key]
+
+    def _spill(self):
+        # Caller holds self._lock
+        for key in list(self._entries):
+            if self._resident_bytes <= self.budget_bytes:
+                break
+            array = self._entries[key]
+            if isinstance(array, np.memmap):
+                continue
+            if self._tmpdir is None:
+                self._tmpdir = tempfile.mkdtemp(prefix="rasters-", dir=self.spill_dir)
+            path = os.path.join(self._tmpdir, f"{key[0]}-{key[1]}.raw")
+            spilled = np.memmap(path, dtype=array.dtype, mode="w+", shape=array.shape)
+            spilled[:] = array
+            spilled.flush()
+            del spilled
+            self._entries[key] = np.memmap(path, dtype=array.dtype, mode="r", shape=array.shape)
+            self._resident_bytes -= array.nbytes
+            telemetry.inc("raster_spilled_bytes_total", array.nbytes)
+
+    def release(self, dpi: Optional[int] = None):
+        """
+        Drop cached rasters (only those at `dpi`, if given) once no remaining stage needs them.
+        """
+        with self._lock:
+            for key in [k for k in self._key_locks if dpi is None or k[1] == dpi]:
+                del self._key_locks[key]
+            for key in [k for k in self._entries if dpi is None or k[1] == dpi]:
+                array = self._entries.pop(key)
+                if isinstance(array, np.memmap):
+                    filename = array.filename
+                    del array
+                    try:
+                        os.remove(filename)
+                    except OSError:
+                        pass
+                else:
+                    self._resident_bytes -= array.nbytes
+
+    def close(self):
+        self.release()
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+
+class PDFPage:
+    """
+    Lazy handle to a single page of an open PDFDocument.
+    Nothing is rasterized until render() is called.
+    """
+    def __init__(self, document: "PDFDocument", index: int):
+        self.document = document
+        self.index = index
+
+    @property
+    def number(self) -> int:
+        return self.index + 1
+
+    def _page(self) -> fitz.Page:
+        return self.document.doc.load_page(self.index)
+
+    def render(self, dpi: int = DEFAULT_DPI, cache: bool = False) -> np.ndarray:
+        """
+        Rasterize the page straight into an RGB uint8 array of shape (H, W, 3).
+        The pixmap samples are wrapped without a PPM encode/decode round trip.
+        With `cache=True` the raster is kept in the document's RasterCache for the next stage
+        that needs this page at this DPI (treat the returned array as read-only).
+        """
+        raster_cache = self.document.raster_cache if cache else None
+        if raster_cache is not None:
+            return raster_cache.get_or_render((self.index, dpi), lambda: self._rasterize(dpi))
+        return self._rasterize(dpi)
+
+    def _rasterize(self, dpi: int) -> np.ndarray:
+        with telemetry.span("rasterize", page=self.number, dpi=dpi, pages=1) as span:
+            with _fitz_lock:
+                pix = self._page().get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+            span.set(bytes=pix.stride * pix.height)
+            # Each access to `samples` copies the raster, so take it once (the array keeps the bytes alive)
+            samples = pix.samples
+        return np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+    def to_image(self, dpi: int = DEFAULT_DPI) -> Image.Image:
+        """
+        Rasterize the page as a PIL Image (for consumers that need one, e.g. JPEG encoding).
+        """
+        return Image.fromarray(self.render(dpi))
+
+    def get_text(self) -> str:
+        """
+        Text layer of this page (empty for scanned pages).
+        """
+        with _fitz_lock:
+            return self._page().get_text()
+
+
+class PDFDocument:
+    """
+    A PDF parsed once and shared by every stage of the pipeline.
+    Pages are yielded lazily, so memory tracks the pages actually used.
+    """
+    def __init__(self, doc: fitz.Document, raster_cache: Optional[RasterCache] = None):
+        self.doc = doc
+        self.raster_cache = raster_cache
+
+    def __len__(self) -> int:
+        return self.doc.page_count
+
+    def __getitem__(self, index: int) -> PDFPage:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Page index {index} out of range")
+        return PDFPage(self, index)
+
+    def __iter__(self) -> Iterator[PDFPage]:
+        for index in range(len(self)):
+            yield PDFPage(self, index)
+
+    def get_text(self) -> str:
+        """
+        Text layer of the whole document, pages separated by blank lines.
+        """
+        return "\n\n".join(page.get_text() for page in self).strip()
+
+    def release_rasters(self, dpi: Optional[int] = None):
+        if self.raster_cache is not None:
+            self.raster_cache.release(dpi)
+
+    def close(self):
+        if self.raster_cache is not None:
+            self.raster_cache.close()
+        with _fitz_lock:
+            self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 
 class IngestionService:
     def __init__(self):
         pass
 
+    def open_document(self, source: Union[bytes, str], raster_budget: Optional[int] = None) -> PDFDocument:
+        """
+        Parse the PDF once and return a lazy document handle.
+        `source` is the PDF bytes or a file path; a path is read from disk on demand by MuPDF
+        and must stay in place until the document is closed.
+        `raster_budget` (bytes) enables a per-document RasterCache that spills to disk beyond it.
+        Raises ValueError if the source is not a readable PDF.
+        """
+        is_path = isinstance(source, str)
+        with telemetry.span("pdf_open", bytes=os.path.getsize(source) if is_path else len(source)) as span:
+            try:
+                with _fitz_lock:
+                    doc = fitz.open(source, filetype="pdf") if is_path else fitz.open(stream=source, filetype="pdf")
+            except Exception as e:
+                # The details (which name the temp file for uploads on disk) stay in the server log
+                logger.warning("Could not open PDF: %s", e)
+                raise ValueError("Could not process PDF.") from None
+            span.set(pages=doc.page_count)
+        raster_cache = RasterCache(raster_budget, settings.RASTER_SPILL_DIR) if raster_budget is not None else None
+        return PDFDocument(doc, raster_cache)
+
     def convert_pdf_to_images(self, pdf_bytes: bytes) -> List[Image.Image]:
         """
         Convert PDF bytes to a list of PIL Images using PyMuPDF (no Poppler required).
+        Prefer open_document() for large files: this materializes every page.
         """
-        images = []
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            for page in doc:
-                pix = page.get_pixmap()
-                img_data = pix.tobytes("ppm")
-                img = Image.open(io.BytesIO(img_data)).convert("RGB")
-                images.append(img)
-            return images
+            with self.open_document(pdf_bytes) as document:
+                return [page.to_image() for page in document]
         except Exception as e:
-            print(f"Error converting PDF to images: {e}")
+            logger.error("Error converting PDF to images: %s", e)
             return []
 
     def load_image(self, file_bytes: bytes) -> Image.Image:
@@ -37,11 +260,8 @@ class IngestionService:
         Returns empty string if failed or no text found.
         """
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text() + "\n\n"
-            return text.strip()
+            with self.open_document(pdf_bytes) as document:
+                return document.get_text()
         except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
+            logger.error("Error extracting text from PDF: %s", e)
             return ""
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from app.core.telemetry import profile
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """
+    Raised by JobManager.submit when the bounded queue has no free slot (backpressure).
+    """
+
+
+class Job:
+    """
+    Status record of one background analysis: overall state plus per-stage/per-page progress.
+    """
+    def __init__(self, kind: str, filename: str, profile: bool = False, options: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.profile = profile # Sample stacks while the job runs (needs PROFILING_ENABLED)
+        self.options = options or {} # Per-request pipeline settings (e.g. ocr_backend)
+        self.profile_path = None
+        self.status = "queued" # queued -> running -> completed | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = OrderedDict()
+        self.result = None
+        self.error = None
+        self.children = [] # Per-document jobs of a batch
+
+    def start_stage(self, name: str, total: Optional[int] = None):
+        self.stages[name] = {"status": "running", "done": 0, "total": total, "started_at": time.time()}
+
+    def advance(self, name: str, count: int = 1):
+        stage = self.stages.get(name)
+        if stage is not None:
+            stage["done"] += count
+
+    def finish_stage(self, name: str, status: str = "completed"):
+        stage = self.stages.get(name)
+        if stage is not None:
+            stage["status"] = status
+            stage["elapsed"] = round(time.time() - stage["started_at"], 3)
+
+    def to_dict(self, include_result: bool = False) -> dict:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "options": self.options,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": {
+                name: {k: v for k, v in stage.items() if k != "started_at"}
+                for name, stage in self.stages.items()
+            },
+            "error": self.error,
+        }
+        if self.children:
+            data["documents"] = [
+                {
+                    "filename": child.filename,
+                    "status": child.status,
+                    "stage": next(reversed(child.stages), None),
+                    "error": child.error,
+                }
+                for child in self.children
+            ]
+        if self.profile_path:
+            data["profile"] = self.profile_path
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """
+    Bounded asyncio job queue drained by a fixed number of worker tasks.
+    `handler(job, payload)` is awaited for each job; its return value becomes job.result.
+    Workers are started lazily on the first submit (an event loop must be running).
+    """
+    def __init__(
+        self,
+        handler: Callable[[Job, Any], Awaitable[Any]],
+        workers: int = 2,
+        max_queue: int = 16,
+        history: int = 1000
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.history = history
+        self._queue = None
+        self._tasks = []
+        self._jobs = OrderedDict()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(
+        self,
+        payload: Any,
+        filename: str,
+        kind: str = "analyze",
+        profile: bool = False,
+        options: Optional[dict] = None
+    ) -> Job:
+        """
+        Enqueue a job and return immediately. Raises JobQueueFull when the queue is at capacity.
+        """
+        self._ensure_workers()
+        job = Job(kind, filename, profile=profile, options=options)
+        try:
+            self._queue.put_nowait((job, payload))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.max_queue} pending)")
+        self._jobs[job.id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def status_counts(self) -> dict[str, int]:
+        counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs; queued/running jobs are always kept
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("completed", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    async def _worker(self):
+        while True:
+            job, payload = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                with profile(f"{job.kind}-{job.id}", enabled=job.profile) as profile_path:
+                    job.profile_path = profile_path
+                    job.result = await self.handler(job, payload)
+                job.status = "completed"
+            except Exception as e:
+                logger.exception("Job %s failed", job.id)
+                job.error = str(e)
+                job.status = "failed"
+                for name, stage in job.stages.items():
+                    if stage["status"] == "running":
+                        job.finish_stage(name, "failed")
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs that never ran: release their spooled uploads
+        while self._queue is not None and not self._queue.empty():
+            _, payload = self._queue.get_nowait()
+            cleanup = getattr(payload, "cleanup", None)
+            if cleanup is not None:
+                cleanup()
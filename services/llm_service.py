@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from app.core.config import settings
+from app.core.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic, network-free chat model for tests and benchmarks.
+    Answers JSON-requesting prompts (the Validation Agent) with a fixed JSON object
+    and everything else with a short digest of the prompt.
+    """
+    model_name: str = "stub"
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: list[BaseMessage]) -> str:
+        prompt = "\n".join(m.content if isinstance(m.content, str) else
+                           " ".join(p.get("text", "") for p in m.content if isinstance(p, dict))
+                           for m in messages)
+        if "JSON object" in prompt:
+            return json.dumps({"confidence_score": 0.5, "validation_notes": "Stub validation."})
+        words = prompt.split()
+        return f"Stub response ({len(words)} words in prompt): " + " ".join(words[-40:])
+
+    def _generate(self, messages, stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for i, word in enumerate(self._reply(messages).split(" ")):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts have no status code
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Seconds the provider asked us to wait (retry-after-ms / retry-after headers), if any.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class _SlotWaiter:
+    """
+    A caller queued for a concurrency slot. `wake` is called (under the gateway lock) once the slot is theirs.
+    """
+    def __init__(self, model: str, wake: Callable[[], None]):
+        self.model = model
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class GatewayModel:
+    """
+    Handle to one model behind the gateway; drop-in for the invoke/ainvoke calls the agents make.
+    """
+    def __init__(self, gateway: "LLMGateway", model: str, temperature: float):
+        self.gateway = gateway
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, messages: list[BaseMessage]) -> AIMessage:
+        return self.gateway.invoke(messages, model=self.model, temperature=self.temperature)
+
+    async def ainvoke(self, messages: list[BaseMessage]) -> AIMessage:
+        return await self.gateway.ainvoke(messages, model=self.model, temperature=self.temperature)
+
+    def astream(self, messages: list[BaseMessage]) -> AsyncIterator[str]:
+        return self.gateway.astream(messages, model=self.model, temperature=self.temperature)
+
+
+class LLMGateway:
+    """
+    Single entry point for chat model calls.
+    - one client per (model, temperature), so HTTP connections are pooled and reused
+    - a global and a per-model concurrency cap (sync and async callers share the same budget and queue, FIFO)
+    - retries on 429/5xx/connection errors with jittered exponential backoff, honouring retry-after
+    """
+    def __init__(
+        self,
+        backend: str = settings.LLM_BACKEND,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        model_concurrency: int = settings.LLM_MODEL_CONCURRENCY,
+        max_retries: int = settings.LLM_MAX_RETRIES
+    ):
+        if backend not in ("openai", "stub"):
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        self.backend = backend
+        self.max_concurrency = max(1, max_concurrency)
+        self.model_concurrency = max(1, model_concurrency)
+        self.max_retries = max(0, max_retries)
+        self._clients = {}
+        self._lock = threading.Lock()
+        # Slots are counted in one place so sync (threads) and async (event loop) callers share the caps;
+        # callers that find no free slot queue up in one FIFO and are handed freed slots in arrival order
+        self._in_flight = {}
+        self._total_in_flight = 0
+        self._waiters = deque()
+
+    def model(self, model: str = settings.LLM_MODEL, temperature: float = 0) -> GatewayModel:
+        return GatewayModel(self, model, temperature)
+
+    def get_client(self, model: str = settings.LLM_MODEL, temperature: float = 0) -> BaseChatModel:
+        key = (model, temperature)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self.backend == "stub":
+                    client = StubChatModel(model_name=model)
+                else:
+                    from langchain_openai import ChatOpenAI
+                    # Retries are handled here (with rate-limit-aware backoff), not in the client
+                    client = ChatOpenAI(model=model, temperature=temperature, max_retries=0, timeout=settings.LLM_TIMEOUT)
+                self._clients[key] = client
+            return client
+
+    def _try_acquire(self, model: str) -> bool:
+        # Caller holds self._lock
+        if self._total_in_flight >= self.max_concurrency or self._in_flight.get(model, 0) >= self.model_concurrency:
+            return False
+        self._total_in_flight += 1
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        return True
+
+    def _grant(self):
+        # Caller holds self._lock. Oldest waiters first; one whose model is at its cap doesn't block
+        # waiters for other models behind it.
+        for waiter in list(self._waiters):
+            if self._total_in_flight >= self.max_concurrency:
+                return
+            if self._try_acquire(waiter.model):
+                self._waiters.remove(waiter)
+                waiter.granted = True
+                waiter.wake()
+
+    def _release(self, model: str):
+        with self._lock:
+            self._total_in_flight -= 1
+            self._in_flight[model] -= 1
+            self._grant()
+
+    def _acquire(self, model: str):
+        with self._lock:
+            # Free slots are always granted to queued waiters first, so taking one here is fair
+            if self._try_acquire(model):
+                return
+            granted = threading.Event()
+            self._waiters.append(_SlotWaiter(model, granted.set))
+        granted.wait()
+
+    async def _aacquire(self, model: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._try_acquire(model):
+                return
+            # Woken from whichever thread releases the slot
+            waiter = _SlotWaiter(model, lambda: loop.call_soon_threadsafe(_resolve, future))
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                # The slot was handed over as the caller went away: pass it on
+                self._release(model)
+            raise
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, settings.LLM_BACKOFF_MAX) + random.uniform(0, 0.25)
+        # Full jitter: spread retries of a burst instead of retrying in lockstep
+        return random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def invoke(self, messages: list[BaseMessage], model: str = settings.LLM_MODEL, temperature: float = 0) -> AIMessage:
+        client = self.get_client(model, temperature)
+        attempt = 0
+        while True:
+            with telemetry.span("llm_slot_wait", model=model):
+                self._acquire(model)
+            try:
+                with telemetry.span("llm_call", model=model, attempt=attempt):
+                    return client.invoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                error_name = type(e).__name__
+                delay = self._backoff(attempt, e)
+            finally:
+                self._release(model)
+            logger.warning("LLM call to %s failed (%s), retry %d in %.2fs", model, error_name, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def ainvoke(self, messages: list[BaseMessage], model: str = settings.LLM_MODEL, temperature: float = 0) -> AIMessage:
+        client = self.get_client(model, temperature)
+        attempt = 0
+        while True:
+            with telemetry.span("llm_slot_wait", model=model):
+                await self._aacquire(model)
+            try:
+                with telemetry.span("llm_call", model=model, attempt=attempt):
+                    return await client.ainvoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                error_name = type(e).__name__
+                delay = self._backoff(attempt, e)
+            finally:
+                self._release(model)
+            logger.warning("LLM call to %s failed (%s), retry %d in %.2fs", model, error_name, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+    async def astream(self, messages: list[BaseMessage], model: str = settings.LLM_MODEL, temperature: float = 0) -> AsyncIterator[str]:
+        """
+        Yield answer text as the model emits it. The call holds one concurrency slot until the
+        stream ends; retries only happen before the first token (a partial answer is never replayed).
+        """
+        client = self.get_client(model, temperature)
+        attempt = 0
+        while True:
+            started = False
+            with telemetry.span("llm_slot_wait", model=model):
+                await self._aacquire(model)
+            try:
+                with telemetry.span("llm_stream", model=model, attempt=attempt) as span:
+                    async for chunk in client.astream(messages):
+                        if chunk.content:
+                            if not started:
+                                span.set(first_token_ms=round((time.perf_counter() - span.start) * 1000, 3))
+                            started = True
+                            yield chunk.content
+                return
+            except Exception as e:
+                if started or attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                error_name = type(e).__name__
+                delay = self._backoff(attempt, e)
+            finally:
+                self._release(model)
+            logger.warning("LLM stream from %s failed (%s), retry %d in %.2fs", model, error_name, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+# Shared by every agent and the query route
+llm_gateway = LLMGateway()
@@ -1,20 +1,376 @@
-import easyocr
 import numpy as np
+import abc
+import logging
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Optional
 from PIL import Image
+from app.core.config import settings
+from app.core.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+OCR_BACKENDS = ("easyocr", "tesseract")
+
+
+class OCRPage:
+    """
+    OCR output of one page: the text, the mean word confidence (0-1, None if nothing was read),
+    the median text line height in pixels and the DPI the page was read at.
+    """
+    def __init__(self, text: str, confidence: Optional[float], text_height: Optional[float], dpi: Optional[int] = None):
+        self.text = text
+        self.confidence = confidence
+        self.text_height = text_height
+        self.dpi = dpi
+
+    def better_than(self, other: "OCRPage") -> bool:
+        if other.confidence is None:
+            return self.confidence is not None
+        return self.confidence is not None and self.confidence >= other.confidence
+
+
+def _weighted_confidence(words: list[tuple[str, float]]) -> Optional[float]:
+    # Mean confidence weighted by word length, so stray punctuation doesn't dominate
+    total = sum(len(text) for text, _ in words)
+    if not total:
+        return None
+    return sum(len(text) * confidence for text, confidence in words) / total
+
+
+class OCRBackend(abc.ABC):
+    """
+    An OCR engine. `read` takes an RGB uint8 array and returns an OCRPage.
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def read(self, image: np.ndarray) -> OCRPage:
+        ...
+
+
+class EasyOCRBackend(OCRBackend):
+    """
+    easyocr (CRAFT detector + CRNN recognizer, torch). Accurate on photos and skewed scans, slow on CPU.
+    """
+    name = "easyocr"
+
+    def __init__(self, lang_list: list[str], gpu: bool = True):
+        import easyocr
+        from easyocr.utils import get_paragraph
+        self.reader = easyocr.Reader(lang_list, gpu=gpu)
+        self._get_paragraph = get_paragraph
+
+    def read(self, image: np.ndarray) -> OCRPage:
+        # Line boxes with confidences, then the same paragraph merge readtext(paragraph=True) does
+        result = self.reader.readtext(image)
+        if not result:
+            return OCRPage("", None, None)
+        heights = [max(p[1] for p in bbox) - min(p[1] for p in bbox) for bbox, _, _ in result]
+        paragraphs = self._get_paragraph(result)
+        return OCRPage(
+            "\n\n".join(text for _, text in paragraphs),
+            _weighted_confidence([(text, prob) for _, text, prob in result]),
+            statistics.median(heights)
+        )
+
+
+class TesseractBackend(OCRBackend):
+    """
+    Tesseract via pytesseract (LSTM engine, needs the tesseract-ocr binary).
+    Several times faster than easyocr on CPU for clean printed scans.
+    """
+    name = "tesseract"
+
+    def __init__(self, lang: str = "eng", config: str = ""):
+        self.pytesseract = load_pytesseract()
+        self.lang = lang
+        self.config = config
+
+    def read(self, image: np.ndarray) -> OCRPage:
+        data = self.pytesseract.image_to_data(
+            Image.fromarray(image), lang=self.lang, config=self.config, output_type=self.pytesseract.Output.DICT
+        )
+        paragraphs = {} # (block, paragraph) -> {line: [words]}
+        words, heights = [], []
+        for i, text in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if confidence < 0 or not text.strip():
+                continue
+            lines = paragraphs.setdefault((data["block_num"][i], data["par_num"][i]), {})
+            lines.setdefault(data["line_num"][i], []).append(text)
+            words.append((text, confidence / 100))
+            heights.append(data["height"][i])
+        if not words:
+            return OCRPage("", None, None)
+        text = "\n\n".join(
+            "\n".join(" ".join(line) for line in lines.values()) for lines in paragraphs.values()
+        )
+        return OCRPage(text, _weighted_confidence(words), statistics.median(heights))
+
+
+def load_pytesseract():
+    """
+    Import pytesseract and make sure the tesseract binary it drives is installed.
+    Raises RuntimeError saying what to install otherwise.
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        raise RuntimeError("The tesseract OCR backend requires the pytesseract package (pip install pytesseract).") from None
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        raise RuntimeError(
+            "The tesseract OCR backend requires the tesseract-ocr binary on PATH "
+            "(apt-get install tesseract-ocr, or brew install tesseract)."
+        ) from None
+    return pytesseract
+
+
+def check_backend(name: str) -> str:
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name} (expected one of {', '.join(OCR_BACKENDS)})")
+    return name
+
+
+def create_backend(name: str, lang_list: list[str], gpu: bool = True) -> OCRBackend:
+    if check_backend(name) == "easyocr":
+        return EasyOCRBackend(lang_list, gpu=gpu)
+    return TesseractBackend(settings.OCR_TESSERACT_LANG, settings.OCR_TESSERACT_CONFIG)
+
+
+# Per-process backends used by OCR pool workers (created on first use, or by the initializer)
+_worker_backends = {}
+_worker_lang_list = None
+_worker_threads = 1
+
+
+def _init_worker(lang_list: list[str], preload: list[str], threads: int = 1):
+    """
+    Pool initializer: cap the worker's thread pools, then load the default backend's models once.
+    """
+    global _worker_lang_list, _worker_threads
+    # The pool already spreads pages over the cores: a full torch (OpenMP/MKL) or Tesseract thread pool
+    # in every worker would mean cores x cores threads. Set before torch is imported, which reads them.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OMP_THREAD_LIMIT"):
+        os.environ[var] = str(threads)
+    _worker_lang_list = lang_list
+    _worker_threads = threads
+    for name in preload:
+        _worker_backend(name)
+
+
+def _worker_backend(name: str) -> OCRBackend:
+    backend = _worker_backends.get(name)
+    if backend is None:
+        backend = _worker_backends[name] = create_backend(name, _worker_lang_list, gpu=False)
+        if name == "easyocr":
+            import torch # Already loaded by easyocr
+            torch.set_num_threads(_worker_threads)
+    return backend
+
+
+def _warm_up_worker() -> int:
+    return os.getpid()
+
+
+def _read_page_worker(backend: str, img_array: np.ndarray) -> tuple[OCRPage, float]:
+    # Timed inside the worker so the span excludes queueing and pickling
+    start = time.perf_counter()
+    page = _worker_backend(backend).read(img_array)
+    return page, time.perf_counter() - start
+
 
 class OCRService:
-    def __init__(self, lang_list: list[str] = ['en']):
-        print("Initializing OCR Engine (this may take a moment)...")
-        self.reader = easyocr.Reader(lang_list)
+    def __init__(self, lang_list: list[str] = ['en'], workers: Optional[int] = None, backend: Optional[str] = None):
+        self.lang_list = lang_list
+        # 0 disables the pool and OCRs in-process; None uses every core, OCR_WORKER_THREADS per worker
+        self.threads = max(1, settings.OCR_WORKER_THREADS)
+        self.workers = max(1, (os.cpu_count() or 1) // self.threads) if workers is None else workers
+        self.backend = check_backend(backend or settings.OCR_BACKEND)
+        self._pool = None
+        self._backends = {}
+        self._backend_lock = threading.Lock()
 
-    def extract_text(self, image: Image.Image) -> str:
+    def backend_name(self, backend: Optional[str] = None) -> str:
+        """
+        Resolve a per-request backend choice (None = the service default / OCR_BACKEND).
+        """
+        return check_backend(backend or self.backend)
+
+    def _backend(self, name: str) -> OCRBackend:
+        # In-process backends, loaded on first use: with a worker pool the parent never needs one
+        backend = self._backends.get(name)
+        if backend is None:
+            with self._backend_lock:
+                backend = self._backends.get(name)
+                if backend is None:
+                    logger.info("Initializing OCR engine %r (this may take a moment)...", name)
+                    backend = self._backends[name] = create_backend(name, self.lang_list)
+        return backend
+
+    @property
+    def reader(self):
+        # The in-process easyocr reader (used for layout-aware extraction)
+        return self._backend("easyocr").reader
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            if self.backend == "tesseract":
+                # Fail here with the reason, rather than with a broken pool when every worker's preload fails
+                load_pytesseract()
+            # "spawn" avoids forking a parent that already holds torch threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.lang_list, [self.backend], self.threads),
+            )
+        return self._pool
+
+    def warm_up(self):
+        """
+        Load the default backend's models before the first request: in every pool worker,
+        or in this process when the pool is disabled.
+        """
+        if self.workers <= 0:
+            self._backend(self.backend)
+            return
+        pool = self._get_pool()
+        futures = [pool.submit(_warm_up_worker) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def read(self, image, backend: Optional[str] = None) -> OCRPage:
+        """
+        OCR one image (page or crop) in this process.
+        """
+        return self._backend(self.backend_name(backend)).read(np.asarray(image))
+
+    def extract_text(self, image: Image.Image, backend: Optional[str] = None) -> str:
         """
         Extract detailed text from an entire image or a crop.
         """
-        img_array = np.array(image)
-        # paragraph=True helps combine lines into coherent blocks, better for detailed extraction
-        result = self.reader.readtext(img_array, detail=0, paragraph=True)
-        return "\n\n".join(result)
+        return self.read(image, backend).text
+
+    def read_batch(
+        self,
+        images: Iterable,
+        backend: Optional[str] = None,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> list[OCRPage]:
+        """
+        OCR many pages on the worker pool. Results are returned in input order.
+        Images are consumed lazily and at most two per worker are in flight,
+        so a generator of rendered pages never materializes the whole document.
+        `progress`, if given, is called with 1 as each page finishes.
+        """
+        name = self.backend_name(backend)
+        pages = []
+
+        def collect(page: OCRPage):
+            pages.append(page)
+            if progress is not None:
+                progress(1)
+
+        if self.workers <= 0:
+            for image in images:
+                with telemetry.span("ocr_page", pages=1, backend=name):
+                    collect(self.read(image, name))
+            return pages
+
+        def collect_future(future):
+            page, seconds = future.result()
+            telemetry.record("ocr_page", seconds, pages=1, backend=name)
+            collect(page)
+
+        pool = self._get_pool()
+        max_in_flight = self.workers * 2
+        in_flight = deque()
+        for image in images:
+            in_flight.append(pool.submit(_read_page_worker, name, np.asarray(image)))
+            if len(in_flight) >= max_in_flight:
+                collect_future(in_flight.popleft())
+        while in_flight:
+            collect_future(in_flight.popleft())
+        return pages
+
+    def extract_text_batch(
+        self,
+        images: Iterable,
+        progress: Optional[Callable[[int], None]] = None,
+        backend: Optional[str] = None
+    ) -> list[str]:
+        return [page.text for page in self.read_batch(images, backend, progress)]
+
+    def retry_dpi(self, page: OCRPage, dpi: int) -> Optional[int]:
+        """
+        DPI to re-read a page at, or None if the first pass is good enough.
+        Only low-confidence pages are retried, at the DPI that scales their text to
+        OCR_TARGET_TEXT_HEIGHT pixels (capped at OCR_MAX_DPI); pages where nothing was
+        read are retried at OCR_MAX_DPI in case the print was too small to detect.
+        """
+        if page.confidence is not None and page.confidence >= settings.OCR_MIN_CONFIDENCE:
+            return None
+        if page.text_height:
+            target = dpi * settings.OCR_TARGET_TEXT_HEIGHT / page.text_height
+        else:
+            target = settings.OCR_MAX_DPI
+        target = min(settings.OCR_MAX_DPI, int(round(target)))
+        # Text already at (or near) a readable size: more pixels won't raise confidence
+        return target if target >= dpi * 1.25 else None
+
+    def read_pages(
+        self,
+        pages: list[Callable[[int], np.ndarray]],
+        dpi: int,
+        backend: Optional[str] = None,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> list[OCRPage]:
+        """
+        OCR pages with adaptive DPI. `pages` are render callables taking a DPI.
+        A fast pass reads every page at `dpi`; with OCR_ADAPTIVE_DPI, only the pages whose
+        confidence is low are re-rendered at a higher DPI (see retry_dpi) and read again,
+        keeping whichever reading is more confident.
+        """
+        if not settings.OCR_ADAPTIVE_DPI:
+            results = self.read_batch((render(dpi) for render in pages), backend, progress)
+            for page in results:
+                page.dpi = dpi
+            return results
+
+        results = self.read_batch((render(dpi) for render in pages), backend)
+        retries = []
+        for index, page in enumerate(results):
+            page.dpi = dpi
+            target = self.retry_dpi(page, dpi)
+            if target is None:
+                if progress is not None:
+                    progress(1)
+            else:
+                retries.append((index, target))
+        if not retries:
+            return results
+
+        with telemetry.span("ocr_refine", pages=len(retries)):
+            rereads = self.read_batch((pages[index](target) for index, target in retries), backend, progress)
+        for (index, target), page in zip(retries, rereads):
+            page.dpi = target
+            if page.better_than(results[index]):
+                results[index] = page
+        logger.debug("OCR re-read %d/%d low-confidence page(s) at higher DPI", len(retries), len(pages))
+        return results
 
     def extract_text_with_layout(self, image: Image.Image) -> list[dict]:
         """
@@ -22,7 +378,7 @@ class OCRService:
         """
         img_array = np.array(image)
         result = self.reader.readtext(img_array)
-        
+
         structured_text = []
         for (bbox, text, prob) in result:
             # bbox is [[x1,y1], [x2,y1], [x2,y2], [x1,y2]]
@@ -30,11 +386,11 @@ class OCRService:
             y1 = min([p[1] for p in bbox])
             x2 = max([p[0] for p in bbox])
             y2 = max([p[1] for p in bbox])
-            
+
             structured_text.append({
                 "text": text,
                 "bbox": [x1, y1, x2, y2],
                 "confidence": prob
             })
-            
+
         return structured_text
@@ -0,0 +1,420 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+from app.core.config import settings
+from app.services.cache_service import CacheService, analysis_cache, hash_bytes, hash_file
+from app.core.telemetry import telemetry, trace_context
+from app.services.ingestion_service import PDFDocument
+from app.rag.chunking import chunk_pages
+from app.rag.document_registry import DocumentRegistry, IndexPlan
+
+logger = logging.getLogger(__name__)
+
+
+def stage_limits() -> dict[str, int]:
+    """
+    Max number of documents allowed in each stage at once, across all jobs.
+    """
+    return {
+        "parse": settings.STAGE_CONCURRENCY_PARSE,
+        "layout": settings.STAGE_CONCURRENCY_LAYOUT,
+        "ocr": settings.STAGE_CONCURRENCY_OCR,
+        "agents": settings.STAGE_CONCURRENCY_AGENTS,
+        "index": settings.STAGE_CONCURRENCY_INDEX,
+    }
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, dropped once nobody holds or waits for it.
+    acquire() returns the release function, so a lock can be held across pipeline stages.
+    """
+    def __init__(self):
+        self._locks = {} # key -> [lock, holders and waiters]
+
+    def _drop(self, key: str, entry: list):
+        entry[1] -= 1
+        if entry[1] == 0 and self._locks.get(key) is entry:
+            del self._locks[key]
+
+    async def acquire(self, key: str) -> Callable[[], None]:
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._drop(key, entry)
+            raise
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                entry[0].release()
+                self._drop(key, entry)
+        return release
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        release = await self.acquire(key)
+        try:
+            yield
+        finally:
+            release()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class AnalysisPipeline:
+    """
+    The /analyze pipeline: parse -> layout + OCR -> agents -> index.
+    CPU/blocking stages run in worker threads (never on the event loop), and each stage is
+    guarded by its own semaphore so concurrent jobs cannot oversubscribe models or providers.
+    """
+    def __init__(
+        self,
+        ingestion_service,
+        cv_service,
+        ocr_service,
+        embed_service,
+        vector_store,
+        retriever,
+        graph,
+        cache: CacheService = analysis_cache,
+        limits: Optional[dict[str, int]] = None
+    ):
+        self.ingestion_service = ingestion_service
+        self.cv_service = cv_service
+        self.ocr_service = ocr_service
+        self.embed_service = embed_service
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.graph = graph
+        self.cache = cache
+        self.documents = DocumentRegistry(vector_store)
+        # Held by a document from planning its index update to committing it: plans of the same filename
+        # computed side by side would each delete the other's chunks as stale
+        self.index_locks = KeyedLocks()
+        self.semaphores = {
+            stage: asyncio.Semaphore(max(1, limit))
+            for stage, limit in (limits or stage_limits()).items()
+        }
+
+    def _text_layer(self, document: PDFDocument) -> tuple[list[str], list[int]]:
+        # Digital text per page, and the pages without one (scanned pages) that need OCR
+        page_texts = [page.get_text() for page in document]
+        scanned = [i for i, text in enumerate(page_texts) if len(text.strip()) < settings.OCR_MIN_PAGE_CHARS]
+        logger.debug("%d digital page(s), %d page(s) need OCR", len(document) - len(scanned), len(scanned))
+        return page_texts, scanned
+
+    def _detect_layout(self, document: PDFDocument, doc_hash: str, job, shared: set[int]) -> list[list[dict]]:
+        # Per-page results are cached, so only pages without a cached layout are rendered
+        layout = [self.cache.get_page(doc_hash, i, "layout") for i in range(len(document))]
+        missing = [i for i, page_layout in enumerate(layout) if page_layout is None]
+        job.start_stage("layout", total=len(document))
+        job.advance("layout", len(document) - len(missing))
+        if missing:
+            with telemetry.span("layout", pages=len(missing)):
+                detected = self.cv_service.analyze_layout_batch(
+                    # Pages OCR will also rasterize go through the document's raster cache
+                    (document[i].render(dpi=settings.RENDER_DPI, cache=i in shared) for i in missing),
+                    batch_size=settings.CV_BATCH_SIZE,
+                    progress=lambda n: job.advance("layout", n)
+                )
+            for i, page_layout in zip(missing, detected):
+                layout[i] = page_layout
+                self.cache.set_page(doc_hash, i, "layout", page_layout)
+        job.finish_stage("layout")
+        return layout
+
+    def _extract_text(
+        self,
+        document: PDFDocument,
+        doc_hash: str,
+        job,
+        page_texts: list[str],
+        scanned: list[int],
+        backend: Optional[str] = None
+    ) -> list[str]:
+        # Hybrid per page: use the digital text layer where a page has one,
+        # and OCR only the pages without it (scanned pages) on the worker pool.
+        page_texts = list(page_texts)
+        backend = self.ocr_service.backend_name(backend)
+        job.start_stage("ocr", total=len(scanned))
+        to_ocr = []
+        for i in scanned:
+            cached_text = self.cache.get_page(doc_hash, f"{backend}:{i}", "ocr")
+            if cached_text is None:
+                to_ocr.append(i)
+            else:
+                page_texts[i] = cached_text
+                job.advance("ocr")
+        if to_ocr:
+            # The fast pass reuses the RENDER_DPI rasters cached for layout detection;
+            # higher-DPI re-renders of low-confidence pages are used once and not cached
+            renderers = [
+                lambda dpi, page=document[i]: page.render(dpi=dpi, cache=dpi == settings.RENDER_DPI)
+                for i in to_ocr
+            ]
+            with telemetry.span("ocr", pages=len(to_ocr), backend=backend):
+                ocr_results = self.ocr_service.read_pages(
+                    renderers, settings.RENDER_DPI, backend, progress=lambda n: job.advance("ocr", n)
+                )
+            for i, result in zip(to_ocr, ocr_results):
+                page_texts[i] = result.text
+                self.cache.set_page(doc_hash, f"{backend}:{i}", "ocr", result.text)
+        job.finish_stage("ocr")
+        return page_texts
+
+    def _chunks(self, filename: str, final_output: dict, page_texts: list[str]) -> tuple[list[str], list[dict]]:
+        texts, metadatas = [], []
+
+        # Index the SUMMARY
+        final_summary = final_output.get("summary", "")
+        if final_summary:
+            logger.debug("Indexing summary of length %d", len(final_summary))
+            texts.append(final_summary)
+            metadatas.append({"filename": filename, "type": "summary"})
+
+        # Index the RAW TEXT, chunked per page on paragraph boundaries so a revised page
+        # only changes (and re-embeds) its own chunks
+        for chunk_index, (text, page) in enumerate(chunk_pages(page_texts, settings.CHUNK_MAX_CHARS)):
+            texts.append(text)
+            metadatas.append({"filename": filename, "type": "raw_text", "chunk_index": chunk_index, "page": page})
+        return texts, metadatas
+
+    def _plan_index(self, filename: str, doc_hash: str, final_output: dict, page_texts: list[str]) -> IndexPlan:
+        texts, metadatas = self._chunks(filename, final_output, page_texts)
+        return self.documents.plan(filename, doc_hash, texts, metadatas)
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        # One batched (and cached) embedding call for the new chunks of the document
+        with telemetry.span("embed", items=len(texts)):
+            return self.embed_service.get_embeddings(texts)
+
+    def _commit_index(self, plan: IndexPlan, embeddings: list[list[float]]):
+        # Upsert new chunks (Qdrant + BM25), restamp unchanged ones, delete stale ones
+        with telemetry.span("index", items=len(plan.ids)):
+            self.documents.commit(plan, embeddings, self.retriever)
+
+    # Stages. Each takes the DocumentRun of one document and fills in its next fields;
+    # run() chains them for a single upload, services.batch_service connects them with queues.
+
+    async def check_cache(self, run: "DocumentRun") -> bool:
+        """
+        Hash the upload (unless hashed while it was received); True (with run.final_output set)
+        if it was already analyzed and indexed.
+        """
+        # Content-addressed cache: identical uploads skip the whole pipeline
+        run.job.start_stage("cache")
+        if run.doc_hash is None:
+            with telemetry.span("document_hash", bytes=run.size()):
+                if run.path is not None:
+                    run.doc_hash = await asyncio.to_thread(hash_file, run.path)
+                else:
+                    run.doc_hash = await asyncio.to_thread(hash_bytes, run.contents)
+        with run.trace():
+            cached_output = await asyncio.to_thread(self.cache.get, CacheService.document_key(run.doc_hash))
+            if cached_output is not None and await asyncio.to_thread(self.vector_store.has_document, run.doc_hash):
+                logger.info("Cache hit for document %s, skipping analysis and indexing.", run.doc_hash[:12])
+                # Same bytes under a new filename: index the existing chunks under that name too
+                async with self.index_locks.hold(run.filename), self.semaphores["index"]:
+                    with telemetry.span("index_copy"):
+                        await asyncio.to_thread(self.documents.copy, run.doc_hash, run.filename, self.retriever)
+                run.job.finish_stage("cache", "hit")
+                run.final_output = cached_output
+                return True
+        run.job.finish_stage("cache", "miss")
+        return False
+
+    async def parse(self, run: "DocumentRun"):
+        """
+        1. Ingestion (parse once, rasterize pages lazily). Raises ValueError if the PDF cannot be read.
+        """
+        job = run.job
+        job.start_stage("parse")
+        with run.trace():
+            async with self.semaphores["parse"]:
+                # Uploads on disk are opened by path rather than read into memory
+                document = await asyncio.to_thread(
+                    self.ingestion_service.open_document,
+                    run.path if run.path is not None else run.contents,
+                    settings.RASTER_MEMORY_BUDGET
+                )
+        if len(document) == 0:
+            document.close()
+            raise ValueError("Could not process PDF: no pages.")
+        run.document = document
+        run.contents = None # The parsed document is all later stages need
+        job.stages["parse"]["total"] = job.stages["parse"]["done"] = len(document)
+        job.finish_stage("parse")
+
+    async def extract(self, run: "DocumentRun"):
+        """
+        2. CV Analysis and 3. OCR Analysis. They are independent, so they overlap.
+        Scanned pages are needed by both, so each is rasterized once and shared via the raster cache.
+        """
+        document, doc_hash, job = run.document, run.doc_hash, run.job
+        with run.trace():
+            text_layer, scanned = await asyncio.to_thread(self._text_layer, document)
+
+            async def detect_layout():
+                async with self.semaphores["layout"]:
+                    return await asyncio.to_thread(self._detect_layout, document, doc_hash, job, set(scanned))
+
+            async def extract_text():
+                async with self.semaphores["ocr"]:
+                    return await asyncio.to_thread(
+                        self._extract_text, document, doc_hash, job, text_layer, scanned, job.options.get("ocr_backend")
+                    )
+
+            run.layout, page_texts = await asyncio.gather(detect_layout(), extract_text())
+        # No later stage uses RENDER_DPI rasters (the Vision Agent renders its own crops)
+        document.release_rasters(settings.RENDER_DPI)
+        run.page_texts = page_texts
+        run.ocr_text = "\n\n".join(text.strip() for text in page_texts if text.strip())
+
+    async def analyze(self, run: "DocumentRun"):
+        """
+        4. Agentic Workflow. Closes the document once the agents are done with its pages.
+        """
+        document = run.document
+        try:
+            # Pages are passed as lazy handles: the Vision Agent renders only the pages/regions it sends.
+            # The document (and its raster cache) is closed as soon as the agents are done with them.
+            initial_state = {
+                "file_path": run.filename,
+                "doc_hash": run.doc_hash,
+                "images": list(document),
+                "detected_layout": run.layout, # One list of detections per page
+                "ocr_text": run.ocr_text,
+                "page_texts": run.page_texts,
+                "vision_insights": "",
+                "text_insights": "",
+                "fusion_result": "",
+                "jit_confidence_score": 0.0,
+                "validation_notes": "",
+                "final_output": {}
+            }
+
+            run.job.start_stage("agents")
+            with run.trace():
+                async with self.semaphores["agents"]:
+                    # Vision and Text nodes run concurrently on the event loop
+                    with telemetry.span("agents", pages=len(document)):
+                        result = await self.graph.ainvoke(initial_state)
+            run.job.finish_stage("agents")
+        finally:
+            run.close()
+        run.final_output = result.get("final_output", {})
+
+    async def embed(self, run: "DocumentRun"):
+        """
+        5a. RAG Indexing: chunk the summary and text, and embed the chunks not already indexed
+        (chunk IDs are content hashes, so unchanged chunks of a re-uploaded file are skipped).
+        """
+        with run.trace():
+            # Released by upsert() once the plan is committed (or by run.close() if the document fails first)
+            run.index_lock = await self.index_locks.acquire(run.filename)
+            async with self.semaphores["index"]:
+                run.plan = await asyncio.to_thread(
+                    self._plan_index, run.filename, run.doc_hash, run.final_output, run.page_texts
+                )
+                run.job.start_stage("index", total=len(run.plan.new_texts))
+                if run.plan.new_texts:
+                    run.embeddings = await asyncio.to_thread(self._embed, run.plan.new_texts)
+
+    async def upsert(self, run: "DocumentRun"):
+        """
+        5b. RAG Indexing: apply the plan to the vector store and BM25, then cache the result.
+        """
+        with run.trace():
+            try:
+                async with self.semaphores["index"]:
+                    await asyncio.to_thread(self._commit_index, run.plan, run.embeddings or [])
+            finally:
+                run.release_index()
+        run.job.advance("index", len(run.plan.new_texts))
+        run.job.finish_stage("index")
+        run.plan = run.embeddings = None
+
+        # Failed validations are not cached so the next upload retries them
+        if "error" not in run.final_output:
+            await asyncio.to_thread(self.cache.set, CacheService.document_key(run.doc_hash), run.final_output)
+
+    async def run(
+        self,
+        job,
+        contents: Optional[bytes] = None,
+        path: Optional[str] = None,
+        doc_hash: Optional[str] = None
+    ) -> dict:
+        """
+        Analyze one PDF for `job` and return its final_output.
+        The PDF is `contents` or the file at `path` (left in place; the caller removes it).
+        Raises ValueError if the PDF cannot be read.
+        """
+        run = DocumentRun(job, job.filename, contents, path=path, doc_hash=doc_hash)
+        try:
+            if await self.check_cache(run):
+                return run.final_output
+            # Every span below carries the document and job IDs
+            with run.trace(), telemetry.span("analyze", bytes=run.size()) as span:
+                for stage in (self.parse, self.extract, self.analyze, self.embed, self.upsert):
+                    await stage(run)
+                span.set(pages=job.stages["parse"]["total"])
+            return run.final_output
+        finally:
+            run.close()
+
+
+class DocumentRun:
+    """
+    One document moving through the pipeline stages: its input (bytes or a file path),
+    intermediate results and progress (`job`).
+    """
+    def __init__(
+        self,
+        job,
+        filename: str,
+        contents: Optional[bytes],
+        path: Optional[str] = None,
+        doc_hash: Optional[str] = None
+    ):
+        self.job = job
+        self.filename = filename
+        self.contents = contents
+        self.path = path
+        self.doc_hash = doc_hash
+        self.document = None
+        self.layout = None
+        self.page_texts = []
+        self.ocr_text = ""
+        self.final_output = None
+        self.plan = None
+        self.embeddings = None
+        self.index_lock = None # Release function of the filename's index lock, while held
+
+    def size(self) -> int:
+        if self.path is not None:
+            return os.path.getsize(self.path)
+        return len(self.contents) if self.contents is not None else 0
+
+    def trace(self):
+        # Spans opened inside carry the document and job IDs
+        return trace_context(doc_id=self.doc_hash[:16] if self.doc_hash else None, job_id=self.job.id)
+
+    def release_index(self):
+        if self.index_lock is not None:
+            self.index_lock()
+            self.index_lock = None
+
+    def close(self):
+        self.release_index()
+        if self.document is not None:
+            self.document.close()
+            self.document = None
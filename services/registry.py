@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """
+    Lazily constructed, process-wide services.
+    Nothing is built at import time: each service is created on first get() (or by warm_up),
+    so a worker that only answers /query never loads YOLO or easyocr.
+    Load state per service (not_loaded -> loading -> ready | failed) backs the /ready probe.
+    """
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._status = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """
+        `factory` builds the service; it may get() its dependencies.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+            self._status[name] = {"state": "not_loaded"}
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str) -> Any:
+        """
+        Return the service, building it on first use. Raises whatever the factory raised
+        (and the next call retries the load).
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"Unknown service: {name}")
+
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+            self._status[name] = {"state": "loading", "started_at": time.time()}
+            start = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                logger.exception("Loading service %r failed", name)
+                self._status[name] = {"state": "failed", "error": f"{type(e).__name__}: {e}"}
+                raise
+            self._instances[name] = instance
+            self._status[name] = {"state": "ready", "load_seconds": round(time.perf_counter() - start, 3)}
+            logger.info("Loaded service %r in %ss", name, self._status[name]["load_seconds"])
+            return instance
+
+    async def aget(self, name: str) -> Any:
+        """
+        get() for async callers: a first-time load runs in a worker thread, off the event loop.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        return await asyncio.to_thread(self.get, name)
+
+    def warm_up(self, names: Iterable[str]):
+        """
+        Load the named services and call their warm_up() if they have one
+        (start the OCR pool, rebuild BM25 from Qdrant). Failures are recorded, not raised.
+        """
+        for name in names:
+            try:
+                instance = self.get(name)
+                warm_up = getattr(instance, "warm_up", None)
+                if callable(warm_up):
+                    warm_up()
+            except Exception as e:
+                logger.warning("Warm-up of %r failed: %s", name, e)
+
+    def status(self) -> dict[str, dict]:
+        return {name: dict(status) for name, status in self._status.items()}
+
+    def ready(self, names: Iterable[str]) -> bool:
+        return all(self._status.get(name, {}).get("state") == "ready" for name in names)
+
+    def shutdown(self):
+        """
+        Release resources held by loaded services (e.g. the OCR process pool).
+        """
+        for name, instance in list(self._instances.items()):
+            close = getattr(instance, "shutdown", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning("Shutdown of %r failed: %s", name, e)
+
+
+# Factories import their modules lazily so heavy dependencies (torch, ultralytics, easyocr)
+# are only imported by processes that actually use them.
+
+def _ingestion():
+    from app.services.ingestion_service import IngestionService
+    return IngestionService()
+
+def _cv():
+    from app.services.cv_service import CVService
+    return CVService(imgsz=settings.CV_IMGSZ)
+
+def _ocr():
+    from app.services.ocr_service import OCRService
+    return OCRService(workers=settings.OCR_WORKERS)
+
+def _embedding():
+    from app.rag.embedding import EmbeddingService
+    return EmbeddingService()
+
+def _vector_store():
+    from app.rag.vector_store import VectorStore
+    return VectorStore()
+
+def _retriever():
+    from app.rag.retriever import HybridRetriever
+    return HybridRetriever(registry.get("vector_store"))
+
+def _graph():
+    from app.agents.graph import build_graph
+    return build_graph()
+
+def _pipeline():
+    from app.services.pipeline_service import AnalysisPipeline
+    return AnalysisPipeline(
+        registry.get("ingestion"),
+        registry.get("cv"),
+        registry.get("ocr"),
+        registry.get("embedding"),
+        registry.get("vector_store"),
+        registry.get("retriever"),
+        registry.get("graph")
+    )
+
+
+registry = ServiceRegistry()
+registry.register("ingestion", _ingestion)
+registry.register("cv", _cv)
+registry.register("ocr", _ocr)
+registry.register("embedding", _embedding)
+registry.register("vector_store", _vector_store)
+registry.register("retriever", _retriever)
+registry.register("graph", _graph)
+registry.register("pipeline", _pipeline)
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, Callable, Optional
+from app.core.config import settings
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError: # python-multipart < 0.0.13
+    from multipart import MultipartParser
+    from multipart.multipart import parse_options_header
+
+# Allowance for the multipart framing (boundaries, part headers) around the files themselves
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class SpooledUpload:
+    """
+    One uploaded file written to a named temp file as its bytes arrive, hashed on the way.
+    The pipeline opens it by path, so the document is never held in memory as bytes.
+    `path` is None when the file was not kept: its type is not accepted, or it grew past `limit`
+    (`too_large`). The job that owns the file calls cleanup() when it is done.
+    """
+    def __init__(self, filename: str, path: Optional[str] = None, limit: Optional[int] = None):
+        self.filename = filename
+        self.path = path
+        self.limit = limit
+        self.size = 0
+        self.too_large = False
+        self.doc_hash = None # sha256, same content address as cache_service.hash_bytes; set by finish()
+        self._digest = hashlib.sha256()
+        self._file = open(path, "wb") if path is not None else None
+
+    @classmethod
+    def create(cls, filename: str, limit: Optional[int] = None, directory: Optional[str] = None) -> "SpooledUpload":
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        suffix = os.path.splitext(filename)[1].lower()
+        fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix, dir=directory)
+        os.close(fd)
+        return cls(filename, path, limit)
+
+    def write(self, data: bytes):
+        if self.path is None:
+            return
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            # Dropped as soon as it crosses the limit; the rest of its bytes are discarded
+            self.too_large = True
+            self.cleanup()
+            self.path = None
+            return
+        self._digest.update(data)
+        self._file.write(data)
+
+    def copy_from(self, fileobj: BinaryIO) -> "SpooledUpload":
+        """
+        write() a file object in UPLOAD_CHUNK_BYTES chunks, stopping early once it is too large.
+        """
+        while self.path is not None:
+            chunk = fileobj.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.write(chunk)
+        return self.finish()
+
+    def finish(self) -> "SpooledUpload":
+        if self._file is not None:
+            self._file.close()
+        if self.path is not None:
+            self.doc_hash = self._digest.hexdigest()
+        return self
+
+    def cleanup(self):
+        if self._file is not None:
+            self._file.close()
+        if self.path is None:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MultipartReceiver:
+    """
+    Streams a multipart/form-data request body straight to disk, without buffering it first.
+    File parts of `field` become SpooledUploads in `directory`; other parts are discarded.
+    Sizes are checked on every chunk as it arrives: a file over `part_limit(filename)` is dropped
+    (None from part_limit: not kept at all), and a body over `max_bytes` raises UploadTooLarge
+    right away, before the rest is received. One instance per request.
+    """
+    def __init__(
+        self,
+        field: str,
+        max_bytes: int,
+        part_limit: Callable[[str], Optional[int]],
+        max_files: int,
+        directory: Optional[str] = None
+    ):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.part_limit = part_limit
+        self.max_files = max_files
+        self.directory = directory
+        self.uploads = []
+        self._pending = [] # (upload, bytes) to write, (upload, None) to finish; flushed per chunk
+        self._current = None
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_begin(self):
+        self._current = None
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name, filename = options.get(b"name"), options.get(b"filename")
+        if name is None or name.decode("utf-8", "replace") != self.field or filename is None:
+            return
+        if len(self.uploads) >= self.max_files:
+            raise ValueError(f"Too many files (at most {self.max_files}).")
+        filename = filename.decode("utf-8", "replace")
+        limit = self.part_limit(filename)
+        upload = SpooledUpload(filename) if limit is None else SpooledUpload.create(filename, limit, self.directory)
+        self.uploads.append(upload)
+        self._current = upload if upload.path is not None else None
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._current is not None:
+            self._pending.append((self._current, data[start:end]))
+
+    def on_part_end(self):
+        if self._current is not None:
+            self._pending.append((self._current, None))
+        self._current = None
+
+    def _flush(self):
+        for upload, data in self._pending:
+            if data is None:
+                upload.finish()
+            else:
+                upload.write(data)
+        self._pending = []
+
+    async def receive(self, content_type: str, stream: AsyncIterator[bytes]) -> list[SpooledUpload]:
+        """
+        Raises UploadTooLarge past `max_bytes` and ValueError for a malformed body;
+        either way every file written so far is removed.
+        """
+        content, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if content != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected a multipart/form-data body.")
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        })
+        received = 0
+        try:
+            async for chunk in stream:
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise UploadTooLarge(f"Request body exceeds {self.max_bytes} bytes")
+                parser.write(chunk) # Parse errors are ValueErrors
+                if self._pending:
+                    # Disk writes and hashing off the event loop
+                    await asyncio.to_thread(self._flush)
+            parser.finalize()
+            if any(upload.path is not None and upload.doc_hash is None for upload in self.uploads):
+                raise ValueError("Malformed multipart body: unexpected end of data")
+        except BaseException:
+            for upload in self.uploads:
+                upload.cleanup()
+            raise
+        return self.uploads
+
+
+def pdf_part_limit(filename: str) -> Optional[int]:
+    return settings.UPLOAD_MAX_BYTES if filename.lower().endswith(".pdf") else None
+
+
+async def receive_pdf(content_type: str, stream: AsyncIterator[bytes]) -> SpooledUpload:
+    """
+    The PDF in the `file` field of an /analyze request, on disk.
+    Raises UploadTooLarge over UPLOAD_MAX_BYTES and ValueError if there is no PDF.
+    """
+    receiver = MultipartReceiver(
+        "file", settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD, pdf_part_limit, max_files=1, directory=settings.UPLOAD_DIR
+    )
+    uploads = await receiver.receive(content_type, stream)
+    if not uploads:
+        raise ValueError("No file uploaded (expected a PDF in the 'file' field).")
+    upload = uploads[0]
+    if upload.too_large:
+        raise UploadTooLarge(f"File exceeds UPLOAD_MAX_BYTES ({settings.UPLOAD_MAX_BYTES} bytes)")
+    if upload.path is None:
+        raise ValueError("Only PDF files are supported.")
+    return upload
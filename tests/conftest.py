@@ -0,0 +1,17 @@
+import os
+import sys
+import types
+
+# The repository root is the `app` package (imported as app.*), as in the Docker image
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "app" not in sys.modules:
+    package = types.ModuleType("app")
+    package.__path__ = [ROOT]
+    sys.modules["app"] = package
+
+# Offline defaults: no network, no on-disk caches or indexes
+os.environ.setdefault("CACHE_ENABLED", "false")
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("QDRANT_MODE", "memory")
+os.environ.setdefault("WARMUP_SERVICES", "[]")
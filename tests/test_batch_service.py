@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+import zipfile
+import pytest
+from app.core.config import settings
+from app.services.batch_service import BatchUpload
+from app.services.upload_service import UploadTooLarge
+
+
+class CountingReader(io.BytesIO):
+    """Records how many bytes the copy pulled from the upload."""
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed = getattr(self, "consumed", 0) + len(data)
+        return data
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_BYTES", 10)
+    monkeypatch.setattr(settings, "BATCH_MAX_FILE_BYTES", 100)
+    monkeypatch.setattr(settings, "BATCH_MAX_BYTES", 300)
+    monkeypatch.setattr(settings, "BATCH_MAX_FILES", 5)
+
+
+def _zip(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _contents(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_lists_pdfs_and_zip_members(limits, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_BYTES", 2000) # Room for the zip headers
+    upload = BatchUpload.from_files([
+        ("a.pdf", io.BytesIO(b"x" * 50)),
+        ("docs.zip", io.BytesIO(_zip({"b.pdf": b"y", "notes.txt": b"z", "c.pdf": b"w" * 500}))),
+        ("x.docx", io.BytesIO(b"ignored")),
+    ])
+    try:
+        entries = {entry.filename: entry for entry in upload.entries}
+        assert set(entries) == {"a.pdf", "docs.zip/b.pdf", "docs.zip/c.pdf", "x.docx"}
+        assert _contents(entries["a.pdf"].checked_path()) == b"x" * 50
+        assert _contents(entries["docs.zip/b.pdf"].extract().path) == b"y"
+        assert entries["docs.zip/c.pdf"].error == "File exceeds BATCH_MAX_FILE_BYTES."
+        assert entries["x.docx"].error is not None
+    finally:
+        upload.cleanup()
+    assert not os.path.exists(upload.directory)
+
+
+def test_oversized_pdf_is_rejected_while_copying(limits):
+    big = CountingReader(b"x" * 10_000)
+    upload = BatchUpload.from_files([("big.pdf", big), ("ok.pdf", io.BytesIO(b"ok"))])
+    try:
+        entries = {entry.filename: entry for entry in upload.entries}
+        assert entries["big.pdf"].error == "File exceeds BATCH_MAX_FILE_BYTES."
+        assert entries["ok.pdf"].error is None
+        # The copy stopped right after the limit instead of reading the whole upload
+        assert big.consumed <= 110
+        assert os.listdir(upload.directory) == [os.path.basename(entries["ok.pdf"].path)]
+    finally:
+        upload.cleanup()
+
+
+def test_batch_total_is_capped(limits, tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    files = [(f"{i}.pdf", io.BytesIO(b"x" * 90)) for i in range(4)]
+    with pytest.raises(UploadTooLarge):
+        BatchUpload.from_files(files)
+    # Nothing is left on disk
+    assert os.listdir(tmp_path) == []
+
+
+def test_too_many_documents(limits):
+    with pytest.raises(ValueError):
+        BatchUpload.from_files([(f"{i}.pdf", io.BytesIO(b"x")) for i in range(6)])
+
+
+def test_zip_members_are_extracted_to_disk_one_at_a_time(limits, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_BYTES", 2000)
+    data = b"%PDF" + b"z" * 60
+    upload = BatchUpload.from_files([("docs.zip", io.BytesIO(_zip({"a.pdf": data})))])
+    try:
+        entry = upload.entries[0]
+        before = set(os.listdir(upload.directory))
+        extracted = entry.extract()
+        assert os.path.dirname(extracted.path) == upload.directory
+        assert _contents(extracted.path) == data
+        assert extracted.doc_hash == hashlib.sha256(data).hexdigest()
+        entry.release()
+        assert set(os.listdir(upload.directory)) == before
+    finally:
+        upload.cleanup()
+
+
+def test_oversized_zip_member_is_not_extracted(limits, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_BYTES", 2000)
+    upload = BatchUpload.from_files([("docs.zip", io.BytesIO(_zip({"a.pdf": b"x" * 50})))])
+    try:
+        # The header claimed a small member; the copy itself is bounded too
+        monkeypatch.setattr(settings, "BATCH_MAX_FILE_BYTES", 20)
+        before = set(os.listdir(upload.directory))
+        with pytest.raises(ValueError):
+            upload.entries[0].extract()
+        assert set(os.listdir(upload.directory)) == before
+    finally:
+        upload.cleanup()
@@ -0,0 +1,90 @@
+import pytest
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    "a": "quarterly revenue grew in the third quarter",
+    "b": "the office moved to berlin",
+    "c": "revenue table for invoice x-42",
+    "d": "shipping and logistics notes",
+}
+
+
+def _index(**kwargs) -> BM25Index:
+    index = BM25Index(**kwargs)
+    index.add_many(list(DOCS), list(DOCS.values()))
+    return index
+
+
+def _scores(index: BM25Index, query: str) -> dict:
+    return dict(index.search(query, limit=100))
+
+
+def test_tokenize_keeps_identifiers():
+    assert tokenize("Invoice X-42, Q3") == ["invoice", "x", "42", "q3"]
+
+
+def test_search_ranks_matching_documents():
+    index = _index()
+    hits = index.search("revenue invoice", limit=10)
+    assert [doc_id for doc_id, _ in hits] == ["c", "a"]
+    assert all(score > 0 for _, score in hits)
+    assert index.search("nothing matches", limit=10) == []
+
+
+def test_allowed_restricts_results():
+    assert [doc_id for doc_id, _ in _index().search("revenue", allowed={"a"})] == ["a"]
+
+
+def test_readding_the_same_id_does_not_change_scores():
+    index = _index()
+    fresh = _scores(index, "revenue")
+    for _ in range(20):
+        index.add("a", DOCS["a"])
+    assert _scores(index, "revenue") == pytest.approx(fresh)
+    assert len(index) == len(DOCS)
+
+
+def test_removed_documents_do_not_count_towards_document_frequency():
+    index = _index()
+    index.add_many(["e", "f", "g"], ["revenue notes", "revenue report", "revenue summary"])
+    index.remove_many(["e", "f", "g"])
+    assert _scores(index, "revenue") == pytest.approx(_scores(_index(), "revenue"))
+    assert all(score > 0 for score in _scores(index, "revenue").values())
+    assert "e" not in _scores(index, "revenue notes")
+
+
+def test_matching_document_outranks_non_matching_one_after_churn():
+    index = _index()
+    for i in range(50):
+        index.add("churn", f"revenue revision {i}")
+    index.remove("churn")
+    scores = _scores(index, "revenue berlin")
+    assert scores["a"] > 0 and scores["b"] > 0
+
+
+def test_remove_unknown_id_is_a_no_op():
+    index = _index()
+    index.remove("missing")
+    assert len(index) == len(DOCS)
+
+
+def test_compaction_drops_tombstones_and_keeps_scores():
+    index = _index(compact_ratio=0.5, compact_min=2)
+    expected = _scores(_index(), "revenue berlin")
+    index.add_many(["x", "y", "z"], ["berlin revenue", "old revenue", "temporary"])
+    index.remove_many(["x", "y", "z"])
+    # 3 of 7 documents dead: not compacted yet
+    assert len(index._doc_keys) == 7
+    index.add("a", DOCS["a"]) # 4 of 8 dead -> compacted
+    assert len(index._doc_keys) == len(DOCS)
+    assert "temporary" not in index._term_ids
+    assert _scores(index, "revenue berlin") == pytest.approx(expected)
+    # Still fully usable after renumbering
+    index.add("e", "berlin revenue")
+    index.remove("b")
+    assert set(_scores(index, "berlin")) == {"e"}
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
@@ -0,0 +1,68 @@
+from app.core.config import settings
+from app.services.cache_service import CacheService, hash_bytes, hash_file
+
+
+def test_get_set_roundtrip(tmp_path):
+    cache = CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+    assert cache.get("missing", "default") == "default"
+    cache.set("key", {"summary": "text", "pages": [1, 2]})
+    assert cache.get("key") == {"summary": "text", "pages": [1, 2]}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=100)
+    cache.set("a", "x" * 40)
+    cache.set("b", "x" * 40)
+    cache.get("a") # b is now the least recently used
+    cache.set("c", "x" * 40)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_oversized_values_are_not_stored(tmp_path):
+    cache = CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+
+
+def test_disabled_cache(tmp_path):
+    cache = CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024, enabled=False)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+def test_keys_are_versioned_per_stage():
+    assert CacheService.document_key("abc") == "analysis:v1:abc"
+    assert CacheService.page_key("abc", 3, "layout").startswith("layout:v")
+    assert CacheService.document_key("abc", "layout") != CacheService.document_key("abc", "ocr")
+
+
+def test_page_entries_need_a_document_hash(tmp_path):
+    cache = CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024)
+    cache.set_page(None, 0, "layout", [1])
+    assert cache.get_page(None, 0, "layout", "none") == "none"
+    cache.set_page("abc", 0, "layout", [1])
+    assert cache.get_page("abc", 0, "layout") == [1]
+
+
+def test_hash_file_matches_hash_bytes(tmp_path):
+    data = b"%PDF-1.7 " * 50000
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(data)
+    assert hash_file(str(path), chunk_bytes=4096) == hash_bytes(data)
+
+
+def test_page_keys_follow_the_settings_their_stage_depends_on(monkeypatch):
+    layout, ocr = CacheService.page_key("abc", 0, "layout"), CacheService.page_key("abc", 0, "ocr")
+    monkeypatch.setattr(settings, "RENDER_DPI", settings.RENDER_DPI * 2)
+    assert CacheService.page_key("abc", 0, "layout") != layout
+    assert CacheService.page_key("abc", 0, "ocr") != ocr
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "OCR_MAX_DPI", settings.OCR_MAX_DPI + 100)
+    assert CacheService.page_key("abc", 0, "layout") == layout
+    assert CacheService.page_key("abc", 0, "ocr") != ocr
+    monkeypatch.setattr(settings, "CV_IMGSZ", 1024)
+    assert CacheService.page_key("abc", 0, "layout") != layout
+    # Stages without settings keep plain keys
+    assert CacheService.page_key("abc", 0, "vision") == "vision:v2:abc:0"
@@ -0,0 +1,60 @@
+from app.rag.chunking import chunk_pages, group_pages, split_text
+
+
+def test_short_and_empty_text():
+    assert split_text("  hello  ", 100) == ["hello"]
+    assert split_text("", 100) == []
+    assert split_text(" \n\n ", 100) == []
+
+
+def test_splits_on_paragraphs_first():
+    text = "one two three\n\nfour five six\n\nseven"
+    pieces = split_text(text, 30)
+    assert pieces == ["one two three\n\nfour five six", "seven"]
+    assert all(len(piece) <= 30 for piece in pieces)
+
+
+def test_oversized_paragraph_falls_back_to_words_and_cuts():
+    text = " ".join(f"word{i}" for i in range(50))
+    pieces = split_text(text, 40)
+    assert all(len(piece) <= 40 for piece in pieces)
+    assert " ".join(pieces).split() == text.split()
+    # No separator to split on: fixed cuts
+    assert split_text("x" * 95, 40) == ["x" * 40, "x" * 40, "x" * 15]
+
+
+def test_edit_only_changes_nearby_pieces():
+    paragraphs = [f"Paragraph {i} " + "text " * 10 for i in range(20)]
+    before = split_text("\n\n".join(paragraphs), 200)
+    paragraphs[15] = paragraphs[15].replace("text", "edit", 1)
+    after = split_text("\n\n".join(paragraphs), 200)
+    assert before[:5] == after[:5]
+    assert before != after
+
+
+def test_chunk_pages_are_page_aware():
+    chunks = chunk_pages(["first page", "", "third " * 10], max_chars=30)
+    assert chunks[0] == ("first page", 1)
+    assert {page for _, page in chunks} == {1, 3}
+    assert all(len(text) <= 30 for text, _ in chunks)
+
+
+def test_group_pages_packs_consecutive_pages():
+    pages = [f"page {i} " + "x" * 40 for i in range(30)]
+    sections = group_pages(pages, max_chars=200)
+    assert sections[0][1] == 1 and sections[-1][2] == 30
+    assert all(len(text) <= 200 for text, _, _ in sections)
+    # Sections are contiguous and cover every page once
+    for (_, _, last), (_, first, _) in zip(sections, sections[1:]):
+        assert first == last + 1
+    assert "\n\n".join(text for text, _, _ in sections) == "\n\n".join(pages)
+
+
+def test_group_pages_edit_is_local():
+    pages = [f"page {i} " + "x" * 40 for i in range(60)]
+    before = group_pages(pages, max_chars=200)
+    pages[45] = "edited " + pages[45]
+    after = group_pages(pages, max_chars=200)
+    # Sections well before the edit are unchanged
+    unchanged = [s for s in before if s[2] < 40]
+    assert unchanged and unchanged == after[:len(unchanged)]
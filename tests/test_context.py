@@ -0,0 +1,74 @@
+from app.rag.context import ContextBuilder, estimate_tokens, split_sentences
+
+
+class Hit:
+    """Stand-in for a qdrant ScoredPoint."""
+    def __init__(self, text: str, score: float, **payload):
+        self.payload = {"text": text, **payload}
+        self.score = score
+
+
+def _builder(**kwargs) -> ContextBuilder:
+    options = dict(max_tokens=1000, window=1, duplicate_threshold=0.8, retrieval_weight=0.3, max_sentence_chars=200)
+    options.update(kwargs)
+    return ContextBuilder(**options)
+
+
+def test_split_sentences():
+    text = "First one.  Second\n one!\n\nA paragraph without a stop\n\nLast?"
+    assert split_sentences(text, 100) == ["First one.", "Second one!", "A paragraph without a stop", "Last?"]
+    assert split_sentences("", 100) == []
+    # Overlong sentences (tables, OCR runs) are cut down
+    assert all(len(s) <= 20 for s in split_sentences("word " * 30, 20))
+
+
+def test_passages_are_labelled_with_citations():
+    hits = [
+        Hit("Revenue grew by ten percent. Costs were flat.", 0.9, filename="a.pdf", type="raw_text", chunk_index=0, page=3),
+        Hit("The board approved the revenue plan.", 0.5, filename="b.pdf", type="summary", chunk_index=1),
+    ]
+    context = _builder().build("revenue", hits)
+    assert context
+    assert context.text.startswith("[1] a.pdf, page 3\n")
+    assert "[2] b.pdf, summary\n" in context.text
+    assert [c["filename"] for c in context.citations] == ["a.pdf", "b.pdf"]
+    assert context.citations[0] == {
+        "id": 1, "filename": "a.pdf", "type": "raw_text", "chunk_index": 0, "page": 3, "score": 0.9
+    }
+    assert context.tokens == sum(
+        estimate_tokens(s) for s in ["Revenue grew by ten percent.", "Costs were flat.", "The board approved the revenue plan."]
+    )
+
+
+def test_duplicate_chunks_are_dropped():
+    text = "The contract ends in March. Renewal needs ninety days notice."
+    hits = [Hit(text, 0.9, filename="v1.pdf"), Hit(text, 0.8, filename="v2.pdf")]
+    context = _builder().build("contract renewal", hits)
+    assert [c["filename"] for c in context.citations] == ["v1.pdf"]
+
+
+def test_summary_repeating_raw_text_adds_nothing():
+    raw = "The warranty covers parts for two years. Labour is covered for one year."
+    summary = "The warranty covers parts for two years. Labour is covered for one year. It excludes water damage."
+    hits = [Hit(raw, 0.9, filename="a.pdf", type="raw_text", page=1), Hit(summary, 0.8, filename="a.pdf", type="summary")]
+    context = _builder(duplicate_threshold=0.9).build("warranty", hits)
+    # Each sentence appears once; the summary contributes only what the raw text lacks
+    assert context.text.count("The warranty covers parts for two years.") == 1
+    assert context.text.count("Labour is covered for one year.") == 1
+    assert "It excludes water damage." in context.text
+
+
+def test_budget_keeps_best_windows():
+    filler = " ".join(f"Filler sentence number {i} about nothing." for i in range(40))
+    hits = [Hit(filler + " The deadline is the fifth of May. " + filler, 0.9, filename="a.pdf")]
+    context = _builder(max_tokens=40).build("deadline", hits)
+    assert "The deadline is the fifth of May." in context.text
+    assert context.tokens <= 40
+    # Only the best windows of the chunk fit
+    assert len(context.text) < len(hits[0].payload["text"])
+
+
+def test_no_hits():
+    context = _builder().build("anything", [])
+    assert not context
+    assert context.text == "" and context.citations == []
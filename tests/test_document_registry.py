@@ -0,0 +1,112 @@
+import asyncio
+from qdrant_client import QdrantClient
+from app.rag.document_registry import DocumentRegistry
+from app.rag.embedding import LocalEmbeddings
+from app.rag.retriever import HybridRetriever
+from app.rag.vector_store import VectorStore
+from app.services.cache_service import CacheService
+from app.services.job_service import Job
+from app.services.pipeline_service import AnalysisPipeline, DocumentRun
+
+
+def _index(registry, retriever, embedder, filename, doc_hash, texts):
+    metadatas = [{"filename": filename, "type": "raw_text", "chunk_index": i, "page": i + 1} for i in range(len(texts))]
+    plan = registry.plan(filename, doc_hash, texts, metadatas)
+    return registry.commit(plan, embedder.embed_documents(plan.new_texts), retriever)
+
+
+def _setup():
+    store = VectorStore(QdrantClient(":memory:"))
+    retriever = HybridRetriever(store)
+    embedder = LocalEmbeddings(store.vector_size)
+    return DocumentRegistry(store), retriever, embedder
+
+
+def test_reindex_keeps_unchanged_chunks_and_drops_stale_ones():
+    registry, retriever, embedder = _setup()
+    assert _index(registry, retriever, embedder, "a.pdf", "h1", ["one", "two", "three"]) == 1
+    assert _index(registry, retriever, embedder, "a.pdf", "h2", ["one", "two", "four"]) == 2
+    points = registry.vector_store.document_points("a.pdf", ["text", "version"])
+    assert sorted(p.payload["text"] for p in points) == ["four", "one", "two"]
+    assert {p.payload["version"] for p in points} == {2}
+    assert len(retriever.bm25) == 3
+
+
+def test_copy_indexes_identical_content_under_a_new_filename():
+    registry, retriever, embedder = _setup()
+    _index(registry, retriever, embedder, "a.pdf", "h1", ["alpha text", "beta text"])
+    assert registry.copy("h1", "b.pdf", retriever) == 1
+    copied = registry.vector_store.document_points("b.pdf", ["text", "doc_hash", "page"])
+    assert sorted(p.payload["text"] for p in copied) == ["alpha text", "beta text"]
+    assert {p.payload["doc_hash"] for p in copied} == {"h1"}
+    # The original stays indexed, and copying again is a no-op
+    assert len(registry.vector_store.document_points("a.pdf", ["text"])) == 2
+    assert registry.copy("h1", "b.pdf", retriever) is None
+    assert len(retriever.bm25) == 4
+
+
+def test_copy_replaces_the_previous_version_of_the_target():
+    registry, retriever, embedder = _setup()
+    _index(registry, retriever, embedder, "a.pdf", "h1", ["alpha text"])
+    _index(registry, retriever, embedder, "b.pdf", "h0", ["old text"])
+    assert registry.copy("h1", "b.pdf", retriever) == 2
+    assert [p.payload["text"] for p in registry.vector_store.document_points("b.pdf", ["text"])] == ["alpha text"]
+
+
+class _Embedder:
+    def __init__(self, dim):
+        self.local = LocalEmbeddings(dim)
+
+    def get_embeddings(self, texts):
+        return self.local.embed_documents(texts)
+
+
+def _run(filename, doc_hash, texts):
+    run = DocumentRun(Job("document", filename), filename, None, doc_hash=doc_hash)
+    run.final_output = {}
+    run.page_texts = texts
+    return run
+
+
+def test_index_updates_of_one_filename_do_not_interleave(tmp_path):
+    store = VectorStore(QdrantClient(":memory:"))
+    retriever = HybridRetriever(store)
+    pipeline = AnalysisPipeline(
+        None, None, None, _Embedder(store.vector_size), store, retriever, None,
+        cache=CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024, enabled=False)
+    )
+    first = _run("a.pdf", "h1", ["one", "two"])
+    second = _run("a.pdf", "h2", ["one", "three"])
+
+    async def scenario():
+        await pipeline.embed(first)
+        # The second plan waits for the first commit instead of planning against the same old state
+        waiting = asyncio.create_task(pipeline.embed(second))
+        await asyncio.sleep(0.05)
+        assert not waiting.done() and second.plan is None
+        await pipeline.upsert(first)
+        await waiting
+        await pipeline.upsert(second)
+
+    asyncio.run(scenario())
+    points = store.document_points("a.pdf", ["text", "version", "doc_hash"])
+    assert sorted(p.payload["text"] for p in points) == ["one", "three"]
+    assert {(p.payload["version"], p.payload["doc_hash"]) for p in points} == {(2, "h2")}
+    assert len(retriever.bm25) == 2
+    assert len(pipeline.index_locks) == 0
+
+
+def test_failed_run_releases_its_index_lock(tmp_path):
+    store = VectorStore(QdrantClient(":memory:"))
+    pipeline = AnalysisPipeline(
+        None, None, None, _Embedder(store.vector_size), store, HybridRetriever(store), None,
+        cache=CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024, enabled=False)
+    )
+    run = _run("a.pdf", "h1", ["one"])
+
+    async def scenario():
+        await pipeline.embed(run)
+        run.close() # e.g. the document failed before reaching upsert
+        await asyncio.wait_for(pipeline.embed(_run("a.pdf", "h2", ["two"])), timeout=1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+import itertools
+import sqlite3
+import pytest
+from app.rag import embedding
+from app.rag.embedding import EmbeddingCache, EmbeddingService
+
+
+def _rows(path) -> list[str]:
+    # What another process would see on disk
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT key FROM embeddings ORDER BY key")]
+
+
+def _vector(value: float) -> list[float]:
+    return [value] * 4 # 16 bytes packed
+
+
+def test_service_embeds_only_cache_misses():
+    service = EmbeddingService(backend="local", cache=EmbeddingCache(max_items=100))
+    calls = []
+    embed = service.embeddings.embed_documents
+    service.embeddings.embed_documents = lambda texts: calls.append(list(texts)) or embed(texts)
+
+    first = service.get_embeddings(["alpha", "beta", "alpha"])
+    assert calls == [["alpha", "beta"]]
+    assert first[0] == first[2]
+    assert service.get_embeddings(["beta", "gamma"])[0] == first[1]
+    assert calls == [["alpha", "beta"], ["gamma"]]
+
+
+def test_disk_writes_are_batched(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_items=100, path=path, flush_items=3, flush_seconds=3600)
+    cache.set_many({"a": _vector(1.0), "b": _vector(2.0)})
+    assert _rows(path) == [] # Buffered, still served
+    assert cache.get_many(["a"]) == {"a": _vector(1.0)}
+    cache.set_many({"c": _vector(3.0)})
+    assert _rows(path) == ["a", "b", "c"]
+    cache.set_many({"d": _vector(4.0)})
+    cache.flush()
+    assert _rows(path) == ["a", "b", "c", "d"]
+
+
+def test_disk_hits_survive_restart_and_memory_eviction(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_items=1, path=path)
+    cache.set_many({"a": _vector(1.0), "b": _vector(2.0)})
+    cache.flush()
+    # "a" fell out of the one-entry memory LRU but is read back from disk
+    assert cache.get_many(["a", "missing"]) == {"a": _vector(1.0)}
+    reopened = EmbeddingCache(max_items=10, path=path)
+    assert reopened.get_many(["a", "b"]) == {"a": _vector(1.0), "b": _vector(2.0)}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct, increasing access times
+    ticks = itertools.count(1)
+    monkeypatch.setattr(embedding.time, "time", lambda: float(next(ticks)))
+
+
+def test_disk_store_evicts_least_recently_used(tmp_path, clock):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_items=100, path=path, max_bytes=48, flush_items=1)
+    cache.set_many({"a": _vector(1.0)})
+    cache.set_many({"b": _vector(2.0)})
+    cache.set_many({"c": _vector(3.0)})
+    # Reading "a" from disk makes it recent again
+    EmbeddingCache(max_items=100, path=path, max_bytes=48, flush_items=1).get_many(["a"])
+    cache = EmbeddingCache(max_items=100, path=path, max_bytes=48, flush_items=1)
+    cache.set_many({"d": _vector(4.0)})
+    assert _rows(path) == ["a", "c", "d"]
+
+
+def test_store_without_access_times_is_upgraded(tmp_path, clock):
+    path = str(tmp_path / "embeddings.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        conn.execute("INSERT INTO embeddings VALUES (?, ?)", ("old", bytes(16)))
+    cache = EmbeddingCache(max_items=10, path=path, max_bytes=16, flush_items=1)
+    assert cache.get_many(["old"]) == {"old": _vector(0.0)}
+    cache.set_many({"new": _vector(1.0)})
+    assert _rows(path) == ["new"]
@@ -0,0 +1,66 @@
+import pytest
+from app.rag.filters import SearchFilter
+
+
+def test_empty_filters_are_none():
+    assert SearchFilter.from_dict(None) is None
+    assert SearchFilter.from_dict({}) is None
+    assert SearchFilter.from_dict({"filename": [], "type": None}) is None
+
+
+@pytest.mark.parametrize("data", [
+    {"author": "x"},
+    {"type": "table"},
+    {"filename": 3},
+    {"filename": [""]},
+    {"page_from": 0},
+    {"page_from": True},
+    {"page_from": "2"},
+    {"page_from": 5, "page_to": 2},
+    {"ingested_after": "yesterday"},
+    {"ingested_after": [1]},
+    ["filename"],
+])
+def test_invalid_filters(data):
+    with pytest.raises(ValueError):
+        SearchFilter.from_dict(data)
+
+
+def test_timestamps_accept_epoch_and_iso():
+    search_filter = SearchFilter.from_dict({
+        "ingested_after": 0,
+        "ingested_before": "1970-01-02T00:00:00Z",
+    })
+    assert search_filter.ingested_after == 0.0
+    assert search_filter.ingested_before == 86400.0
+    # Naive times are UTC
+    assert SearchFilter.from_dict({"ingested_after": "1970-01-02T00:00:00"}).ingested_after == 86400.0
+
+
+def test_matches():
+    search_filter = SearchFilter.from_dict({"filename": "a.pdf", "type": ["raw_text"], "page_from": 2, "page_to": 3})
+    assert search_filter.matches({"filename": "a.pdf", "type": "raw_text", "page": 2})
+    assert not search_filter.matches({"filename": "b.pdf", "type": "raw_text", "page": 2})
+    assert not search_filter.matches({"filename": "a.pdf", "type": "summary", "page": 2})
+    assert not search_filter.matches({"filename": "a.pdf", "type": "raw_text", "page": 4})
+    # Page filters only match page-level chunks
+    assert not search_filter.matches({"filename": "a.pdf", "type": "raw_text"})
+
+
+def test_matches_time_window():
+    search_filter = SearchFilter(ingested_after=10.0, ingested_before=20.0)
+    assert search_filter.matches({"ingested_at": 10})
+    assert search_filter.matches({"ingested_at": 20.0})
+    assert not search_filter.matches({"ingested_at": 21})
+    assert not search_filter.matches({})
+
+
+def test_to_qdrant():
+    search_filter = SearchFilter(filenames=["a.pdf"], page_to=4, ingested_after=5.0)
+    conditions = {condition.key: condition for condition in search_filter.to_qdrant().must}
+    assert set(conditions) == {"filename", "page", "ingested_at"}
+    assert conditions["filename"].match.any == ["a.pdf"]
+    assert (conditions["page"].range.gte, conditions["page"].range.lte) == (None, 4)
+    assert (conditions["ingested_at"].range.gte, conditions["ingested_at"].range.lte) == (5.0, None)
+    assert SearchFilter().is_empty()
+    assert SearchFilter().to_qdrant().must == []
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import fitz
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes
+from app.core.config import settings
+from app.services.job_service import JobManager, JobQueueFull
+
+
+class _Payload:
+    def __init__(self):
+        self.cleaned = False
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def _gated_handler(release: asyncio.Event):
+    async def handler(job, payload):
+        job.start_stage("parse", total=2)
+        job.advance("parse")
+        await release.wait()
+        if payload == "fail":
+            raise RuntimeError("page 2 is unreadable")
+        job.advance("parse")
+        job.finish_stage("parse")
+        return {"filename": job.filename}
+    return handler
+
+
+async def _settle():
+    # Let the worker tasks pick up whatever they can
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_job_moves_from_queued_to_running_to_completed():
+    async def scenario():
+        release = asyncio.Event()
+        manager = JobManager(_gated_handler(release), workers=1)
+        job = manager.submit("ok", "a.pdf")
+        assert job.status == "queued" and job.started_at is None
+        await _settle()
+        assert job.status == "running"
+        assert job.to_dict()["stages"]["parse"] == {"status": "running", "done": 1, "total": 2}
+        assert manager.status_counts()["running"] == 1
+        release.set()
+        await _settle()
+        assert job.status == "completed"
+        assert job.result == {"filename": "a.pdf"}
+        assert job.to_dict(include_result=True)["result"] == {"filename": "a.pdf"}
+        assert job.to_dict()["stages"]["parse"]["status"] == "completed"
+        assert job.created_at <= job.started_at <= job.finished_at
+        assert manager.get(job.id) is job
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_failed_job_reports_its_error():
+    async def scenario():
+        release = asyncio.Event()
+        release.set()
+        manager = JobManager(_gated_handler(release), workers=1)
+        job = manager.submit("fail", "a.pdf")
+        await _settle()
+        assert job.status == "failed"
+        assert job.error == "page 2 is unreadable"
+        assert job.result is None and job.finished_at is not None
+        # The stage that was running when the handler raised is marked failed, not left running
+        assert job.to_dict()["stages"]["parse"]["status"] == "failed"
+        assert manager.status_counts()["failed"] == 1
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_new_jobs():
+    async def scenario():
+        release = asyncio.Event()
+        manager = JobManager(_gated_handler(release), workers=1, max_queue=1)
+        running = manager.submit("ok", "a.pdf")
+        await _settle()
+        queued = manager.submit("ok", "b.pdf")
+        with pytest.raises(JobQueueFull):
+            manager.submit("ok", "c.pdf")
+        assert manager.pending() == 1
+        assert manager.status_counts() == {"queued": 1, "running": 1, "completed": 0, "failed": 0}
+        # Room again once the running job finishes and the queued one starts
+        release.set()
+        await _settle()
+        assert running.status == queued.status == "completed"
+        manager.submit("ok", "c.pdf")
+        await _settle()
+        assert manager.status_counts()["completed"] == 3
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_cleans_up_jobs_that_never_ran():
+    async def scenario():
+        manager = JobManager(_gated_handler(asyncio.Event()), workers=1)
+        manager.submit(_Payload(), "a.pdf")
+        await _settle()
+        payload = _Payload()
+        manager.submit(payload, "b.pdf")
+        await manager.shutdown()
+        assert payload.cleaned
+
+    asyncio.run(scenario())
+
+
+def test_history_forgets_the_oldest_finished_jobs():
+    async def scenario():
+        release = asyncio.Event()
+        release.set()
+        manager = JobManager(_gated_handler(release), workers=1, history=2)
+        first = manager.submit("ok", "a.pdf")
+        await _settle()
+        second = manager.submit("ok", "b.pdf")
+        await _settle()
+        third = manager.submit("ok", "c.pdf")
+        assert manager.get(first.id) is None
+        assert manager.get(second.id) is second and manager.get(third.id) is third
+        await _settle()
+
+        # Jobs still queued or running are kept even past the limit
+        release.clear()
+        jobs = [manager.submit("ok", f"{name}.pdf") for name in "defg"]
+        await _settle()
+        assert all(manager.get(job.id) is job for job in jobs)
+        assert manager.get(second.id) is None and manager.get(third.id) is None
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+class _FullQueue:
+    def submit(self, *args, **kwargs):
+        raise JobQueueFull("Job queue is full (16 pending)")
+
+
+def test_analyze_answers_503_with_retry_after_when_the_queue_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "JOB_RETRY_AFTER_SECONDS", 7)
+    monkeypatch.setattr(routes, "job_manager", _FullQueue())
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api")
+    pdf = fitz.open()
+    pdf.new_page()
+
+    response = TestClient(app).post("/api/analyze", files={"file": ("a.pdf", pdf.tobytes(), "application/pdf")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert response.json()["detail"] == "Job queue is full (16 pending)"
+    # The spooled upload is deleted, not left for a job that will never run
+    assert os.listdir(tmp_path) == []
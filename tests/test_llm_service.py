@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from langchain_core.messages import HumanMessage
+from app.services.llm_service import LLMGateway
+
+
+def test_stub_invoke_roundtrip():
+    gateway = LLMGateway(backend="stub")
+    assert gateway.invoke([HumanMessage(content="hello")]).content.startswith("Stub response")
+
+
+def test_async_waiter_is_woken_on_release():
+    gateway = LLMGateway(backend="stub", max_concurrency=1)
+
+    async def scenario():
+        gateway._acquire("m")
+        waiter = asyncio.create_task(gateway._aacquire("m"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        # Released from another thread, as a sync caller would
+        started = time.perf_counter()
+        threading.Thread(target=gateway._release, args=("m",)).start()
+        await asyncio.wait_for(waiter, timeout=1)
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) < 0.1
+    assert gateway._total_in_flight == 1
+
+
+def test_slots_are_granted_in_arrival_order():
+    gateway = LLMGateway(backend="stub", max_concurrency=1)
+    order = []
+
+    async def scenario():
+        gateway._acquire("m")
+        # Queued first: a thread; then a coroutine
+        thread = threading.Thread(target=lambda: (gateway._acquire("m"), order.append("sync")))
+        thread.start()
+        while not gateway._waiters:
+            await asyncio.sleep(0.01)
+
+        async def async_caller():
+            await gateway._aacquire("m")
+            order.append("async")
+
+        task = asyncio.create_task(async_caller())
+        await asyncio.sleep(0.05)
+        gateway._release("m")
+        await asyncio.to_thread(thread.join)
+        assert order == ["sync"]
+        gateway._release("m")
+        await asyncio.wait_for(task, timeout=1)
+        gateway._release("m")
+
+    asyncio.run(scenario())
+    assert order == ["sync", "async"]
+    assert gateway._total_in_flight == 0
+
+
+def test_capped_model_does_not_block_other_models():
+    gateway = LLMGateway(backend="stub", max_concurrency=4, model_concurrency=1)
+
+    async def scenario():
+        gateway._acquire("a")
+        blocked = asyncio.create_task(gateway._aacquire("a"))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(gateway._aacquire("b"), timeout=1)
+        assert not blocked.done()
+        blocked.cancel()
+
+    asyncio.run(scenario())
+    assert not gateway._waiters
+    assert gateway._in_flight == {"a": 1, "b": 1}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    gateway = LLMGateway(backend="stub", max_concurrency=1)
+
+    async def scenario():
+        gateway._acquire("m")
+        waiter = asyncio.create_task(gateway._aacquire("m"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gateway._release("m")
+
+    asyncio.run(scenario())
+    assert not gateway._waiters
+    assert gateway._total_in_flight == 0
@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+import pytest
+from app.core.config import settings
+from app.services import ocr_service
+from app.services.ocr_service import OCRBackend, OCRPage, OCRService, TesseractBackend
+
+
+def test_pool_size_accounts_for_threads_per_worker(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(settings, "OCR_WORKER_THREADS", 2)
+    assert OCRService(backend="tesseract").workers == 4
+    monkeypatch.setattr(settings, "OCR_WORKER_THREADS", 1)
+    assert OCRService(backend="tesseract").workers == 8
+    assert OCRService(workers=0, backend="tesseract").workers == 0
+
+
+def test_worker_caps_thread_pools(monkeypatch):
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OMP_THREAD_LIMIT"):
+        monkeypatch.setenv(var, "64")
+    monkeypatch.setattr(ocr_service, "_worker_threads", 1)
+    monkeypatch.setattr(ocr_service, "_worker_lang_list", None)
+    ocr_service._init_worker(["en"], [], threads=1)
+    assert os.environ["OMP_NUM_THREADS"] == os.environ["MKL_NUM_THREADS"] == os.environ["OMP_THREAD_LIMIT"] == "1"
+
+
+class _FakeBackend(OCRBackend):
+    """
+    Reads back the (confidence, text height) scripted for each page and DPI.
+    """
+    name = "easyocr"
+
+    def __init__(self, readings: dict):
+        self.readings = readings
+
+    def read(self, image: np.ndarray) -> OCRPage:
+        index, dpi = int(image[0, 0, 0]), int(image[0, 0, 1])
+        confidence, text_height = self.readings[index, dpi]
+        return OCRPage(f"page {index} at {dpi}", confidence, text_height)
+
+
+def test_low_confidence_pages_are_reread_at_a_higher_dpi(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI", True)
+    monkeypatch.setattr(settings, "OCR_MIN_CONFIDENCE", 0.8)
+    monkeypatch.setattr(settings, "OCR_TARGET_TEXT_HEIGHT", 32)
+    monkeypatch.setattr(settings, "OCR_MAX_DPI", 300)
+    service = OCRService(workers=0, backend="easyocr")
+    service._backends["easyocr"] = _FakeBackend({
+        (0, 100): (0.95, 30), # Confident: kept as is
+        (1, 100): (0.5, 16), (1, 200): (0.9, 32), # Text scaled from 16 to 32 px
+        (2, 100): (0.6, 4), (2, 300): (0.4, 12), # 800 DPI wanted, capped; worse, so discarded
+        (3, 100): (0.7, 30), # Text already readable: no retry
+    })
+    renders = []
+
+    def renderer(index):
+        def render(dpi):
+            renders.append((index, dpi))
+            image = np.zeros((1, 1, 3), dtype=np.uint16)
+            image[0, 0] = (index, dpi, 0)
+            return image
+        return render
+
+    progress = []
+    pages = service.read_pages([renderer(i) for i in range(4)], 100, progress=progress.append)
+    assert renders == [(0, 100), (1, 100), (2, 100), (3, 100), (1, 200), (2, 300)]
+    assert [(page.text, page.dpi) for page in pages] == [
+        ("page 0 at 100", 100), ("page 1 at 200", 200), ("page 2 at 100", 100), ("page 3 at 100", 100)
+    ]
+    assert sum(progress) == 4
+
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI", False)
+    renders.clear()
+    pages = service.read_pages([renderer(1)], 100)
+    assert renders == [(1, 100)] and pages[0].dpi == 100
+
+
+def test_backends_must_implement_read():
+    with pytest.raises(TypeError):
+        OCRBackend()
+
+
+def test_missing_pytesseract_fails_with_install_hint(monkeypatch):
+    monkeypatch.setitem(sys.modules, "pytesseract", None)
+    with pytest.raises(RuntimeError, match="pip install pytesseract"):
+        TesseractBackend()
+    with pytest.raises(RuntimeError, match="pytesseract"):
+        OCRService(workers=2, backend="tesseract")._get_pool()
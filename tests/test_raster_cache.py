@@ -0,0 +1,105 @@
+import os
+import threading
+import fitz
+import numpy as np
+from app.services.ingestion_service import IngestionService, RasterCache
+
+
+def _raster(value: int) -> np.ndarray:
+    return np.full((10, 10, 3), value, dtype=np.uint8) # 300 bytes
+
+
+def _spill_files(tmp_path) -> list[str]:
+    return sorted(name for _, _, files in os.walk(tmp_path) for name in files)
+
+
+def test_rasters_within_budget_stay_in_memory(tmp_path):
+    cache = RasterCache(budget_bytes=600, spill_dir=str(tmp_path))
+    cache.put((0, 72), _raster(0))
+    cache.put((1, 72), _raster(1))
+    # Exactly at the budget: nothing is spilled
+    assert not any(isinstance(a, np.memmap) for a in cache._entries.values())
+    assert _spill_files(tmp_path) == []
+    cache.put((2, 72), _raster(2))
+    assert isinstance(cache._entries[(0, 72)], np.memmap)
+    assert cache._resident_bytes == 600
+    assert _spill_files(tmp_path) == ["0-72.raw"]
+    cache.close()
+
+
+def test_least_recently_used_raster_is_spilled(tmp_path):
+    cache = RasterCache(budget_bytes=600, spill_dir=str(tmp_path))
+    renders = []
+
+    def render(value):
+        renders.append(value)
+        return _raster(value)
+
+    cache.get_or_render((0, 72), lambda: render(0))
+    cache.get_or_render((1, 72), lambda: render(1))
+    cache.get_or_render((0, 72), lambda: render(0)) # Hit: page 0 is now the most recent
+    cache.get_or_render((2, 72), lambda: render(2))
+    assert isinstance(cache._entries[(1, 72)], np.memmap)
+    assert not isinstance(cache._entries[(0, 72)], np.memmap)
+
+    # A spilled page is read back from its file, not rendered again
+    spilled = cache.get_or_render((1, 72), lambda: render(1))
+    assert renders == [0, 1, 2]
+    assert isinstance(spilled, np.memmap)
+    np.testing.assert_array_equal(spilled, _raster(1))
+    cache.close()
+
+
+def test_concurrent_requests_render_once(tmp_path):
+    cache = RasterCache(budget_bytes=10_000, spill_dir=str(tmp_path))
+    renders = []
+    started = threading.Barrier(4)
+
+    def render():
+        renders.append(1)
+        return _raster(7)
+
+    def worker():
+        started.wait()
+        cache.get_or_render((0, 72), render)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert renders == [1]
+    cache.close()
+
+
+def test_release_and_close_remove_spill_files(tmp_path):
+    cache = RasterCache(budget_bytes=0, spill_dir=str(tmp_path))
+    cache.put((0, 72), _raster(0))
+    cache.put((0, 300), _raster(1))
+    cache.put((1, 72), _raster(2))
+    assert _spill_files(tmp_path) == ["0-300.raw", "0-72.raw", "1-72.raw"]
+    cache.release(dpi=300)
+    assert _spill_files(tmp_path) == ["0-72.raw", "1-72.raw"]
+    assert (0, 300) not in cache._entries
+    cache.close()
+    assert os.listdir(tmp_path) == []
+    assert cache._entries == {} and cache._resident_bytes == 0
+    # Usable again after close: a new spill dir is created on demand
+    cache.put((3, 72), _raster(3))
+    np.testing.assert_array_equal(cache._entries[(3, 72)], _raster(3))
+    cache.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_document_close_cleans_up_its_spill_dir(tmp_path):
+    pdf = fitz.open()
+    for _ in range(3):
+        pdf.new_page(width=100, height=100)
+    data = pdf.tobytes()
+    document = IngestionService().open_document(data, raster_budget=1)
+    document.raster_cache.spill_dir = str(tmp_path)
+    rasters = [page.render(dpi=72, cache=True) for page in document]
+    assert len(_spill_files(tmp_path)) == 3
+    np.testing.assert_array_equal(document[0].render(dpi=72, cache=True), rasters[0])
+    document.close()
+    assert os.listdir(tmp_path) == []
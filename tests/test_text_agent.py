@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from app.agents import text_agent
+from app.agents.text_agent import MAP_PROMPT, REDUCE_PROMPT, SYSTEM_PROMPT, TextAgent
+from app.core.config import settings
+from app.services.cache_service import CacheService
+
+
+class _CountingModel:
+    """
+    Wraps the stub model behind the gateway and records the system prompt of every call.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.prompts = []
+
+    def invoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return self.model.invoke(messages)
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return await self.model.ainvoke(messages)
+
+    def count(self, prompt: str) -> int:
+        return self.prompts.count(prompt)
+
+
+def _pages(count: int, edited: int = -1) -> list[str]:
+    # About 400 characters per page, so no two pages fit one 500-character section
+    return [
+        " ".join(f"page{page}{'x' if page == edited else 'w'}ord{i}" for i in range(32))
+        for page in range(count)
+    ]
+
+
+def _state(pages: list[str]) -> dict:
+    return {"ocr_text": "\n\n".join(pages), "page_texts": pages}
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEXT_MAP_REDUCE", True)
+    monkeypatch.setattr(settings, "TEXT_SINGLE_PASS_CHARS", 1000)
+    monkeypatch.setattr(settings, "TEXT_SECTION_CHARS", 500)
+    monkeypatch.setattr(settings, "TEXT_REDUCE_MAX_CHARS", 400)
+    monkeypatch.setattr(text_agent, "analysis_cache", CacheService(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024))
+    agent = TextAgent()
+    agent.llm = _CountingModel(agent.llm)
+    return agent
+
+
+def test_short_document_is_summarized_in_one_call(agent):
+    result = agent.process_text(_state(_pages(2)))
+    assert result["text_insights"].startswith("Stub response")
+    assert agent.llm.prompts == [SYSTEM_PROMPT]
+
+
+def test_long_document_is_map_reduced_in_bounded_calls(agent):
+    result = agent.process_text(_state(_pages(12)))
+    assert result["text_insights"].startswith("Stub response")
+    maps, reduces = agent.llm.count(MAP_PROMPT), agent.llm.count(REDUCE_PROMPT)
+    assert maps == 12
+    # Small reduce inputs force more than one level, but each level at least halves the summaries
+    assert 1 < reduces <= maps - 1
+    assert agent.llm.count(SYSTEM_PROMPT) == 0
+
+
+def test_one_reduce_call_when_summaries_fit(agent, monkeypatch):
+    monkeypatch.setattr(settings, "TEXT_REDUCE_MAX_CHARS", 100_000)
+    agent.process_text(_state(_pages(12)))
+    assert agent.llm.count(MAP_PROMPT) == 12
+    assert agent.llm.count(REDUCE_PROMPT) == 1
+
+
+def test_section_summaries_are_cached(agent):
+    first = agent.process_text(_state(_pages(12)))
+    agent.llm.prompts.clear()
+    assert agent.process_text(_state(_pages(12))) == first
+    assert agent.llm.prompts == []
+    # Only the edited page's section is summarized again
+    agent.process_text(_state(_pages(12, edited=5)))
+    assert agent.llm.count(MAP_PROMPT) == 1
+
+
+def test_async_map_reduce_shares_the_cache(agent):
+    pages = _pages(12)
+    result = asyncio.run(agent.aprocess_text(_state(pages)))
+    maps, reduces = agent.llm.count(MAP_PROMPT), agent.llm.count(REDUCE_PROMPT)
+    assert maps == 12 and 1 < reduces <= maps - 1
+    agent.llm.prompts.clear()
+    assert agent.process_text(_state(pages)) == result
+    assert agent.llm.prompts == []
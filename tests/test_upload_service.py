@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import os
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app.api.middleware import UploadSizeLimitMiddleware
+from app.core.config import settings
+from app.services.batch_service import BatchUpload
+from app.services.upload_service import MultipartReceiver, UploadTooLarge, receive_pdf
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def _body(*parts: tuple[str, str, bytes]) -> bytes:
+    body = b""
+    for field, filename, data in parts:
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+class Stream:
+    """The body in small chunks, as a chunked request would arrive; records how much was consumed."""
+    def __init__(self, body: bytes, chunk: int = 16):
+        self.body = body
+        self.chunk = chunk
+        self.consumed = 0
+
+    async def __aiter__(self):
+        for start in range(0, len(self.body), self.chunk):
+            data = self.body[start:start + self.chunk]
+            self.consumed += len(data)
+            yield data
+
+
+@pytest.fixture
+def limits(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 100)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BATCH_MAX_FILE_BYTES", 100)
+    monkeypatch.setattr(settings, "BATCH_MAX_BYTES", 300)
+    monkeypatch.setattr(settings, "BATCH_MAX_FILES", 5)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+
+def test_pdf_is_streamed_to_disk_and_hashed(tmp_path):
+    data = b"%PDF-1.4 " + bytes(range(256)) * 4
+    receiver = MultipartReceiver("file", 10_000, lambda name: 2000, max_files=1, directory=str(tmp_path))
+    uploads = asyncio.run(receiver.receive(CONTENT_TYPE, Stream(_body(("file", "a.pdf", data)))))
+    assert [u.filename for u in uploads] == ["a.pdf"]
+    with open(uploads[0].path, "rb") as f:
+        assert f.read() == data
+    assert uploads[0].size == len(data)
+    assert uploads[0].doc_hash == hashlib.sha256(data).hexdigest()
+    uploads[0].cleanup()
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_body_is_cut_off_while_streaming(limits, tmp_path):
+    # Well past the body limit (UPLOAD_MAX_BYTES plus the framing allowance)
+    stream = Stream(_body(("file", "big.pdf", b"x" * 1_000_000)), chunk=1024)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_pdf(CONTENT_TYPE, stream))
+    assert stream.consumed < 100 * 1024
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_pdf_is_rejected(limits, tmp_path):
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_pdf(CONTENT_TYPE, Stream(_body(("file", "big.pdf", b"x" * 500)))))
+    assert os.listdir(tmp_path) == []
+
+
+def test_receive_pdf_rejects_other_files(limits, tmp_path):
+    with pytest.raises(ValueError, match="Only PDF"):
+        asyncio.run(receive_pdf(CONTENT_TYPE, Stream(_body(("file", "a.docx", b"x")))))
+    with pytest.raises(ValueError, match="No file"):
+        asyncio.run(receive_pdf(CONTENT_TYPE, Stream(_body(("other", "a.pdf", b"x")))))
+    with pytest.raises(ValueError):
+        asyncio.run(receive_pdf("application/json", Stream(b"{}")))
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncated_body_leaves_nothing_behind(limits, tmp_path):
+    body = _body(("file", "a.pdf", b"x" * 50))
+    with pytest.raises(ValueError):
+        asyncio.run(receive_pdf(CONTENT_TYPE, Stream(body[:-40])))
+    assert os.listdir(tmp_path) == []
+
+
+def test_batch_receive(limits):
+    body = _body(("files", "a.pdf", b"a" * 10), ("files", "big.pdf", b"b" * 150), ("files", "x.txt", b"c"))
+    upload = asyncio.run(BatchUpload.receive(CONTENT_TYPE, Stream(body)))
+    try:
+        entries = {entry.filename: entry for entry in upload.entries}
+        assert os.path.getsize(entries["a.pdf"].checked_path()) == 10
+        assert entries["big.pdf"].error == "File exceeds BATCH_MAX_FILE_BYTES."
+        assert entries["x.txt"].error == "Only PDF and zip files are supported."
+    finally:
+        upload.cleanup()
+
+
+def test_batch_receive_total_is_capped(limits, tmp_path):
+    body = _body(("files", "big.zip", b"x" * 100_000))
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(BatchUpload.receive(CONTENT_TYPE, Stream(body, chunk=1024)))
+    assert os.listdir(tmp_path) == []
+
+
+def test_middleware_limits_each_route():
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/one", ok, methods=["POST"]), Route("/many", ok, methods=["POST"])])
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/one": ("ONE", 10), "/many": ("MANY", 100_000)})
+    client = TestClient(app)
+    body = b"x" * 80_000 # Over /one's limit plus the framing allowance, under /many's
+    assert client.post("/one", content=body).status_code == 413
+    assert "ONE" in client.post("/one", content=body).json()["detail"]
+    assert client.post("/many", content=body).status_code == 200
+    assert client.post("/many", content=b"x" * 200_000).status_code == 413